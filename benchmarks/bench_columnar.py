@@ -0,0 +1,156 @@
+"""Benchmark of the columnar report against the dict report.
+
+Builds a synthetic report (the cells of the example report format) for each size, changes a fraction of the runs
+and measures:
+
+    build       convert the new report to a columnar report (ColumnarReport.from_report), columnar only
+    diff        compare the previous and the new report (engine.diff)
+    format_out  convert the changes to Notion properties (NotionFormatter)
+
+for the dict report and the columnar report. With --memory, the size of both reports is measured with tracemalloc
+(slower). The reports are generated in memory rather than through the stand-ins, which do not scale to a million
+runs. Results are written as JSON:
+
+    python benchmarks/bench_columnar.py --runs 10000 100000 1000000 --output columnar.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mlsync.consumers.notion.notion_formatter import NotionFormatter
+from mlsync.engine.columnar import ColumnarReport, require_numpy
+from mlsync.engine.diff import diff
+
+STATUSES = ["RUNNING", "FINISHED", "FAILED", "KILLED"]
+
+
+def generate_report(runs, experiments, seed=0):
+    """Synthetic report with the cells of the example report format."""
+    rng = random.Random(seed)
+    report = {}
+    for experiment_idx in range(experiments):
+        experiment_name = f"Experiment {experiment_idx}"
+        experiment_runs = {}
+        for run_idx in range(runs // experiments):
+            run_id = f"{experiment_idx:04d}{run_idx:028x}"
+            experiment_runs[run_id] = {
+                "Name": {"alias": "Name", "type": "str", "tag": "tags", "key": "mlflow.runName", "value": f"run-{run_idx}"},
+                "Status": {
+                    "alias": "Status",
+                    "type": "select",
+                    "options": STATUSES,
+                    "tag": "info",
+                    "key": "status",
+                    "value": rng.choice(STATUSES),
+                },
+                "Accuracy": {"alias": "Accuracy", "type": "float", "tag": "metrics", "key": "accuracy", "value": rng.random(), "data": None},
+                "Test Loss": {"alias": "Test Loss", "type": "float", "tag": "metrics", "key": "test_loss", "value": rng.random(), "data": None},
+                "Batch Size": {"alias": "Batch Size", "type": "integer", "tag": "params", "key": "batch_size", "value": rng.choice([32, 64, 128]), "data": None},
+                "Learning Rate": {"alias": "Learning Rate", "type": "float", "tag": "params", "key": "lr", "value": rng.choice([0.1, 0.01, 0.001]), "data": None},
+                "uid": {"alias": "id", "type": "string", "tag": "info", "key": "id", "value": run_id, "data": None},
+            }
+        report[experiment_name] = {"name": experiment_name, "id": str(experiment_idx), "runs": experiment_runs}
+    return report
+
+
+def churn(report, fraction, seed=1):
+    """Copy of the report where a fraction of the runs changed their metrics, a few were added and deleted."""
+    rng = random.Random(seed)
+    new_report = {}
+    for experiment_name, experiment in report.items():
+        runs = dict(experiment["runs"])
+        for run_id in rng.sample(list(runs), int(len(runs) * fraction)):
+            run = dict(runs[run_id])
+            run["Accuracy"] = {**run["Accuracy"], "value": rng.random()}
+            runs[run_id] = run
+        for run_id in rng.sample(list(runs), int(len(runs) * fraction / 10)):
+            del runs[run_id]
+        for run_idx in range(int(len(experiment["runs"]) * fraction / 10)):
+            run_id = f"new{run_idx:029x}"
+            runs[run_id] = {**next(iter(experiment["runs"].values())), "uid": {"alias": "id", "type": "string", "value": run_id}}
+        new_report[experiment_name] = {**experiment, "runs": runs}
+    return new_report
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def report_sizes(runs, experiments):
+    """Megabytes allocated by the dict report and by its columnar report."""
+    tracemalloc.start()
+    report = generate_report(runs, experiments)
+    dict_size = tracemalloc.get_traced_memory()[0]
+    columnar_report = ColumnarReport.from_report(report)
+    columnar_size = tracemalloc.get_traced_memory()[0] - dict_size
+    tracemalloc.stop()
+    return {"dict": dict_size / 1e6, "columnar": columnar_size / 1e6}
+
+
+def run_case(runs, churn_rate, experiments):
+    """Run one case.
+
+    Returns:
+        dict: Seconds spent in each stage, for the dict and the columnar report.
+    """
+    report_old = generate_report(runs, experiments)
+    report_new = churn(report_old, churn_rate)
+
+    seconds = {"dict": {}, "columnar": {}}
+    diff_report, seconds["dict"]["diff"] = timed(diff, report_old, report_new)
+    _, seconds["dict"]["format_out"] = timed(NotionFormatter(None, {}).format_out, report_new, diff_report=diff_report)
+
+    columnar_old = ColumnarReport.from_report(report_old)
+    # The old report is the new report of the previous tick, its runs were sorted by the previous diff
+    for table in columnar_old.values():
+        table.order
+    columnar_new, seconds["columnar"]["build"] = timed(ColumnarReport.from_report, report_new)
+    columnar_diff_report, seconds["columnar"]["diff"] = timed(diff, columnar_old, columnar_new)
+    _, seconds["columnar"]["format_out"] = timed(
+        NotionFormatter(None, {}).format_out, columnar_new, diff_report=columnar_diff_report
+    )
+    assert columnar_diff_report == diff_report, "The columnar diff does not match the dict diff"
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the columnar report against the dict report.")
+    parser.add_argument("--runs", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="Report sizes in runs")
+    parser.add_argument("--churn", type=float, default=0.01, help="Fraction of the runs changing (default: 0.01)")
+    parser.add_argument("--experiments", type=int, default=2, help="Number of experiments (default: 2)")
+    parser.add_argument("--memory", action="store_true", help="Also measure the size of the reports")
+    parser.add_argument("--output", type=str, help="Write the results to this JSON file")
+    args = parser.parse_args()
+    require_numpy()
+
+    results = {"python": platform.python_version(), "platform": platform.platform(), "cases": []}
+    for runs in args.runs:
+        seconds = run_case(runs, args.churn, args.experiments)
+        case = {"runs": runs, "churn": args.churn, "seconds": seconds}
+        print(
+            f"runs={runs},churn={args.churn}: "
+            f"dict diff {seconds['dict']['diff'] * 1000:.1f}ms format_out {seconds['dict']['format_out'] * 1000:.1f}ms | "
+            f"columnar build {seconds['columnar']['build'] * 1000:.1f}ms diff {seconds['columnar']['diff'] * 1000:.1f}ms "
+            f"format_out {seconds['columnar']['format_out'] * 1000:.1f}ms"
+        )
+        if args.memory:
+            case["megabytes"] = report_sizes(runs, args.experiments)
+            print(f"runs={runs}: dict {case['megabytes']['dict']:.0f}MB | columnar {case['megabytes']['columnar']:.0f}MB")
+        results["cases"].append(case)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
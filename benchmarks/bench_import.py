@@ -0,0 +1,75 @@
+"""Import-time benchmark of the mlsync command line.
+
+Measures, with `python -X importtime`, the cumulative import time of mlsync.command_line and the wall time of
+`mlsync --help` over a bare interpreter start, and fails if they exceed the targets:
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --target-ms 50 --top 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def importtime(statement):
+    """Run a statement with -X importtime.
+
+    Returns:
+        list: (cumulative us, self us, module) of each imported module.
+    """
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement], env=env, capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        modules.append((int(cumulative_us), int(self_us), module.strip()))
+    return modules
+
+
+def wall_time(args, repeat):
+    """Fastest wall time in seconds of a python invocation."""
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, env=env, capture_output=True, check=True)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the mlsync command line.")
+    parser.add_argument("--target-ms", type=float, default=50, help="Target for `mlsync --help` over a bare start")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions, the fastest is kept")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest imports to show")
+    args = parser.parse_args()
+
+    # Leave out the modules imported by the interpreter start (site, .pth files)
+    startup = {module for _, _, module in importtime("pass")}
+    modules = [entry for entry in importtime("import mlsync.command_line") if entry[2] not in startup]
+    command_line_us = next(cumulative for cumulative, _, module in modules if module == "mlsync.command_line")
+    print(f"import mlsync.command_line: {command_line_us / 1000:.1f}ms cumulative")
+    for cumulative, _, module in sorted(modules, reverse=True)[: args.top]:
+        print(f"    {cumulative / 1000:8.1f}ms  {module}")
+
+    bare = wall_time(["-c", "pass"], args.repeat)
+    help_time = wall_time(["-m", "mlsync.command_line", "--help"], args.repeat)
+    overhead_ms = (help_time - bare) * 1000
+    print(f"mlsync --help: {help_time * 1000:.1f}ms ({overhead_ms:.1f}ms over a bare interpreter start)")
+
+    if overhead_ms > args.target_ms:
+        print(f"FAILED: mlsync --help takes {overhead_ms:.1f}ms over the target of {args.target_ms:.0f}ms")
+        sys.exit(1)
+    print(f"OK: within the target of {args.target_ms:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Benchmark of the pull -> diff -> push pipeline against the local MLFlow and Notion stand-ins.
+
+Measures the duration and throughput of each stage of a sync tick:
+
+    pull        fetch experiments and runs from the MLFlow stand-in (MLFlowAPI)
+    format_in   convert the MLFlow runs to the mlsync report (MLFlowFormatter, includes metric histories)
+    diff        compare the previous and the new report (engine.diff)
+    format_out  convert the changes to Notion properties (NotionFormatter)
+    push        apply the changes to the Notion stand-in (NotionSync)
+
+over a matrix of report sizes, churn rates (fraction of runs changing between two ticks) and metric history
+lengths. Results are written as JSON and can be compared against a stored baseline:
+
+    python benchmarks/bench_sync.py --matrix quick --output results.json
+    python benchmarks/bench_sync.py --matrix quick --baseline results.json --threshold 0.2
+"""
+import argparse
+import copy
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mlsync.consumers.notion.notion_formatter import NotionFormatter
+from mlsync.consumers.notion.notion_server import NotionServer
+from mlsync.consumers.notion.notion_sync import NotionSync
+from mlsync.engine.diff import diff
+from mlsync.producers.mlflow.mlflow_server import MLFlowServer
+from mlsync.producers.mlflow.mlflow_sync import MLFlowSync
+from mlsync.utils.utils import yaml_loader
+
+FORMAT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../examples/mlflow-notion/format.yaml")
+
+# Matrix presets: runs (total), churn rates, history lengths
+MATRICES = {
+    "quick": {"runs": [10, 100, 1000], "churn": [0.0, 0.1], "history": [0, 10]},
+    "full": {"runs": [10, 100, 1000, 10000, 100000], "churn": [0.0, 0.01, 0.1, 1.0], "history": [0, 100, 1000]},
+}
+STAGES = ["pull", "format_in", "diff", "format_out", "push"]
+# Cases with more metric points than this are skipped, they would not fit in the stand-in's memory
+MAX_POINTS = 5_000_000
+
+
+def seed_notion(notion_server, notion_sync, report):
+    """Create the databases and pages of a report directly in the Notion stand-in, bypassing HTTP."""
+    notion_report = notion_sync.notion_formatter.format_out(report)
+    for experiment_name, experiment in notion_report.items():
+        database = notion_server.create_database(
+            {
+                "parent": {"page_id": notion_sync.root_page_id},
+                "title": [{"text": {"content": experiment_name}}],
+                "properties": experiment["properties"],
+            }
+        )
+        notion_sync.notion_state[experiment_name] = {"database_id": database["id"], "pages": {}}
+        for run_uid, row in experiment["rows"].items():
+            page = notion_server.create_page({"parent": {"database_id": database["id"]}, "properties": row})
+            notion_sync.notion_state[experiment_name]["pages"][run_uid] = {"page_id": page["id"]}
+
+
+def churn(mlflow_server, fraction, metric_keys):
+    """Change a fraction of the runs: append a point to their metrics, and finish them if they are running.
+
+    Runs generated without history have no metric points, they get a first point for each of the metric keys, so
+    that the values of every changed run change.
+    """
+    run_ids = list(mlflow_server.runs)
+    for run_id in mlflow_server.random.sample(run_ids, int(round(len(run_ids) * fraction))):
+        run = mlflow_server.runs[run_id]
+        if run["info"]["status"] == "RUNNING":
+            mlflow_server.set_status(run_id, "FINISHED")
+        metrics = list(run["data"]["metrics"]) or [{"key": key, "step": -1} for key in metric_keys]
+        for metric in metrics:
+            mlflow_server.log_metric(run_id, metric["key"], mlflow_server.random.random(), step=metric["step"] + 1)
+
+
+def run_case(report_format, runs, churn_rate, history, experiments, metrics):
+    """Run one case of the matrix.
+
+    Returns:
+        dict: Seconds spent in each stage.
+    """
+    with MLFlowServer() as mlflow_server, NotionServer(requests_per_second=None) as notion_server:
+        mlflow_server.generate(
+            experiments=experiments,
+            runs=max(runs // experiments, 1),
+            metrics=metrics,
+            history=history,
+            running_fraction=0.2,
+        )
+        mlflow_sync = MLFlowSync(f"{mlflow_server.url}/api", copy.deepcopy(report_format))
+        notion_sync = NotionSync(
+            "secret", notion_server.add_page(), report_format, requests_per_second=None, base_url=notion_server.url
+        )
+
+        # Previous tick, already synced
+        report_old = mlflow_sync.pull(detailed_metrics=bool(history))
+        seed_notion(notion_server, notion_sync, report_old)
+        # Metrics of the report format, the first ones are generated with the history
+        metric_keys = [key for key, element in report_format["elements"].items() if element["tag"] == "metrics"]
+        churn(mlflow_server, churn_rate, metric_keys[:metrics])
+
+        timings = {}
+        # pull
+        start = time.perf_counter()
+        mlflow_api = mlflow_sync.mlflow_api
+        mlflow_experiments = mlflow_api.getExperiments()
+        mlflow_runs = {
+            experiment["experiment_id"]: mlflow_api.getExperimentRuns(experiment["experiment_id"])
+            for experiment in mlflow_experiments
+        }
+        timings["pull"] = time.perf_counter() - start
+        # format_in
+        start = time.perf_counter()
+        report_new = mlflow_sync.mlflow_formatter.format_in(mlflow_experiments, mlflow_runs, bool(history))
+        timings["format_in"] = time.perf_counter() - start
+        # diff
+        start = time.perf_counter()
+        diff_report = diff(report_old, report_new)
+        timings["diff"] = time.perf_counter() - start
+        # format_out
+        start = time.perf_counter()
+        notion_sync.notion_formatter.format_out(report_new, diff_report=diff_report)
+        timings["format_out"] = time.perf_counter() - start
+        # push
+        start = time.perf_counter()
+        for command in ("create", "update", "delete"):
+            notion_sync.push(report_new, command=command, diff_report=diff_report)
+        timings["push"] = time.perf_counter() - start
+        return timings
+
+
+def compare(results, baseline, threshold):
+    """Compare results against a baseline.
+
+    Returns:
+        list: Regressions as (case, stage, baseline seconds, seconds).
+    """
+    baseline_cases = {case["case"]: case for case in baseline["cases"]}
+    regressions = []
+    for case in results["cases"]:
+        if case["case"] not in baseline_cases:
+            continue
+        for stage in STAGES:
+            old, new = baseline_cases[case["case"]]["seconds"][stage], case["seconds"][stage]
+            # Ignore noise on stages that take no time
+            if new > old * (1 + threshold) and new - old > 1e-3:
+                regressions.append((case["case"], stage, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the mlsync pipeline against local stand-ins.")
+    parser.add_argument("--matrix", choices=list(MATRICES), default="quick", help="Matrix preset (default: quick)")
+    parser.add_argument("--runs", type=int, nargs="+", help="Report sizes in runs (overrides the preset)")
+    parser.add_argument("--churn", type=float, nargs="+", help="Churn rates (overrides the preset)")
+    parser.add_argument("--history", type=int, nargs="+", help="Metric history lengths (overrides the preset)")
+    parser.add_argument("--experiments", type=int, default=2, help="Number of experiments (default: 2)")
+    parser.add_argument("--metrics", type=int, default=3, help="Number of metrics per run (default: 3)")
+    parser.add_argument("--repeat", type=int, default=1, help="Repetitions per case, the fastest is kept")
+    parser.add_argument("--output", type=str, help="Write the results to this JSON file")
+    parser.add_argument("--baseline", type=str, help="Compare against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    matrix = MATRICES[args.matrix]
+    report_format = yaml_loader(FORMAT_PATH)
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    results = {"python": platform.python_version(), "platform": platform.platform(), "commit": commit, "cases": []}
+
+    for runs, churn_rate, history in itertools.product(
+        args.runs or matrix["runs"], args.churn or matrix["churn"], args.history or matrix["history"]
+    ):
+        case = f"runs={runs},churn={churn_rate},history={history}"
+        if runs * args.metrics * history > MAX_POINTS:
+            print(f"{case}: skipped (more than {MAX_POINTS} metric points)")
+            continue
+        timings = [
+            run_case(report_format, runs, churn_rate, history, min(args.experiments, runs), args.metrics)
+            for _ in range(args.repeat)
+        ]
+        seconds = {stage: min(timing[stage] for timing in timings) for stage in STAGES}
+        results["cases"].append(
+            {
+                "case": case,
+                "runs": runs,
+                "churn": churn_rate,
+                "history": history,
+                "seconds": seconds,
+                "runs_per_second": {stage: runs / max(seconds[stage], 1e-9) for stage in STAGES},
+            }
+        )
+        print(f"{case}: " + ", ".join(f"{stage} {seconds[stage] * 1000:.1f}ms" for stage in STAGES))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for case, stage, old, new in regressions:
+            print(f"REGRESSION {case} {stage}: {old * 1000:.1f}ms -> {new * 1000:.1f}ms")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression above {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ import torch.optim as optim
 from torchvision import datasets, transforms
 from torch.optim.lr_scheduler import StepLR
 import mlflow
+from mlsync.callbacks import notify_active_run
 
 
 class Net(nn.Module):
@@ -153,6 +154,8 @@ def main():
             mlflow.log_metric("train_loss", train_loss)
             mlflow.log_metric("test_loss", test_loss)
             mlflow.log_metric("accuracy", accuracy)
+            # Tell mlsync to sync the run now (if MLSYNC_INGEST_URL is set)
+            notify_active_run()
             scheduler.step()
 
         # log the final accuracy
@@ -16,6 +16,7 @@ from argparse import ArgumentParser
 from pytorch_lightning.callbacks.early_stopping import EarlyStopping
 from pytorch_lightning.callbacks import ModelCheckpoint
 from pytorch_lightning.callbacks import LearningRateMonitor
+from mlsync.callbacks import MLSyncCallback
 from torch.nn import functional as F
 from torch.utils.data import DataLoader, random_split
 from torchvision import datasets, transforms
@@ -285,7 +286,7 @@ if __name__ == "__main__":
     lr_logger = LearningRateMonitor()
 
     trainer = pl.Trainer.from_argparse_args(
-        args, callbacks=[lr_logger, early_stopping, checkpoint_callback], checkpoint_callback=True
+        args, callbacks=[lr_logger, early_stopping, checkpoint_callback, MLSyncCallback()], checkpoint_callback=True
     )
     trainer.fit(model, dm)
     trainer.test(datamodule=dm)
\ No newline at end of file
@@ -0,0 +1,70 @@
+"""Callbacks notifying the mlsync ingest endpoint from training code.
+
+Set MLSYNC_INGEST_URL to the ingest URL of the sync engine (see `mlsync --ingest-port` / `--ingest-socket`), then:
+
+    # MLflow: after logging
+    mlflow.log_metric("accuracy", accuracy)
+    notify_active_run()
+
+    # PyTorch Lightning
+    trainer = pl.Trainer(callbacks=[MLSyncCallback()])
+"""
+from mlsync.engine.ingest import notify
+
+# PyTorch Lightning is optional, the callback is only usable when it is installed
+try:
+    from pytorch_lightning import Callback
+except ImportError:
+    try:
+        from lightning.pytorch import Callback
+    except ImportError:
+        Callback = object
+
+
+def notify_active_run(url=None):
+    """Notify the sync engine that the active MLflow run changed.
+
+    Args:
+        url (str): URL of the ingest server (default: $MLSYNC_INGEST_URL)
+
+    Returns:
+        bool: True if the hint was delivered.
+    """
+    import mlflow
+
+    run = mlflow.active_run()
+    if run is None:
+        return False
+    return notify(run.info.run_id, run.info.experiment_id, url=url)
+
+
+class MLSyncCallback(Callback):
+    """PyTorch Lightning callback notifying the sync engine at the end of each epoch and of the training.
+
+    The run is taken from the MLFlowLogger of the trainer, or the active MLflow run (e.g. with autolog).
+
+    Args:
+        url (str): URL of the ingest server (default: $MLSYNC_INGEST_URL)
+    """
+
+    def __init__(self, url=None):
+        if Callback is object:
+            raise ImportError("MLSyncCallback requires pytorch-lightning (pip install pytorch-lightning)")
+        super().__init__()
+        self.url = url
+
+    def notify(self, trainer):
+        """Notify the sync engine about the run of the trainer."""
+        for logger in getattr(trainer, "loggers", None) or [trainer.logger]:
+            if type(logger).__name__ == "MLFlowLogger":
+                return notify(logger.run_id, logger.experiment_id, url=self.url)
+        return notify_active_run(url=self.url)
+
+    def on_train_epoch_end(self, trainer, pl_module):
+        self.notify(trainer)
+
+    def on_validation_end(self, trainer, pl_module):
+        self.notify(trainer)
+
+    def on_fit_end(self, trainer, pl_module):
+        self.notify(trainer)
@@ -1,15 +1,16 @@
 import argparse
-from dotenv import load_dotenv, find_dotenv
 import os
-from mlsync.engine.sync import Sync
-from mlsync.utils.utils import yaml_loader, yaml_dumper
-from notion_client.helpers import get_id
+
+# NOTE: Only light modules are imported at the top, so that `mlsync --help` starts fast. The engine, producers and
+# consumers (and their dependencies) are imported once the arguments are parsed.
 
 
 def main():
     """Main function for command line interface.
 
     Args:
+        {sync,backfill}       Command to run (default: sync). backfill creates all the runs in the consumer
+                                concurrently with resumable checkpoints, then continues with sync.
         -c CONFIG, --config CONFIG
                                 Configuration file. See Documentation for more details.
         -p PRODUCER, --producer PRODUCER
@@ -23,18 +24,53 @@ def main():
                                 Path to report format yaml file
         --mlflow-uri MLFLOW_URI
                                 MLFlow URI during the run
+        --mlruns-dir MLRUNS_DIR
+                                Local mlruns/ directory of the MLFlow server, watched for changes instead of polling
+        --history-store HISTORY_STORE
+                                Directory of the local store of the metric histories, kept across restarts
+        --format-workers FORMAT_WORKERS
+                                Worker processes formatting the runs of large pulls (default: number of CPUs, 0 to
+                                disable)
         --notion-token NOTION_TOKEN
                                 Notion token
         --notion-page-id NOTION_PAGE_ID
                                 Notion page ID
+        --workers WORKERS     Number of concurrent requests during backfill (default: 4)
+        --checkpoint CHECKPOINT
+                                Path to the backfill checkpoint file (default: next to the config file)
+        --metrics-port METRICS_PORT
+                                Expose Prometheus metrics on http://127.0.0.1:METRICS_PORT/metrics
+        --metrics-log-interval METRICS_LOG_INTERVAL
+                                Print the metrics as a JSON log line every METRICS_LOG_INTERVAL seconds
+        --reconcile-rate RECONCILE_RATE
+                                Seconds between the full pulls re-checking finished runs (default: 300, 0 to pull
+                                all the runs at every refresh)
+        --consumer-pull-rate CONSUMER_PULL_RATE
+                                Seconds between the pulls of the consumer reverting the changes made in the consumer
+                                (default: 300, 0 to only pull it at startup)
+        --ingest-port INGEST_PORT
+                                Listen for run hints from training scripts on http://127.0.0.1:INGEST_PORT/hints
+        --ingest-socket INGEST_SOCKET
+                                Listen for run hints from training scripts on a Unix socket
+        --columnar            Diff the reports as columnar tables with vectorized operations, for large sweeps
+                                (requires numpy)
+        --streaming           Sync one experiment at a time (pull, diff, push), so that memory is bounded by the
+                                largest experiment
+        --freshness-slo FRESHNESS_SLO
+                                Warn when a run change reaches the consumer more than FRESHNESS_SLO seconds after
+                                the producer recorded it
     """
 
-    # take environment variables from .env
-    path_to_dotenv = find_dotenv(usecwd=True)
-    load_dotenv()
-
     # Try to get the basic configurations
     parser = argparse.ArgumentParser(description="Sync your ML Experiments with your favorite apps.")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["sync", "backfill"],
+        default="sync",
+        help="Command to run (default: sync). backfill creates all the runs in the consumer concurrently with "
+        "resumable checkpoints, then continues with sync.",
+    )
     parser.add_argument(
         "-c", "--config", type=str, help="Configuration file. See Documentation for more details.", required=True
     )
@@ -60,6 +96,21 @@ def main():
         type=str,
         help="MLFlow URI during the run",
     )
+    parser.add_argument(
+        "--mlruns-dir",
+        type=str,
+        help="Local mlruns/ directory of the MLFlow server, watched for changes instead of polling",
+    )
+    parser.add_argument(
+        "--history-store",
+        type=str,
+        help="Directory of the local store of the metric histories, kept across restarts",
+    )
+    parser.add_argument(
+        "--format-workers",
+        type=int,
+        help="Worker processes formatting the runs of large pulls (default: number of CPUs, 0 to disable)",
+    )
     parser.add_argument(
         "--notion-token",
         type=str,
@@ -71,9 +122,87 @@ def main():
         help="Notion page ID",
     )
 
+    # Backfill
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of concurrent requests during backfill (default: 4)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        help="Path to the backfill checkpoint file (default: next to the config file)",
+    )
+
+    # Metrics
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Expose Prometheus metrics on http://127.0.0.1:METRICS_PORT/metrics",
+    )
+    parser.add_argument(
+        "--metrics-log-interval",
+        type=float,
+        help="Print the metrics as a JSON log line every METRICS_LOG_INTERVAL seconds",
+    )
+
+    parser.add_argument(
+        "--reconcile-rate",
+        type=float,
+        help="Seconds between the full pulls re-checking finished runs (default: 300, 0 to pull all the runs at every "
+        "refresh)",
+    )
+    parser.add_argument(
+        "--consumer-pull-rate",
+        type=float,
+        help="Seconds between the pulls of the consumer reverting the changes made in the consumer (default: 300, 0 "
+        "to only pull it at startup)",
+    )
+
+    # Ingest endpoint
+    parser.add_argument(
+        "--ingest-port",
+        type=int,
+        help="Listen for run hints from training scripts on http://127.0.0.1:INGEST_PORT/hints",
+    )
+    parser.add_argument(
+        "--ingest-socket",
+        type=str,
+        help="Listen for run hints from training scripts on a Unix socket",
+    )
+
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="Diff the reports as columnar tables with vectorized operations, for large sweeps (requires numpy)",
+    )
+
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Sync one experiment at a time (pull, diff, push), so that memory is bounded by the largest experiment",
+    )
+
+    parser.add_argument(
+        "--freshness-slo",
+        type=float,
+        help="Warn when a run change reaches the consumer more than FRESHNESS_SLO seconds after the producer "
+        "recorded it",
+    )
+
     # Parse Arguments
     args = parser.parse_args()
 
+    from dotenv import load_dotenv, find_dotenv
+    from mlsync.engine.sync import Sync
+    from mlsync.utils.utils import yaml_loader, yaml_dumper
+    from mlsync.utils.report_format import load_report_format
+    from mlsync.utils.metrics import METRICS
+
+    # take environment variables from .env
+    load_dotenv()
+
     # Kwargs for the Sync class
     kwargs = {}
 
@@ -87,21 +216,24 @@ def main():
     # Read the config file
     configs = yaml_loader(filepath=args.config)
 
-    # Report Format
+    # Report Format, in the section of the producer
+    configs[args.producer] = configs.get(args.producer) or {}
     # 1. First preference: command line argument
     if args.format:
         format_path = args.format
-        configs["mlflow"]["format"] = format_path
+        configs[args.producer]["format"] = format_path
     # 2. Second preference: config file
-    elif configs["mlflow"]['format']:
-        format_path = configs["mlflow"]["format"]
+    elif configs[args.producer].get('format'):
+        format_path = configs[args.producer]["format"]
     # 3. Third preference: default
     else:
         # Raise Warning
         print("WARNING: No report format specified, using default.")
         format_path = os.path.join(os.path.dirname(__file__), "../examples/mlflow-notion/format.yaml")
     assert os.path.isfile(format_path), f"Report format file {format_path} does not exist"
-    format_yaml = yaml_loader(format_path)
+    format_yaml = load_report_format(format_path)
+    # The sync process reloads the report format when the file changes
+    kwargs["format_path"] = format_path
 
     # Try to load important variables for the sync process
 
@@ -126,8 +258,24 @@ def main():
         mlflow_uri = f"{mlflow_uri}/api"
         # Add to kwargs
         kwargs["mlflow_uri"] = mlflow_uri
+        # Local mlruns/ directory, watched for changes
+        if args.mlruns_dir:
+            configs['mlflow']['mlruns_dir'] = args.mlruns_dir
+        if configs['mlflow'].get('mlruns_dir'):
+            kwargs["mlflow_mlruns_dir"] = configs['mlflow']['mlruns_dir']
+        # Local store of the metric histories
+        if args.history_store:
+            configs['mlflow']['history_store'] = args.history_store
+        if configs['mlflow'].get('history_store'):
+            kwargs["mlflow_history_store"] = configs['mlflow']['history_store']
+        # Worker processes formatting large pulls
+        if args.format_workers is not None:
+            configs['mlflow']['format_workers'] = args.format_workers
+        if configs['mlflow'].get('format_workers') is not None:
+            kwargs["mlflow_format_workers"] = configs['mlflow']['format_workers']
+    # Other producers (e.g. plugins) get their config section as <producer>_<key> keyword arguments
     else:
-        raise ValueError(f"Producer {args.producer} is not supported")
+        kwargs.update({f"{args.producer}_{key}": value for key, value in (configs.get(args.producer) or {}).items()})
 
     # Consumers: Notion
     if args.consumer == "notion":
@@ -147,6 +295,8 @@ def main():
         kwargs["notion_token"] = notion_token
 
         # Notion Page ID
+        from notion_client.helpers import get_id
+
         # 1. First preference, command line
         if args.notion_page_id:
             # get_id if page_id is a URL
@@ -173,8 +323,9 @@ def main():
             raise ValueError("NOTION_PAGE_ID is not set")
         # Add to kwargs
         kwargs["notion_page_id"] = notion_page_id
+    # Other consumers (e.g. plugins) get their config section as <consumer>_<key> keyword arguments
     else:
-        raise ValueError(f"Consumer {args.consumer} not supported")
+        kwargs.update({f"{args.consumer}_{key}": value for key, value in (configs.get(args.consumer) or {}).items()})
 
     # Set refresh rate
     if args.refresh_rate is not None:
@@ -186,9 +337,51 @@ def main():
         print("WARNING: No refresh rate specified, using default of 1 second.")
         refresh_rate = 1
         
+    # Freshness SLO
+    if args.freshness_slo is not None:
+        configs['freshness_slo'] = args.freshness_slo
+    if configs.get('freshness_slo') is not None:
+        kwargs["freshness_slo"] = configs['freshness_slo']
+
+    # Reconciliation rate
+    if args.reconcile_rate is not None:
+        configs['reconcile_rate'] = args.reconcile_rate
+    if configs.get('reconcile_rate') is not None:
+        kwargs["reconcile_rate"] = configs['reconcile_rate']
+    if args.consumer_pull_rate is not None:
+        configs['consumer_pull_rate'] = args.consumer_pull_rate
+    if configs.get('consumer_pull_rate') is not None:
+        kwargs["consumer_pull_rate"] = configs['consumer_pull_rate']
+
+    # Columnar reports
+    if args.columnar:
+        configs['columnar'] = True
+    if configs.get('columnar'):
+        kwargs["columnar"] = True
+
+    # Streaming sync
+    if args.streaming:
+        configs['streaming'] = True
+    if configs.get('streaming'):
+        kwargs["streaming"] = True
+
+    # Ingest endpoint
+    if args.ingest_port is not None:
+        kwargs["ingest_port"] = args.ingest_port
+    if args.ingest_socket:
+        kwargs["ingest_socket"] = args.ingest_socket
+
     # Write the updated config file back for future use
     yaml_dumper(configs, filepath=args.config)
 
+    # Metrics are only recorded if they are exposed
+    if args.metrics_port or args.metrics_log_interval:
+        METRICS.enable()
+        if args.metrics_port:
+            METRICS.serve(args.metrics_port)
+        if args.metrics_log_interval:
+            METRICS.log_periodically(args.metrics_log_interval)
+
     # Create a sync object and start the sync process
     sync_instance = Sync(
         report_format=format_yaml,
@@ -197,8 +390,16 @@ def main():
         **kwargs,
     )
 
+    # Bulk initial sync, then hand off to the sync process
+    report = None
+    if args.command == "backfill":
+        checkpoint_path = args.checkpoint or os.path.join(
+            os.path.dirname(os.path.abspath(args.config)), ".mlsync-backfill.json"
+        )
+        report = sync_instance.backfill(checkpoint_path=checkpoint_path, workers=args.workers)
+
     # Run the sync process   
-    sync_instance.sync(refresh_rate=refresh_rate)
+    sync_instance.sync(refresh_rate=refresh_rate, report=report)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
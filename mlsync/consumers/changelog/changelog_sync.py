@@ -0,0 +1,343 @@
+import os
+import io
+import csv
+import re
+import sys
+import gzip
+import json
+import time
+from collections import Counter
+from mlsync.utils.metrics import STAGE_DURATION, RUNS
+
+# Default path of the change feed, relative to the working directory
+CHANGELOG_PATH = "mlsync-changes.jsonl"
+# Formats of the change feed
+CHANGELOG_FORMATS = ("jsonl", "csv")
+# When the feed is synced to disk: after every write, when a file is rotated, or never (left to the OS)
+FSYNC_POLICIES = ("flush", "rotate", "never")
+# Time and sequence number of the rotated files, <name>-<time>-<sequence><ext>: the sequence orders the files
+# rotated within the same second
+ROTATED_STAMP = "%Y%m%dT%H%M%S"
+ROTATED_SEQUENCE_DIGITS = 4
+# Fields of an event, the columns of the CSV feed
+EVENT_FIELDS = ["time", "event", "experiment", "run", "fields"]
+# Values written as they are, other values are compared as they are read back from the feed (e.g. dates as strings)
+JSON_SCALARS = (str, int, float, bool, type(None))
+# Events as actions of the runs metric
+RUN_ACTIONS = {"create": "created", "update": "updated", "archive": "archived"}
+
+
+class ChangelogSync:
+    """Sync data from mlsync to an append-only change feed, for other tools to tail.
+
+    Each change of a run is an event: create (with all its fields), update (with the fields that changed) or
+    archive (the run or its experiment was deleted). Events are written as JSON lines, or as CSV rows with the
+    fields as JSON:
+
+        {"time": 1700000000.123, "event": "update", "experiment": "CIFAR10", "run": "<uid>", "fields": {"Accuracy": 0.9}}
+
+    The events of a sync are written at once, then the file is flushed (and synced to disk, see fsync). The feed
+    file is rotated (renamed to <name>-<time>-<sequence><ext>) when it reaches max_bytes or when it is max_age
+    seconds old.
+
+    The values of the fields of the runs are kept to find the fields that changed. They are rebuilt by replaying
+    the feed (rotated files included) when the consumer starts, so a restart does not write the runs again.
+
+    Args:
+        path (str): Path to the feed file.
+        report_format (dict): The report format
+        log_format (str): jsonl or csv (default: from the extension of the path)
+        compress (bool): Write the feed with gzip (.gz is added to the path)
+        max_bytes (int): Rotate the feed file when it reaches this size (Optional)
+        max_age (float): Rotate the feed file when it is this many seconds old (Optional)
+        fsync (str): When to sync the feed to disk: flush (after every sync), rotate or never.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        report_format: dict,
+        log_format: str = None,
+        compress: bool = False,
+        max_bytes: int = None,
+        max_age: float = None,
+        fsync: str = "flush",
+    ):
+        """Initialize the ChangelogSync object"""
+        self.root, self.ext = os.path.splitext(path)
+        self.log_format = log_format or ("csv" if self.ext == ".csv" else "jsonl")
+        if self.log_format not in CHANGELOG_FORMATS:
+            raise ValueError(f"Unknown change feed format {self.log_format} (supported: {CHANGELOG_FORMATS})")
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync} (supported: {FSYNC_POLICIES})")
+        self.path = path + ".gz" if compress else path
+        self.format = report_format
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.fsync = fsync
+        self.file = None
+        self.opened_at = None
+        # Values of the fields of the runs in the feed: {experiment_name: {run_id: {alias: value}}}
+        self.state = {}
+        self.replay()
+
+    @classmethod
+    def from_config(cls, report_format, **kwargs):
+        """Instantiate the consumer from the keyword arguments of the Sync class.
+
+        Args:
+            report_format (dict): The report format
+
+        Keyword Args:
+            changelog_path (str): Path to the feed file (default: mlsync-changes.jsonl)
+            changelog_format (str): jsonl or csv (default: from the extension of the path)
+            changelog_gzip (bool): Write the feed with gzip (Optional)
+            changelog_max_bytes (int): Rotate the feed file when it reaches this size (Optional)
+            changelog_max_age (float): Rotate the feed file when it is this many seconds old (Optional)
+            changelog_fsync (str): When to sync the feed to disk: flush, rotate or never (default: flush)
+        """
+        return cls(
+            path=kwargs.get("changelog_path") or CHANGELOG_PATH,
+            report_format=report_format,
+            log_format=kwargs.get("changelog_format"),
+            compress=kwargs.get("changelog_gzip", False),
+            max_bytes=kwargs.get("changelog_max_bytes"),
+            max_age=kwargs.get("changelog_max_age"),
+            fsync=kwargs.get("changelog_fsync") or "flush",
+        )
+
+    def rotated_files(self):
+        """Rotated files of the feed by (time, sequence): {(stamp, sequence): path}
+
+        Only the names written by rotate are matched, e.g. not the feed of another path sharing the prefix. Files
+        rotated without a sequence (by earlier versions) come first within their second.
+        """
+        directory, name = os.path.split(self.root)
+        pattern = re.compile(re.escape(name) + r"-(\d{8}T\d{6})(?:-(\d+))?" + re.escape(self.ext) + r"(?:\.gz)?")
+        if not os.path.isdir(directory or "."):
+            return {}
+        rotated = {}
+        for filename in os.listdir(directory or "."):
+            match = pattern.fullmatch(filename)
+            if match:
+                rotated[(match.group(1), int(match.group(2) or 0))] = os.path.join(directory, filename)
+        return rotated
+
+    def files(self):
+        """Files of the feed in the order they were written: the rotated files, then the current file."""
+        rotated = self.rotated_files()
+        current = [path for path in (self.root + self.ext, self.root + self.ext + ".gz") if os.path.isfile(path)]
+        return [rotated[key] for key in sorted(rotated)] + current
+
+    def read_events(self, path):
+        """Read the events of a feed file, skipping an incomplete last line (e.g. after a crash)."""
+        opener = gzip.open if path.endswith(".gz") else open
+        try:
+            with opener(path, "rt", newline="") as f:
+                if self.log_format == "csv":
+                    for row in csv.DictReader(f):
+                        try:
+                            yield {**row, "fields": json.loads(row["fields"] or "{}")}
+                        except (TypeError, ValueError):
+                            continue
+                else:
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+        except (EOFError, OSError):
+            # Truncated gzip member
+            return
+
+    def replay(self):
+        """Rebuild the values of the fields of the runs from the feed."""
+        for path in self.files():
+            for event in self.read_events(path):
+                runs = self.state.setdefault(event["experiment"], {})
+                if event["event"] == "create":
+                    runs[event["run"]] = dict(event["fields"])
+                elif event["event"] == "update":
+                    runs.setdefault(event["run"], {}).update(event["fields"])
+                elif event["event"] == "archive":
+                    runs.pop(event["run"], None)
+                    if not runs:
+                        del self.state[event["experiment"]]
+
+    def pull(self, full=False):
+        """Return the runs in the feed as a report in mlsync format.
+
+        Only the values of the fields are in the feed, the cells have no metadata: the runs differ from the report
+        of the producer and the next sync compares their fields. Runs whose fields did not change are not written.
+
+        Args:
+            full (bool): Unused.
+        """
+        return {
+            experiment_name: {
+                "name": experiment_name,
+                "runs": {
+                    run_id: {alias: {"value": value} for alias, value in fields.items()}
+                    for run_id, fields in runs.items()
+                },
+            }
+            for experiment_name, runs in self.state.items()
+        }
+
+    def push(self, report, command="new", diff_report=None):
+        """Takes current MLSync report and appends its changes to the feed.
+
+        Args:
+            report (dict): MLSync report
+            command (str): The command to execute, It can be "new", "create", "update" or "delete"
+            diff_report (dict): The diff report describing the changes to be made.
+        """
+        now = time.time()
+        events = []
+        with STAGE_DURATION.time(stage="format_out"):
+            # Create new set of reports
+            if command == "new":
+                for experiment_name, experiment in report.items():
+                    self.create_experiment(experiment_name, experiment, now, events)
+            # Create specific set of experiments and runs
+            elif command == "create":
+                assert diff_report is not None, "diff_report is required for create command"
+                for experiment_name in diff_report["new"]:
+                    self.create_experiment(experiment_name, report[experiment_name], now, events)
+            # Update existing set of reports
+            elif command == "update":
+                assert diff_report is not None, "diff_report is required for update command"
+                for experiment_name, runs_diff in diff_report["updated"].items():
+                    runs = report[experiment_name]["runs"]
+                    state = self.state.setdefault(experiment_name, {})
+                    for run_id in runs_diff["new"]:
+                        state[run_id] = self.run_fields(runs[run_id])
+                        events.append((now, "create", experiment_name, run_id, state[run_id]))
+                    for run_id in runs_diff["updated"]:
+                        fields = self.run_fields(runs[run_id])
+                        changed = self.changed_fields(state.get(run_id, {}), fields)
+                        state[run_id] = fields
+                        if changed:
+                            events.append((now, "update", experiment_name, run_id, changed))
+                    for run_id in runs_diff["deleted"]:
+                        state.pop(run_id, None)
+                        events.append((now, "archive", experiment_name, run_id, {}))
+            # Delete existing set of reports
+            elif command == "delete":
+                assert diff_report is not None, "diff_report is required for delete command"
+                for experiment_name, runs_diff in diff_report["deleted"].items():
+                    self.state.pop(experiment_name, None)
+                    for run_id in runs_diff["deleted"]:
+                        events.append((now, "archive", experiment_name, run_id, {}))
+            else:
+                sys.exit("Command not recognized.")
+            data = self.format_events(events)
+
+        self.write(data, now)
+        for event, count in Counter(event[1] for event in events).items():
+            RUNS.inc(count, action=RUN_ACTIONS[event])
+
+    def create_experiment(self, experiment_name, experiment, now, events):
+        """Add the create events of the runs of an experiment."""
+        state = self.state[experiment_name] = {}
+        for run_id, run in experiment["runs"].items():
+            state[run_id] = self.run_fields(run)
+            events.append((now, "create", experiment_name, run_id, state[run_id]))
+
+    @staticmethod
+    def run_fields(run):
+        """Values of the fields of a run as they are read back from the feed: {alias: value}"""
+        fields = {alias: cell.get("value") if isinstance(cell, dict) else cell for alias, cell in run.items()}
+        for alias, value in fields.items():
+            if not isinstance(value, JSON_SCALARS):
+                fields[alias] = json.loads(json.dumps(value, default=str))
+        return fields
+
+    @staticmethod
+    def changed_fields(fields_old, fields):
+        """Fields whose value changed, removed fields are changed to None."""
+        changed = {
+            alias: value for alias, value in fields.items() if alias not in fields_old or fields_old[alias] != value
+        }
+        changed.update({alias: None for alias in fields_old if alias not in fields})
+        return changed
+
+    def format_events(self, events):
+        """Serialize events as JSON lines or CSV rows.
+
+        Args:
+            events (list): The events as (time, event, experiment, run, fields)
+
+        Returns:
+            str: The events, one per line.
+        """
+        if self.log_format == "jsonl":
+            return "".join(
+                json.dumps(dict(zip(EVENT_FIELDS, (round(event[0], 3), *event[1:]))), default=str) + "\n"
+                for event in events
+            )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows(
+            (round(t, 3), event, experiment_name, run_id, json.dumps(fields, default=str))
+            for t, event, experiment_name, run_id, fields in events
+        )
+        return buffer.getvalue()
+
+    def open(self, now):
+        """Open the feed file for appending, with the CSV header if the file is new."""
+        new = not os.path.isfile(self.path) or os.path.getsize(self.path) == 0
+        if self.compress:
+            self.file = gzip.open(self.path, "at", newline="")
+        else:
+            self.file = open(self.path, "a", newline="")
+        if new and self.log_format == "csv":
+            csv.writer(self.file).writerow(EVENT_FIELDS)
+        # The age of an existing file counts from its creation, as far as the file system tells
+        self.opened_at = now if new else min(now, os.path.getmtime(self.path))
+
+    def write(self, data, now):
+        """Append the events of a sync to the feed with a single write, then flush and rotate the file if due.
+
+        Args:
+            data (str): The serialized events.
+            now (float): Time of the sync.
+        """
+        if not data:
+            return
+        if self.file is None:
+            self.open(now)
+        self.file.write(data)
+        self.file.flush()
+        if self.fsync == "flush":
+            self.sync_file()
+        if (self.max_bytes and os.path.getsize(self.path) >= self.max_bytes) or (
+            self.max_age and now - self.opened_at >= self.max_age
+        ):
+            self.rotate(now)
+
+    def sync_file(self):
+        """Sync the feed file to disk."""
+        fileobj = getattr(self.file, "fileobj", None) or self.file
+        fileobj.flush()
+        os.fsync(fileobj.fileno())
+
+    def rotate(self, now):
+        """Close the feed file and rename it to <name>-<time>-<sequence><ext>, the next events start a new file."""
+        if self.fsync in ("flush", "rotate"):
+            self.sync_file()
+        self.file.close()
+        self.file = None
+        stamp = time.strftime(ROTATED_STAMP, time.gmtime(now))
+        sequence = 1 + max((key[1] for key in self.rotated_files() if key[0] == stamp), default=0)
+        rotated = f"{self.root}-{stamp}-{sequence:0{ROTATED_SEQUENCE_DIGITS}d}{self.ext}"
+        os.replace(self.path, rotated + (".gz" if self.compress else ""))
+
+    def close(self):
+        """Flush and close the feed file."""
+        if self.file is not None:
+            if self.fsync in ("flush", "rotate"):
+                self.sync_file()
+            self.file.close()
+            self.file = None
@@ -1,7 +1,19 @@
 import os
+import json
+import time
 from notion_client import Client
+from notion_client.errors import HTTPResponseError
 from notion_client.helpers import get_id
 
+from mlsync.utils.utils import RateLimiter
+from mlsync.utils.metrics import METRICS, HTTP_REQUESTS, HTTP_BYTES
+
+# HTTP status codes worth retrying: conflicts, rate limiting and server errors
+RETRY_STATUS_CODES = (409, 429, 500, 502, 503, 504)
+# Creations are not idempotent, a server error may come after the object was created: they are only retried when
+# rate limited, which Notion answers before processing the request
+CREATE_RETRY_STATUS_CODES = (429,)
+
 
 class NotionAPI:
     """An API for Notion.
@@ -9,12 +21,61 @@ class NotionAPI:
     Attributes:    
         token (str): A token to access Notion.
         version (str): The version of the API to use.
+        requests_per_second (float): Maximum sustained request rate, None for no limit (Optional)
+        max_retries (int): Number of retries for rate limited or failed requests.
+        base_url (str): Root URL of the Notion API, e.g. a local NotionServer (Optional)
     """
 
-    def __init__(self, token, version="v3"):
+    def __init__(self, token, version="v3", requests_per_second=None, max_retries=5, base_url=None):
         """Initialize the Notion API."""
-        self.notion = Client(auth=token)
+        self.notion = Client(auth=token, base_url=base_url) if base_url else Client(auth=token)
         self.notion_version = version
+        self.rate_limiter = RateLimiter(requests_per_second, burst=requests_per_second) if requests_per_second else None
+        self.max_retries = max_retries
+
+    def request(self, method, *args, retry_status_codes=RETRY_STATUS_CODES, **kwargs):
+        """Call a Notion client method within the rate limit, retrying when rate limited.
+
+        Args:
+            method (callable): The Notion client method, e.g. self.notion.pages.create
+            retry_status_codes (tuple): HTTP status codes of the errors to retry.
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            try:
+                response = method(*args, **kwargs)
+                if METRICS.enabled:
+                    self.record(method, 200, kwargs, response)
+                return response
+            except HTTPResponseError as e:
+                if METRICS.enabled:
+                    self.record(method, e.status, kwargs, e.body)
+                if e.status not in retry_status_codes or attempt >= self.max_retries:
+                    raise
+                # Notion tells us how long to wait when rate limited, otherwise back off exponentially
+                retry_after = e.headers.get("Retry-After")
+                time.sleep(float(retry_after) if retry_after else 0.5 * 2**attempt)
+                attempt += 1
+
+    def record(self, method, status, body, response):
+        """Record the metrics of a request.
+
+        Args:
+            method (callable): The Notion client method, e.g. self.notion.pages.create
+            status (int): HTTP status of the response.
+            body (dict): Body of the request.
+            response (dict or str): The response.
+        """
+        # e.g. pages.create, or search for callable endpoints
+        endpoint = getattr(method, "__self__", method)
+        name = type(endpoint).__name__.replace("Endpoint", "").lower()
+        if endpoint is not method:
+            name = f"{name}.{method.__name__}"
+        HTTP_REQUESTS.inc(api="notion", method=name, status=status)
+        HTTP_BYTES.inc(len(json.dumps(body)), api="notion", direction="sent")
+        HTTP_BYTES.inc(len(response if isinstance(response, str) else json.dumps(response)), api="notion", direction="received")
 
     def testPageAccess(self, page_id):
         """Test if a page can be accessed.
@@ -23,7 +84,7 @@ class NotionAPI:
             page_id (str): The id of the page to test.
         """
         try:
-            self.notion.pages.retrieve(page_id)
+            self.request(self.notion.pages.retrieve, page_id)
             return True
         except Exception as e:
             print(e)
@@ -37,13 +98,13 @@ class NotionAPI:
             filter (dict): The filter to search for. See docs: https://developers.notion.com/reference/post-database-query-filter
         """
         # Documentation: https://developers.notion.com/reference/post-database-query-filter
-        response = self.notion.search(query=query, filter=filter)
+        response = self.request(self.notion.search, query=query, filter=filter)
         return response["results"]
 
     def getAllDatabases(self):
         """Get all databases."""
-        response = self.notion.search(
-            filter={"value": "database", "property": "object"}
+        response = self.request(
+            self.notion.search, filter={"value": "database", "property": "object"}
         )
         return response
 
@@ -53,7 +114,7 @@ class NotionAPI:
         Args:
             page_id (str): The id of the page to read.
         """
-        response = self.notion.pages.retrieve(page_id)
+        response = self.request(self.notion.pages.retrieve, page_id)
         return response
 
     def createDatabase(self, name, properties, parent_id):
@@ -71,8 +132,12 @@ class NotionAPI:
         title = [{"type": "text", "text": {"content": name}}]
         # Properties of the database: (https://developers.notion.com/reference/property-schema-object)
         # (given)
-        response = self.notion.databases.create(
-            parent=parent, title=title, properties=properties
+        response = self.request(
+            self.notion.databases.create,
+            parent=parent,
+            title=title,
+            properties=properties,
+            retry_status_codes=CREATE_RETRY_STATUS_CODES,
         )
         return response.get("id")
 
@@ -82,17 +147,24 @@ class NotionAPI:
         Args:
             database_id (str): The id of the database.
         """
-        response = self.notion.databases.retrieve(database_id)
+        response = self.request(self.notion.databases.retrieve, database_id)
         # Return the database properties
         return response
 
-    def readDatabase(self, database_id):
-        """Read a database.
+    def readDatabase(self, database_id, filter=None):
+        """Read a database, following the pagination until all the pages are fetched.
         
         Args:
             database_id (str): The id of the database.
+            filter (dict): The filter for the pages. See docs: https://developers.notion.com/reference/post-database-query-filter
         """
-        response = self.notion.databases.query(database_id)
+        response = self.request(self.notion.databases.query, database_id, filter=filter)
+        results = response["results"]
+        while response.get("has_more"):
+            response = self.request(
+                self.notion.databases.query, database_id, filter=filter, start_cursor=response["next_cursor"])
+            results.extend(response["results"])
+        response["results"] = results
         return response
 
     def updateDatabase(self, database_id, properties):
@@ -102,8 +174,8 @@ class NotionAPI:
             database_id (str): The id of the database.
             properties (dict): The properties of the database.
         """
-        response = self.notion.databases.update(
-            database_id, properties=properties)
+        response = self.request(
+            self.notion.databases.update, database_id, properties=properties)
         return response["properties"]
 
     def addPageToDatabase(self, database_id, properties):
@@ -114,8 +186,12 @@ class NotionAPI:
             properties (dict): The properties of the page.
         """
         parent = {"type": "database_id", "database_id": database_id}
-        response = self.notion.pages.create(
-            parent=parent, properties=properties)
+        response = self.request(
+            self.notion.pages.create,
+            parent=parent,
+            properties=properties,
+            retry_status_codes=CREATE_RETRY_STATUS_CODES,
+        )
         return response
 
     def deletePageFromDatabase(self, database_id, page_id, properties):
@@ -127,8 +203,8 @@ class NotionAPI:
             properties (dict): The properties of the page.
         """
         parent = {"type": "database_id", "database_id": database_id}
-        response = self.notion.pages.update(
-            page_id, parent=parent, archived=True, properties=properties
+        response = self.request(
+            self.notion.pages.update, page_id, parent=parent, archived=True, properties=properties
         )
         return response
 
@@ -141,8 +217,8 @@ class NotionAPI:
             properties (dict): The properties of the page.
         """
         parent = {"type": "database_id", "database_id": database_id}
-        response = self.notion.pages.update(
-            page_id, parent=parent, properties=properties, archived=False
+        response = self.request(
+            self.notion.pages.update, page_id, parent=parent, properties=properties, archived=False
         )
         return response
 
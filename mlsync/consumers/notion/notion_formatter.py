@@ -1,4 +1,5 @@
 import sys
+import copy
 
 NOTION_COLORS = ["green", "blue", "orange", "purple", "red", "yellow", "pink"]
 NOTION_PROPERTIES = {
@@ -18,6 +19,16 @@ class NotionFormatter:
         """Initialize the NotionFormatter."""
         self.notion_api = notion_api
         self.report_format = report_format
+        # Cache of the rendered Notion report, kept across calls to format_out.
+        # properties: {experiment_name: {property_name: notion_property}}
+        # rows: {experiment_name: {run_uid: (fingerprint, notion_row)}}
+        self.properties_cache = {}
+        self.rows_cache = {}
+        # Cache of the pages read by format_in, kept across pulls.
+        # pages: {database_id: {page_id: (last_edited_time, page_uid, page_properties)}}
+        # pulled_until: {database_id: latest last_edited_time seen in the database}
+        self.pages_cache = {}
+        self.pulled_until = {}
 
     def notion_property_type_conversion(self, val_type):
         """
@@ -48,7 +59,8 @@ class NotionFormatter:
         property_type = self.notion_property_type_conversion(property_type)
 
         if property_type in NOTION_PROPERTIES:
-            notion_property = NOTION_PROPERTIES[property_type]
+            # Copy the template, properties are cached and handed to the Notion API
+            notion_property = copy.deepcopy(NOTION_PROPERTIES[property_type])
             # Some special cases require extra information
             if property_type == "select":
                 notion_property["select"]["options"] = [
@@ -105,65 +117,159 @@ class NotionFormatter:
         Args:
             property_object (dict): The Notion property.
         """
+        # Properties without a value are empty (rich_text, title) or null (number, select)
         if property_object["type"] == "rich_text":
-            return property_object["rich_text"][0]["text"]["content"]
+            return property_object["rich_text"][0]["text"]["content"] if property_object["rich_text"] else None
         elif property_object["type"] == "number":
             return property_object["number"]
         elif property_object["type"] == "title":
-            return property_object["title"][0]["text"]["content"]
+            return property_object["title"][0]["text"]["content"] if property_object["title"] else None
         elif property_object["type"] == "select":
-            return property_object["select"]["name"]
+            return property_object["select"]["name"] if property_object["select"] else None
         else:
             sys.exit("Unknown property type: " + property_object["type"])
 
-    def format_out(self, report):
+    def run_fingerprint(self, run):
+        """Fingerprint of a run, covering everything that ends up in its Notion row.
+
+        Args:
+            run (dict): A run of the mlsync report.
+        """
+        return tuple((key, value["type"], value["value"]) for key, value in run.items())
+
+    def format_experiment_properties(self, run, experiment_property):
+        """Add the properties of a run missing in the experiment (database) properties.
+
+        Args:
+            run (dict): A run of the mlsync report.
+            experiment_property (dict): The properties of the database, updated in place.
+        """
+        for key, value in run.items():
+            # Add only newly encountered properties
+            if key not in experiment_property:
+                # Check the type of the element
+                val_type = 'title' if (key == 'Name') else value['type']
+                # Metadata needed for some types of properties
+                if val_type == "select":
+                    metadata = value["options"]
+                else:
+                    metadata = None
+                experiment_property[key] = self.get_notion_property(val_type, metadata)
+
+    def format_run(self, run):
+        """Convert a run of the mlsync report into a Notion row.
+
+        Args:
+            run (dict): A run of the mlsync report.
+        """
+        run_property = {}
+        for key, value in run.items():
+            # Update value type if needed
+            val_type = 'title' if (key == 'Name') else value['type']
+            run_property[key] = self.create_notion_property(val_type, value['value'])
+
+        # Any missing properties are set to None TODO
+        # for property_key in experiment_property:
+        #     if property_key not in run_property:
+        #         run_property[property_key] = row_property['None']
+        return run_property
+
+    def prune(self, diff_report):
+        """Drop the cached properties and rows of deleted experiments and runs.
+
+        Args:
+            diff_report (dict): The diff report describing the changes.
+        """
+        for experiment_name in diff_report["deleted"]:
+            self.properties_cache.pop(experiment_name, None)
+            self.rows_cache.pop(experiment_name, None)
+        for experiment_name, diff_run_report in diff_report["updated"].items():
+            for run_uid in diff_run_report["deleted"]:
+                self.rows_cache.get(experiment_name, {}).pop(run_uid, None)
+
+    def release(self, experiment_name, database_id=None):
+        """Drop the cached rows and pages of an experiment, e.g. once a streaming sync pushed it.
+
+        The database properties are kept, they are small and spare reading the database at the next change.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+            database_id (str): The id of its database (Optional)
+        """
+        self.rows_cache.pop(experiment_name, None)
+        if database_id is not None:
+            self.pages_cache.pop(database_id, None)
+            self.pulled_until.pop(database_id, None)
+
+    def clear(self):
+        """Drop all the cached properties, rows and pages, e.g. when the report format changes."""
+        self.properties_cache.clear()
+        self.rows_cache.clear()
+        self.pages_cache.clear()
+        self.pulled_until.clear()
+
+    def format_out(self, report, diff_report=None):
         """
         Convert mlsync report into a Notion table.
 
+        The conversion is incremental: database properties and rows are cached per experiment, and a row is
+        only rendered again when the fingerprint of its run changes. If a diff report is given, only the
+        experiments and runs listed in it are rendered: new experiments in full, and the new and updated runs of
+        the updated experiments. Runs of a columnar report are rendered one row at a time, as they are read.
+
         Args:
             report (dict): The mlsync report. Format is derived from the report format file.
+            diff_report (dict): The diff report describing the changes (Optional)
         """
         # Convert MLSync report into a Notion table
         notion_report = {}
 
+        # Forget the experiments and runs that are gone
+        if diff_report is not None:
+            self.prune(diff_report)
+
+        # Pick the runs to render for each experiment
+        if diff_report is None:
+            selection = {experiment_name: list(experiment["runs"]) for experiment_name, experiment in report.items()}
+        else:
+            selection = {experiment_name: list(report[experiment_name]["runs"]) for experiment_name in diff_report["new"]}
+            for experiment_name, diff_run_report in diff_report["updated"].items():
+                selection[experiment_name] = diff_run_report["new"] + diff_run_report["updated"]
+
         # Each Experiment becomes a database
-        for experiment_name, experiment in report.items():
+        for experiment_name, run_uids in selection.items():
+            runs = report[experiment_name]["runs"]
             experiment_report = {}
 
             # 1. First create the properties of the database
-            experiment_property = {}
-            # Go through all the runs to create a superset of the properties
-            for run_id, run in experiment["runs"].items():
-                for key, value in run.items():
-                    # Add only newly encountered properties
-                    if key not in experiment_property:
-                        # Check the type of the element
-                        val_type = 'title' if (key == 'Name') else value['type']
-                        # Metadata needed for some types of properties
-                        if val_type == "select":
-                            metadata = value["options"]
-                        else:
-                            metadata = None
-                        experiment_property[key] = self.get_notion_property(val_type, metadata)
+            # Unknown experiments get a superset of the properties of all the runs, known experiments only need
+            # the properties of the runs that changed.
+            if experiment_name not in self.properties_cache:
+                self.properties_cache[experiment_name] = {}
+                run_uids_property = runs
+            else:
+                run_uids_property = run_uids
+            experiment_property = self.properties_cache[experiment_name]
+            if run_uids_property is runs and hasattr(runs, "header"):
+                # Columnar runs describe their columns without rendering the rows
+                self.format_experiment_properties(runs.header(), experiment_property)
+            else:
+                for run_uid in run_uids_property:
+                    self.format_experiment_properties(runs[run_uid], experiment_property)
 
             # Add the properties to the experiment report
             experiment_report["properties"] = experiment_property
 
             # 2. Then create the rows of the database
+            rows_cache = self.rows_cache.setdefault(experiment_name, {})
             run_properties = {}
-            for run_uid, run in experiment["runs"].items():
-                run_property = {}
-                for key, value in run.items():
-                    # Update value type if needed
-                    val_type = 'title' if (key == 'Name') else value['type']
-                    run_property[key] = self.create_notion_property(val_type, value['value'])
-
-                # Any missing properties are set to None TODO
-                # for property_key in experiment_property:
-                #     if property_key not in run_property:
-                #         run_property[property_key] = row_property['None']
-
-                run_properties[run_uid] = run_property
+            for run_uid in run_uids:
+                run = runs[run_uid]
+                fingerprint = self.run_fingerprint(run)
+                # Reuse the row if the run did not change since it was last rendered
+                if run_uid not in rows_cache or rows_cache[run_uid][0] != fingerprint:
+                    rows_cache[run_uid] = (fingerprint, self.format_run(run))
+                run_properties[run_uid] = rows_cache[run_uid][1]
             # Add the runs to the experiment report
             experiment_report["rows"] = run_properties
 
@@ -172,11 +278,70 @@ class NotionFormatter:
 
         return notion_report
 
-    def format_in(self, notion_report, root_page_id):
+    def read_database_pages(self, database_id, full=False):
+        """Read the pages of a database, reusing the pages that did not change since the last pull.
+
+        Only pages edited after the last pull are queried from Notion; the other pages are taken from the cache.
+        Notion rounds last_edited_time to the minute, so pages edited within the minute of the last pull are
+        queried and parsed again. A full read also drops the cached pages that are no longer in the database
+        (e.g., removed manually in Notion).
+
+        Args:
+            database_id (str): The id of the database.
+            full (bool): Read all the pages instead of the pages edited after the last pull.
+
+        Returns:
+            dict: The pages of the database as {page_id: (last_edited_time, page_uid, page_properties)}
+        """
+        pulled_until = None if full else self.pulled_until.get(database_id)
+        pages_cache = self.pages_cache.get(database_id, {})
+
+        # Query the pages edited since the last pull
+        if pulled_until is None:
+            page_filter = None
+        else:
+            page_filter = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": pulled_until}}
+        pages = self.notion_api.readDatabase(database_id, filter=page_filter)
+        pages = pages["results"] if (pages) else []
+
+        # A full read replaces the cache, an incremental read updates it
+        database_pages = {} if (pulled_until is None) else dict(pages_cache)
+        for page in pages:
+            page_id = page["id"]
+            last_edited_time = page["last_edited_time"]
+            cached_page = pages_cache.get(page_id)
+            # Reuse the page if its timestamp did not move
+            if cached_page and cached_page[0] == last_edited_time and last_edited_time != pulled_until:
+                database_pages[page_id] = cached_page
+                continue
+            page_uid = self.read_notion_property(page["properties"]["uid"])
+            page_properties = {}
+            for page_property_name, page_property in page["properties"].items():
+                page_properties[page_property_name] = self.read_notion_property(page_property)
+            database_pages[page_id] = (last_edited_time, page_uid, page_properties)
+
+        # Update the cache
+        self.pages_cache[database_id] = database_pages
+        if database_pages:
+            self.pulled_until[database_id] = max(page[0] for page in database_pages.values())
+        return database_pages
+
+    def forget_page(self, database_id, page_id):
+        """Drop a page (e.g., archived by mlsync) from the cache of pulled pages.
+
+        Args:
+            database_id (str): The id of the database.
+            page_id (str): The id of the page.
+        """
+        self.pages_cache.get(database_id, {}).pop(page_id, None)
+
+    def format_in(self, notion_report, root_page_id, full=False):
         """Converts current Notion report and converts it to MLSync report.
 
         Args:
             notion_report (dict): The Notion report as obtained from the Notion API.
+            root_page_id (str): The id of the root page.
+            full (bool): Read all the pages of the databases instead of the pages edited after the last pull.
         """
         state = {}
         report = {}
@@ -203,15 +368,9 @@ class NotionFormatter:
                 state[database_name] = {"database_id": database_id, "pages": {}}
 
                 # Get all the pages (runs) in the database
-                pages = self.notion_api.readDatabase(database_id)
-                pages = pages["results"] if (pages) else []
+                pages = self.read_database_pages(database_id, full=full)
                 # All the rows
-                for page in pages:
-                    page_id = page["id"]
-                    page_uid = self.read_notion_property(page["properties"]["uid"])
-                    page_properties = {}
-                    for page_property_name, page_property in page["properties"].items():
-                        page_properties[page_property_name] = self.read_notion_property(page_property)
+                for page_id, (_, page_uid, page_properties) in pages.items():
                     # update notion state
                     state[database_name]["pages"][page_uid] = {"page_id": page_id}
 
@@ -0,0 +1,401 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mlsync.utils.utils import RateLimiter
+
+# Notion returns at most 100 results per request
+NOTION_PAGE_SIZE = 100
+
+
+class NotionServerError(Exception):
+    """An error returned by the Notion stand-in, in the format of the Notion API."""
+
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+class NotionServer:
+    """Local stand-in of the Notion API endpoints used by mlsync, for tests and benchmarks.
+
+    Implements search, databases create/retrieve/query/update and pages create/retrieve/update on a localhost
+    HTTP server, with latency injection, rate limiting (429 responses with Retry-After) and pagination. Point
+    NotionAPI to it with the base_url argument.
+
+    Args:
+        host (str): Host to bind to.
+        port (int): Port to bind to, 0 picks a free port.
+        latency (float): Latency added to each request in seconds.
+        jitter (float): Maximum random latency added on top of the latency in seconds.
+        requests_per_second (float): Sustained request rate before responding 429, None for no limit.
+        burst (int): Number of requests allowed at once before rate limiting kicks in.
+        page_size (int): Maximum number of results per response.
+        minute_timestamps (bool): Round last_edited_time down to the minute, as Notion does.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        jitter=0.0,
+        requests_per_second=3,
+        burst=3,
+        page_size=NOTION_PAGE_SIZE,
+        minute_timestamps=True,
+    ):
+        """Initialize the Notion server"""
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limiter = RateLimiter(requests_per_second, burst=burst) if requests_per_second else None
+        self.page_size = page_size
+        self.minute_timestamps = minute_timestamps
+        # Notion objects by id
+        self.databases = {}
+        self.pages = {}
+        self.lock = threading.Lock()
+        # Number of requests by (method, endpoint, status)
+        self.requests = Counter()
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        """Base URL of the server, to use as NotionAPI base_url."""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve in a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def timestamp(self):
+        """Current time in Notion's format."""
+        now = datetime.now(timezone.utc)
+        if self.minute_timestamps:
+            now = now.replace(second=0, microsecond=0)
+        return now.strftime("%Y-%m-%dT%H:%M:%S.") + f"{now.microsecond // 1000:03d}Z"
+
+    def add_page(self, title="mlsync"):
+        """Add a page to the workspace, e.g. the root page shared with the integration.
+
+        Args:
+            title (str): The title of the page.
+
+        Returns:
+            str: The id of the page.
+        """
+        page_id = str(uuid.uuid4())
+        now = self.timestamp()
+        with self.lock:
+            self.pages[page_id] = {
+                "object": "page",
+                "id": page_id,
+                "created_time": now,
+                "last_edited_time": now,
+                "archived": False,
+                "parent": {"type": "workspace", "workspace": True},
+                "properties": {"title": {"id": "title", "type": "title", "title": self.rich_text(title)}},
+            }
+        return page_id
+
+    def stats(self):
+        """Number of requests by (method, endpoint, status)."""
+        with self.lock:
+            return dict(self.requests)
+
+    # -- Notion objects -- #
+
+    @staticmethod
+    def rich_text(content):
+        """Rich text array of a string."""
+        return [
+            {
+                "type": "text",
+                "text": {"content": content, "link": None},
+                "plain_text": content,
+                "href": None,
+            }
+        ]
+
+    @staticmethod
+    def empty_value(property_type):
+        """Value of an unset property."""
+        return [] if property_type in ("title", "rich_text") else None
+
+    def database_property(self, name, schema):
+        """Database property from a property schema object."""
+        property_type = next(key for key in schema if key not in ("name", "id", "type"))
+        return {"id": uuid.uuid4().hex[:4], "name": name, "type": property_type, property_type: schema[property_type]}
+
+    def page_value(self, name, database, value):
+        """Page property value from a property value object, validated against the database schema."""
+        if name not in database["properties"]:
+            raise NotionServerError(400, "validation_error", f"{name} is not a property that exists.")
+        property_type = database["properties"][name]["type"]
+        if property_type not in value:
+            raise NotionServerError(400, "validation_error", f"{name} is expected to be {property_type}.")
+        content = value[property_type]
+        if property_type in ("title", "rich_text"):
+            content = [self.rich_text(item["text"]["content"])[0] for item in content]
+        elif property_type == "select" and content is not None:
+            options = database["properties"][name]["select"].setdefault("options", [])
+            if content["name"] not in [option["name"] for option in options]:
+                options.append({"name": content["name"], "color": "default"})
+            content = {"name": content["name"], "color": "default"}
+        return {"id": database["properties"][name]["id"], "type": property_type, property_type: content}
+
+    # -- Endpoints -- #
+
+    def paginate(self, results, body):
+        """Paginate a list of results following start_cursor and page_size."""
+        start = int(body.get("start_cursor") or 0)
+        page_size = min(int(body.get("page_size") or self.page_size), self.page_size)
+        end = start + page_size
+        has_more = end < len(results)
+        return {
+            "object": "list",
+            "results": results[start:end],
+            "next_cursor": str(end) if has_more else None,
+            "has_more": has_more,
+        }
+
+    def search(self, body):
+        query = (body.get("query") or "").lower()
+        object_type = (body.get("filter") or {}).get("value")
+        results = []
+        if object_type in (None, "database"):
+            results += [
+                database
+                for database in self.databases.values()
+                if query in "".join(title["plain_text"] for title in database["title"]).lower()
+            ]
+        if object_type in (None, "page"):
+            results += [page for page in self.pages.values() if not page["archived"]]
+        return self.paginate(results, body)
+
+    def create_database(self, body):
+        parent_id = body["parent"]["page_id"]
+        if parent_id not in self.pages:
+            raise NotionServerError(404, "object_not_found", f"Could not find page with ID: {parent_id}.")
+        properties = body.get("properties") or {}
+        if sum(1 for schema in properties.values() if "title" in schema) != 1:
+            raise NotionServerError(400, "validation_error", "A database must have exactly one title property.")
+        database_id = str(uuid.uuid4())
+        now = self.timestamp()
+        self.databases[database_id] = {
+            "object": "database",
+            "id": database_id,
+            "created_time": now,
+            "last_edited_time": now,
+            "title": [self.rich_text(title["text"]["content"])[0] for title in body.get("title", [])],
+            "parent": {"type": "page_id", "page_id": parent_id},
+            "properties": {name: self.database_property(name, schema) for name, schema in properties.items()},
+            "archived": False,
+        }
+        return self.databases[database_id]
+
+    def get_database(self, database_id):
+        if database_id not in self.databases:
+            raise NotionServerError(404, "object_not_found", f"Could not find database with ID: {database_id}.")
+        return self.databases[database_id]
+
+    def update_database(self, database_id, body):
+        database = self.get_database(database_id)
+        for name, schema in (body.get("properties") or {}).items():
+            if schema is None:
+                database["properties"].pop(name, None)
+                for page in self.pages.values():
+                    if page["parent"].get("database_id") == database_id:
+                        page["properties"].pop(name, None)
+                continue
+            if "name" in schema and name in database["properties"]:
+                # Rename the property, keeping the values
+                new_name = schema["name"]
+                database["properties"][new_name] = {**database["properties"].pop(name), "name": new_name}
+                for page in self.pages.values():
+                    if page["parent"].get("database_id") == database_id and name in page["properties"]:
+                        page["properties"][new_name] = page["properties"].pop(name)
+                name = new_name
+            if any(key not in ("name", "id", "type") for key in schema):
+                database["properties"][name] = self.database_property(name, schema)
+        if "title" in body:
+            database["title"] = [self.rich_text(title["text"]["content"])[0] for title in body["title"]]
+        database["last_edited_time"] = self.timestamp()
+        return database
+
+    def query_database(self, database_id, body):
+        self.get_database(database_id)
+        pages = [
+            page
+            for page in self.pages.values()
+            if page["parent"].get("database_id") == database_id and not page["archived"]
+        ]
+        page_filter = body.get("filter")
+        if page_filter and page_filter.get("timestamp") in ("last_edited_time", "created_time"):
+            timestamp = page_filter["timestamp"]
+            condition = page_filter[timestamp]
+            operators = {
+                "equals": lambda a, b: a == b,
+                "before": lambda a, b: a < b,
+                "after": lambda a, b: a > b,
+                "on_or_before": lambda a, b: a <= b,
+                "on_or_after": lambda a, b: a >= b,
+            }
+            for operator, value in condition.items():
+                pages = [page for page in pages if operators[operator](page[timestamp], value)]
+        return self.paginate(pages, body)
+
+    def create_page(self, body):
+        database_id = body["parent"]["database_id"]
+        database = self.get_database(database_id)
+        properties = {
+            name: {"id": schema["id"], "type": schema["type"], schema["type"]: self.empty_value(schema["type"])}
+            for name, schema in database["properties"].items()
+        }
+        for name, value in (body.get("properties") or {}).items():
+            properties[name] = self.page_value(name, database, value)
+        page_id = str(uuid.uuid4())
+        now = self.timestamp()
+        self.pages[page_id] = {
+            "object": "page",
+            "id": page_id,
+            "created_time": now,
+            "last_edited_time": now,
+            "archived": False,
+            "parent": {"type": "database_id", "database_id": database_id},
+            "properties": properties,
+        }
+        return self.pages[page_id]
+
+    def get_page(self, page_id):
+        if page_id not in self.pages:
+            raise NotionServerError(404, "object_not_found", f"Could not find page with ID: {page_id}.")
+        return self.pages[page_id]
+
+    def update_page(self, page_id, body):
+        page = self.get_page(page_id)
+        if page["parent"]["type"] == "database_id":
+            database = self.get_database(page["parent"]["database_id"])
+            for name, value in (body.get("properties") or {}).items():
+                page["properties"][name] = self.page_value(name, database, value)
+        if body.get("archived") is not None:
+            page["archived"] = body["archived"]
+        page["last_edited_time"] = self.timestamp()
+        return page
+
+    def route(self, method, path, body):
+        """Dispatch a request to its endpoint.
+
+        Returns:
+            (str, dict): The name of the endpoint and the response.
+        """
+        routes = [
+            ("POST", r"/v1/search", "search", lambda: self.search(body)),
+            ("POST", r"/v1/databases", "databases.create", lambda: self.create_database(body)),
+            ("GET", r"/v1/databases/([^/]+)", "databases.retrieve", lambda i: self.get_database(i)),
+            ("PATCH", r"/v1/databases/([^/]+)", "databases.update", lambda i: self.update_database(i, body)),
+            ("POST", r"/v1/databases/([^/]+)/query", "databases.query", lambda i: self.query_database(i, body)),
+            ("POST", r"/v1/pages", "pages.create", lambda: self.create_page(body)),
+            ("GET", r"/v1/pages/([^/]+)", "pages.retrieve", lambda i: self.get_page(i)),
+            ("PATCH", r"/v1/pages/([^/]+)", "pages.update", lambda i: self.update_page(i, body)),
+        ]
+        path = path.split("?")[0].rstrip("/")
+        for route_method, pattern, endpoint, handle in routes:
+            match = re.fullmatch(pattern, path)
+            if match and route_method == method:
+                with self.lock:
+                    # Responses are serialized outside the lock, hand out a copy
+                    return endpoint, json.loads(json.dumps(handle(*match.groups())))
+        raise NotionServerError(400, "invalid_request_url", f"Invalid request URL: {method} {path}")
+
+    def handler(self):
+        """Request handler class bound to this server."""
+        server = self
+
+        class NotionRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def respond(self, endpoint, status, payload, headers=None):
+                data = json.dumps(payload).encode()
+                with server.lock:
+                    server.requests[(self.command, endpoint, status)] += 1
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def handle_request(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                # Latency of the service
+                if server.latency or server.jitter:
+                    time.sleep(server.latency + random.uniform(0, server.jitter))
+                # Rate limiting
+                if server.rate_limiter:
+                    wait = server.rate_limiter.try_acquire()
+                    if wait:
+                        error = {
+                            "object": "error",
+                            "status": 429,
+                            "code": "rate_limited",
+                            "message": "You have been rate limited. Please try again in a few minutes.",
+                        }
+                        return self.respond("rate_limited", 429, error, {"Retry-After": str(math.ceil(wait))})
+                try:
+                    endpoint, response = server.route(self.command, self.path, body)
+                except NotionServerError as e:
+                    error = {"object": "error", "status": e.status, "code": e.code, "message": e.message}
+                    return self.respond("error", e.status, error)
+                except (KeyError, TypeError, StopIteration) as e:
+                    error = {"object": "error", "status": 400, "code": "validation_error", "message": repr(e)}
+                    return self.respond("error", 400, error)
+                self.respond(endpoint, 200, response)
+
+            do_GET = do_POST = do_PATCH = handle_request
+
+        return NotionRequestHandler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local stand-in of the Notion API.")
+    parser.add_argument("--port", type=int, default=8484)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--requests-per-second", type=float, default=3)
+    args = parser.parse_args()
+
+    notion_server = NotionServer(port=args.port, latency=args.latency, requests_per_second=args.requests_per_second)
+    print(f"Notion API stand-in on {notion_server.url}, root page id: {notion_server.add_page()}")
+    notion_server.server.serve_forever()
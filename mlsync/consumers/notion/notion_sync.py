@@ -1,20 +1,49 @@
 import sys
+import os
+import json
+import time
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from mlsync.consumers.notion.notion_api import NotionAPI
 from mlsync.consumers.notion.notion_formatter import NotionFormatter
+from mlsync.utils.utils import Progress
+from mlsync.utils.metrics import STAGE_DURATION, RUNS, QUEUE_DEPTH
+
+# Pages created up to this long before the last entry of a backfill checkpoint are looked up on resume
+CHECKPOINT_CLOCK_MARGIN = timedelta(minutes=5)
+
+
+def checkpoint_time():
+    """Current time (UTC, ISO 8601) of the entries of a backfill checkpoint."""
+    return datetime.now(timezone.utc).isoformat()
+
+# Notion allows an average of three requests per second per integration
+NOTION_REQUESTS_PER_SECOND = 3
 
 
 class NotionSync:
     """Sync data from mlsync to Notion.
 
     Args:
-        notion_api (NotionAPI): The Notion API object.
+        notion_token (str): The Notion token.
         root_page_id (str): The root page id
+        report_format (dict): The report format
+        requests_per_second (float): Maximum sustained request rate to Notion, None for no limit (Optional)
+        base_url (str): Root URL of the Notion API, e.g. a local NotionServer (Optional)
     """
 
-    def __init__(self, notion_token: str, root_page_id: str, report_format: dict):
+    def __init__(
+        self,
+        notion_token: str,
+        root_page_id: str,
+        report_format: dict,
+        requests_per_second: float = NOTION_REQUESTS_PER_SECOND,
+        base_url: str = None,
+    ):
         """Initialize the NotionSync object"""
         # Instantiate Notion API
-        self.notion_api = NotionAPI(notion_token)
+        self.notion_api = NotionAPI(notion_token, requests_per_second=requests_per_second, base_url=base_url)
         self.root_page_id = root_page_id
         self.format = report_format
         assert self.notion_api.testPageAccess(
@@ -23,14 +52,47 @@ class NotionSync:
         self.notion_formatter = NotionFormatter(notion_api=self.notion_api, report_format=self.format)
         self.notion_state = {}
 
-    def pull(self):
-        """Fetch the current state of the Notion page and return report in mlsync format."""
+    @classmethod
+    def from_config(cls, report_format, **kwargs):
+        """Instantiate the consumer from the keyword arguments of the Sync class.
+
+        Args:
+            report_format (dict): The report format
+
+        Keyword Args:
+            notion_token (str): Notion token
+            notion_page_id (str): Notion page ID
+            notion_base_url (str): Root URL of the Notion API (Optional)
+
+        Raises:
+            ValueError: If notion_token or notion_page_id is not provided
+        """
+        # Make sure notion_token and notion_page_id are provided
+        if "notion_token" not in kwargs or "notion_page_id" not in kwargs:
+            raise ValueError("notion_token and notion_page_id are required for notion destination")
+        return cls(
+            notion_token=kwargs["notion_token"],
+            root_page_id=kwargs["notion_page_id"],
+            report_format=report_format,
+            base_url=kwargs.get("notion_base_url"),
+        )
+
+    def pull(self, full=False):
+        """Fetch the current state of the Notion page and return report in mlsync format.
+
+        Only the pages edited since the last pull are read from Notion, unless a full pull is requested.
+
+        Args:
+            full (bool): Read all the pages instead of the pages edited since the last pull.
+        """
 
         # Get all the current databases
         databases = self.notion_api.getAllDatabases()
 
         # Convert to mlsync format
-        report, state = self.notion_formatter.format_in(notion_report=databases, root_page_id=self.root_page_id)
+        report, state = self.notion_formatter.format_in(
+            notion_report=databases, root_page_id=self.root_page_id, full=full
+        )
 
         # Update notion state
         self.notion_state = state
@@ -45,8 +107,18 @@ class NotionSync:
             command (str): The command to execute, It can be "new", "create", "update" or "delete"
             diff_report (dict): The diff report describing the changes to be made.
         """
-        # Convert to notion format
-        notion_report = self.notion_formatter.format_out(report)
+        # Convert to notion format. Only the experiments and runs in the diff report need to be rendered, and
+        # deleting entries does not need the Notion format at all.
+        if command == "new":
+            with STAGE_DURATION.time(stage="format_out"):
+                notion_report = self.notion_formatter.format_out(report)
+        elif command in ("create", "update") and diff_report is not None:
+            with STAGE_DURATION.time(stage="format_out"):
+                notion_report = self.notion_formatter.format_out(report, diff_report=diff_report)
+        else:
+            notion_report = {}
+            if diff_report is not None:
+                self.notion_formatter.prune(diff_report)
         # Create new set of reports
         if command == "new":
             # Create new tables for all the experiments
@@ -65,6 +137,7 @@ class NotionSync:
                 # Create rows for each run
                 for run_uid, run in experiment["rows"].items():
                     page_id = self.notion_api.addPageToDatabase(database_id, run)["id"]
+                    RUNS.inc(action="created")
                     # Add to notion state
                     self.notion_state[experiment_name]["pages"][run_uid] = {"page_id": page_id}
         # Create specific set of experiments and runs
@@ -87,6 +160,7 @@ class NotionSync:
                 # Create rows for each run
                 for run_uid, run in notion_report[experiment_name]["rows"].items():
                     page_id = self.notion_api.addPageToDatabase(database_id, run)["id"]
+                    RUNS.inc(action="created")
                     # Add to notion state
                     self.notion_state[experiment_name]["pages"][run_uid] = {"page_id": page_id}
 
@@ -115,6 +189,7 @@ class NotionSync:
                 for run_uid in diff_report["updated"][experiment_name]["new"]:
                     run = notion_report[experiment_name]["rows"][run_uid]
                     page_id = self.notion_api.addPageToDatabase(database_id, run)["id"]
+                    RUNS.inc(action="created")
                     # Add to notion state
                     self.notion_state[experiment_name]["pages"][run_uid] = {"page_id": page_id}
                 # Delete old rows
@@ -122,14 +197,17 @@ class NotionSync:
                     page_id = self.notion_state[experiment_name]["pages"][run_uid]["page_id"]
                     # Delete from notion state
                     del self.notion_state[experiment_name]["pages"][run_uid]
+                    self.notion_formatter.forget_page(database_id, page_id)
                     # Delete from notion
                     self.notion_api.deletePageFromDatabase(database_id, page_id, properties={})
+                    RUNS.inc(action="archived")
                 # Update existing rows
                 for run_uid in diff_report["updated"][experiment_name]["updated"]:
                     run = notion_report[experiment_name]["rows"][run_uid]
                     page_id = self.notion_state[experiment_name]["pages"][run_uid]["page_id"]
                     # Update notion
                     self.notion_api.updatePageInDatabase(database_id, page_id, properties=run)
+                    RUNS.inc(action="updated")
 
         # Delete existing set of reports
         elif command == "delete":
@@ -143,11 +221,286 @@ class NotionSync:
                     page_id = self.notion_state[experiment_name]["pages"][run_uid]["page_id"]
                     # Delete from notion state
                     del self.notion_state[experiment_name]["pages"][run_uid]
+                    self.notion_formatter.forget_page(database_id, page_id)
                     # Delete from notion
                     self.notion_api.deletePageFromDatabase(database_id, page_id, properties=None)
+                    RUNS.inc(action="archived")
                 # Delete database
                 # NOTE: Notion does not support removing the database. Hence only removing entries
 
         else:
             sys.exit("Command not recognized.")
         return self.notion_state
+
+    def release(self, experiment_name):
+        """Drop what is cached for an experiment, once a streaming sync pushed it.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+        """
+        database_id = self.notion_state.get(experiment_name, {}).get("database_id")
+        self.notion_formatter.release(experiment_name, database_id)
+
+    def update_schema(self, report_format, report, schema_diff):
+        """Apply a change of the report format to the existing databases, without a full re-sync.
+
+        Each database gets one update renaming, adding, retyping and removing its properties, then only the
+        added and retyped properties are written to the existing pages.
+
+        Args:
+            report_format (dict): The new report format
+            report (dict): MLSync report, in the new report format
+            schema_diff (dict): The column changes, see mlsync.utils.report_format.diff_report_format
+        """
+        self.format = report_format
+        self.notion_formatter.report_format = report_format
+        # Cached rows and pages use the old property names
+        self.notion_formatter.clear()
+        with STAGE_DURATION.time(stage="format_out"):
+            notion_report = self.notion_formatter.format_out(report)
+        # Name of the properties in Notion before the update
+        notion_names = {alias_new: alias_old for alias_old, alias_new in schema_diff["renamed"].items()}
+        # The title property cannot change its type
+        backfilled = [alias for alias in schema_diff["added"] + schema_diff["changed"] if alias != "Name"]
+
+        for experiment_name, experiment_state in self.notion_state.items():
+            if experiment_name not in notion_report:
+                continue
+            database_id = experiment_state["database_id"]
+            experiment = notion_report[experiment_name]
+            current_properties = self.notion_api.getDatabase(database_id)["properties"]
+
+            # 1. Update the properties of the database
+            properties = {}
+            for alias_old, alias_new in schema_diff["renamed"].items():
+                if alias_old in current_properties:
+                    properties[alias_old] = {"name": alias_new}
+            for alias in schema_diff["removed"]:
+                if alias in current_properties:
+                    properties[alias] = None
+            for alias in backfilled:
+                if alias in experiment["properties"]:
+                    name = notion_names.get(alias, alias)
+                    properties[name] = {**properties.get(name, {}), **experiment["properties"][alias]}
+            if properties:
+                self.notion_api.updateDatabase(database_id, properties)
+
+            # 2. Backfill the added and retyped properties of the existing pages
+            for run_uid, page in experiment_state["pages"].items():
+                run = experiment["rows"].get(run_uid, {})
+                run_properties = {alias: run[alias] for alias in backfilled if alias in run}
+                if run_properties:
+                    self.notion_api.updatePageInDatabase(database_id, page["page_id"], properties=run_properties)
+                    RUNS.inc(action="updated")
+        return self.notion_state
+
+    def checkpoint_key(self, report):
+        """What a backfill checkpoint belongs to: the root page and the report format."""
+        return {"root_page_id": self.root_page_id, "format": self.format.get("digest")}
+
+    def read_checkpoint(self, checkpoint_path, report):
+        """Read the Notion state of an interrupted backfill: the last snapshot, then the creates logged since.
+
+        Checkpoints of another root page, report format or report (experiments that are not in the report) are
+        ignored.
+
+        Args:
+            checkpoint_path (str): Path to the JSON checkpoint file, the creates are logged to <path>.log
+            report (dict): MLSync report
+
+        Returns:
+            dict: The Notion state, None if there is no usable checkpoint.
+        """
+        state, since = None, None
+        if os.path.isfile(checkpoint_path):
+            with open(checkpoint_path, "r") as f:
+                checkpoint = json.load(f)
+            if checkpoint.get("key") == self.checkpoint_key(report):
+                state, since = checkpoint["state"], checkpoint.get("time")
+        elif os.path.isfile(checkpoint_path + ".log"):
+            state = {}
+        if state is None:
+            return None
+        if os.path.isfile(checkpoint_path + ".log"):
+            with open(checkpoint_path + ".log", "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Last line of a create that was interrupted
+                        continue
+                    since = entry.get("time", since)
+                    if entry.get("key") is not None:
+                        if entry["key"] != self.checkpoint_key(report):
+                            return None
+                    elif "database_id" in entry:
+                        state[entry["experiment"]] = {"database_id": entry["database_id"], "pages": {}}
+                    else:
+                        state[entry["experiment"]]["pages"][entry["uid"]] = {"page_id": entry["page_id"]}
+        if not set(state) <= set(report):
+            return None
+        self.reconcile_checkpoint(state, since)
+        return state
+
+    def reconcile_checkpoint(self, state, since):
+        """Add the databases and pages created after the last entry of a checkpoint to the Notion state.
+
+        A backfill interrupted between a create and its log entry would otherwise create them again on resume.
+
+        Args:
+            state (dict): The Notion state of the checkpoint, updated.
+            since (str): Time of the last entry of the checkpoint (ISO 8601), None to read all the pages.
+        """
+        for database in self.notion_api.getAllDatabases()["results"]:
+            if database["parent"].get("page_id") == self.root_page_id and database["title"]:
+                database_name = database["title"][0]["text"]["content"]
+                state.setdefault(database_name, {"database_id": database["id"], "pages": {}})
+        page_filter = None
+        if since is not None:
+            # Notion rounds the timestamps to the minute, and the clocks may differ
+            since = datetime.fromisoformat(since) - CHECKPOINT_CLOCK_MARGIN
+            page_filter = {"timestamp": "created_time", "created_time": {"on_or_after": since.isoformat()}}
+        for experiment_state in state.values():
+            pages = self.notion_api.readDatabase(experiment_state["database_id"], filter=page_filter)
+            for page in pages["results"] if pages else []:
+                page_uid = self.notion_formatter.read_notion_property(page["properties"]["uid"])
+                experiment_state["pages"].setdefault(page_uid, {"page_id": page["id"]})
+
+    def remove_checkpoint(self, checkpoint_path):
+        """Remove the checkpoint of a backfill and its log."""
+        for path in (checkpoint_path, checkpoint_path + ".log"):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def backfill(self, report, checkpoint_path=None, workers=4):
+        """Create all the databases and pages of the report concurrently, resuming from a checkpoint.
+
+        All the creates are planned up front, then executed by a pool of workers bounded by the rate limit of the
+        Notion API. Each database and page is appended to the log of the checkpoint (and synced to disk) as soon as it
+        is created, and the Notion state is snapshotted every few seconds, so an interrupted backfill resumes where it
+        stopped without creating pages twice. The checkpoint is removed when the backfill completes.
+
+        Args:
+            report (dict): MLSync report
+            checkpoint_path (str): Path to the JSON checkpoint file (Optional)
+            workers (int): Number of concurrent requests to Notion.
+        """
+        # Resume from the checkpoint
+        if checkpoint_path:
+            state = self.read_checkpoint(checkpoint_path, report)
+            if state is not None:
+                self.notion_state = state
+                print(f"Resuming backfill from {checkpoint_path}")
+            else:
+                # Stale checkpoint of another backfill
+                self.remove_checkpoint(checkpoint_path)
+
+        # Convert to notion format
+        notion_report = self.notion_formatter.format_out(report)
+
+        # Plan the creates: databases missing from the state, then pages missing from the state
+        databases_plan = [
+            experiment_name
+            for experiment_name, experiment in notion_report.items()
+            if experiment["properties"] and experiment_name not in self.notion_state
+        ]
+        pages_plan = {
+            experiment_name: [
+                run_uid
+                for run_uid in experiment["rows"]
+                if run_uid not in self.notion_state.get(experiment_name, {}).get("pages", {})
+            ]
+            for experiment_name, experiment in notion_report.items()
+            if experiment["properties"]
+        }
+        total = len(databases_plan) + sum(len(run_uids) for run_uids in pages_plan.values())
+        if not total:
+            if checkpoint_path:
+                self.remove_checkpoint(checkpoint_path)
+            return self.notion_state
+        progress = Progress(total, "Backfill")
+        lock = threading.Lock()
+        last_checkpoint = [time.monotonic()]
+        log = None
+        if checkpoint_path:
+            log = open(checkpoint_path + ".log", "a")
+            log.write(json.dumps({"key": self.checkpoint_key(report)}) + "\n")
+
+        def log_create(entry):
+            # Append a create to the log, durably. Call with the lock held.
+            if log is None:
+                return
+            log.write(json.dumps(entry) + "\n")
+            log.flush()
+            os.fsync(log.fileno())
+
+        def checkpoint(force=False):
+            # Snapshot the state atomically and truncate the log, at most every few seconds unless forced. Call with
+            # the lock held.
+            if log is None or not (force or time.monotonic() - last_checkpoint[0] > 5):
+                return
+            with open(checkpoint_path + ".tmp", "w") as f:
+                json.dump({"key": self.checkpoint_key(report), "time": checkpoint_time(), "state": self.notion_state}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(checkpoint_path + ".tmp", checkpoint_path)
+            # Creates logged before the snapshot are in it
+            log.truncate(0)
+            log.seek(0)
+            log.write(json.dumps({"key": self.checkpoint_key(report)}) + "\n")
+            log.flush()
+            last_checkpoint[0] = time.monotonic()
+
+        def create_database(experiment_name):
+            database_id = self.notion_api.createDatabase(
+                experiment_name, notion_report[experiment_name]["properties"], self.root_page_id
+            )
+            with lock:
+                self.notion_state[experiment_name] = {"database_id": database_id, "pages": {}}
+                log_create({"experiment": experiment_name, "database_id": database_id, "time": checkpoint_time()})
+            progress.update()
+
+        def create_page(experiment_name, run_uid):
+            database_id = self.notion_state[experiment_name]["database_id"]
+            page_id = self.notion_api.addPageToDatabase(database_id, notion_report[experiment_name]["rows"][run_uid])["id"]
+            RUNS.inc(action="created")
+            with lock:
+                self.notion_state[experiment_name]["pages"][run_uid] = {"page_id": page_id}
+                log_create({"experiment": experiment_name, "uid": run_uid, "page_id": page_id, "time": checkpoint_time()})
+                pending[experiment_name] -= 1
+                QUEUE_DEPTH.set(sum(pending.values()), queue="backfill")
+                checkpoint()
+            progress.update()
+
+        pending = {experiment_name: len(run_uids) for experiment_name, run_uids in pages_plan.items()}
+        futures = []
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                try:
+                    # Databases are needed before their pages can be created
+                    futures = [executor.submit(create_database, experiment_name) for experiment_name in databases_plan]
+                    for future in as_completed(futures):
+                        future.result()
+                    futures = [
+                        executor.submit(create_page, experiment_name, run_uid)
+                        for experiment_name, run_uids in pages_plan.items()
+                        for run_uid in run_uids
+                    ]
+                    for future in as_completed(futures):
+                        future.result()
+                finally:
+                    # Stop the pending creates, the running ones are logged
+                    for future in futures:
+                        future.cancel()
+        except BaseException:
+            # Do not lose the progress made so far
+            if log is not None:
+                with lock:
+                    checkpoint(force=True)
+                    log.close()
+            raise
+        if log is not None:
+            log.close()
+            self.remove_checkpoint(checkpoint_path)
+
+        return self.notion_state
@@ -0,0 +1,446 @@
+import os
+import sys
+import json
+import time
+import shutil
+from urllib.parse import quote, unquote
+from mlsync.utils.metrics import STAGE_DURATION, RUNS
+from mlsync.utils.utils import CONVERSION_FAILURES
+
+# PyArrow is optional, the Parquet consumer is only usable when it is installed
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Default root directory of the dataset, relative to the working directory
+PARQUET_PATH = "mlsync-parquet"
+# An experiment is compacted when it has this many delta files, or when it has deltas older than the interval
+COMPACTION_DELTAS = 32
+COMPACTION_INTERVAL = 3600
+# Columns of the files that are not aliases: the uid of the run, the operation (upsert or delete), the time of
+# the sync that wrote the row and the metadata of its cells that differ from their column (JSON)
+ID_COLUMN = "_id"
+OP_COLUMN = "_op"
+SYNCED_AT_COLUMN = "_synced_at"
+CELLS_COLUMN = "_cells"
+# Key of the schema metadata holding the experiment and the metadata of the cells of each column
+METADATA_KEY = b"mlsync"
+# Arrow types of the report types (the type of the matched cells, or the Python type of the unmatched cells),
+# other types are stored as strings
+ARROW_TYPES = {
+    "int": "int64",
+    "integer": "int64",
+    "float": "float64",
+    "bool": "bool_",
+    str(int): "int64",
+    str(float): "float64",
+    str(bool): "bool_",
+}
+
+
+def require_pyarrow():
+    """Raise if PyArrow, needed by the Parquet consumer, is not installed."""
+    if pa is None:
+        raise ImportError("The Parquet consumer requires pyarrow (pip install pyarrow)")
+
+
+def arrow_type(val_type):
+    """Arrow type of the values of a report type."""
+    return getattr(pa, ARROW_TYPES.get(val_type, "string"))()
+
+
+def arrow_array(values, val_type):
+    """Convert the values of a column to an Arrow array of the type of the column.
+
+    Values that do not fit the type (e.g. that could not be typified by the producer) are stored as nulls and
+    reported with the conversion failures of the sync cycle.
+
+    Args:
+        values (list): The values, None for the runs without a value.
+        val_type (str): The report type of the column.
+    """
+    type_ = arrow_type(val_type)
+    if type_ == pa.string():
+        values = [value if value is None or isinstance(value, str) else str(value) for value in values]
+    try:
+        return pa.array(values, type=type_)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+        pass
+    converted = []
+    for value in values:
+        try:
+            pa.scalar(value, type=type_)
+            converted.append(value)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError) as e:
+            CONVERSION_FAILURES.add(val_type, type(e).__name__, value)
+            converted.append(None)
+    return pa.array(converted, type=type_)
+
+
+def cell_template(cell):
+    """Metadata of a cell, as stored for its column: without its value and history, None for a bare value."""
+    if not isinstance(cell, dict):
+        return None
+    template = {**cell, "value": None}
+    if "data" in template:
+        # Histories are not stored
+        template["data"] = None
+    return template
+
+
+def concat_tables(tables):
+    """Concatenate tables with different columns (written before and after an alias appeared)."""
+    try:
+        return pa.concat_tables(tables, promote_options="default")
+    except TypeError:
+        # PyArrow < 14
+        return pa.concat_tables(tables, promote=True)
+
+
+class ParquetSync:
+    """Sync data from mlsync to a Parquet dataset, e.g. to analyze the runs with pandas or DuckDB.
+
+    The dataset is partitioned by experiment and date (hive style: experiment=<name>/date=<YYYY-MM-DD>/), with one
+    column per alias. Each sync appends the new and updated runs (and tombstones of the deleted runs) of an
+    experiment as a small delta file, in the partition of the day of the sync. Deltas are merged into larger files,
+    keeping the latest version of each run, once an experiment has compaction_deltas of them or its oldest delta is
+    compaction_interval seconds old.
+
+    The metadata of the cells (type, tag, key, ...) is stored once per column, from the first cell of the alias, and
+    the metadata of the cells that differ from it (e.g. a fallback Name) in the _cells column as JSON, so that pull
+    rebuilds the report as is, but for the histories. Before a compaction, a run can have several versions: the
+    latest by _synced_at is the current one, unless its _op is delete. The columns follow the report format: new
+    aliases are added to the files written after they appear, and a change of the report format rewrites the dataset.
+
+    Args:
+        path (str): Root directory of the dataset.
+        report_format (dict): The report format
+        compaction_deltas (int): Number of delta files of an experiment triggering a compaction.
+        compaction_interval (float): Age in seconds of the oldest delta of an experiment triggering a compaction.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        report_format: dict,
+        compaction_deltas: int = COMPACTION_DELTAS,
+        compaction_interval: float = COMPACTION_INTERVAL,
+    ):
+        """Initialize the ParquetSync object"""
+        require_pyarrow()
+        self.path = path
+        self.format = report_format
+        self.compaction_deltas = compaction_deltas
+        self.compaction_interval = compaction_interval
+        os.makedirs(path, exist_ok=True)
+        # Experiment and metadata of the cells of each column: {experiment_name: {"experiment", "columns"}}
+        self.metadata = {}
+        # Delta files of each experiment since its last compaction, and the time of the oldest one
+        self.deltas = {}
+        self.deltas_since = {}
+        # Files written in the same millisecond get a sequence number
+        self.sequence = 0
+        for experiment_name in self.experiment_names():
+            files = self.files(experiment_name)
+            if files:
+                self.metadata[experiment_name] = json.loads(pq.read_schema(files[-1]).metadata[METADATA_KEY])
+                self.deltas[experiment_name] = sum(os.path.basename(f).startswith("delta-") for f in files)
+                self.deltas_since[experiment_name] = time.time()
+
+    @classmethod
+    def from_config(cls, report_format, **kwargs):
+        """Instantiate the consumer from the keyword arguments of the Sync class.
+
+        Args:
+            report_format (dict): The report format
+
+        Keyword Args:
+            parquet_path (str): Root directory of the dataset (default: mlsync-parquet)
+            parquet_compaction_deltas (int): Number of delta files of an experiment triggering a compaction (Optional)
+            parquet_compaction_interval (float): Age in seconds of the oldest delta triggering a compaction (Optional)
+        """
+        return cls(
+            path=kwargs.get("parquet_path") or PARQUET_PATH,
+            report_format=report_format,
+            compaction_deltas=kwargs.get("parquet_compaction_deltas") or COMPACTION_DELTAS,
+            compaction_interval=kwargs.get("parquet_compaction_interval") or COMPACTION_INTERVAL,
+        )
+
+    def experiment_path(self, experiment_name):
+        """Directory of the partition of an experiment."""
+        return os.path.join(self.path, "experiment=" + quote(experiment_name, safe=""))
+
+    def experiment_names(self):
+        """Names of the experiments in the dataset."""
+        return [
+            unquote(entry[len("experiment="):])
+            for entry in sorted(os.listdir(self.path))
+            if entry.startswith("experiment=")
+        ]
+
+    def files(self, experiment_name):
+        """Files of an experiment in the order they were written."""
+        experiment_path = self.experiment_path(experiment_name)
+        if not os.path.isdir(experiment_path):
+            return []
+        files = [
+            os.path.join(experiment_path, date, name)
+            for date in os.listdir(experiment_path)
+            if os.path.isdir(os.path.join(experiment_path, date))
+            for name in os.listdir(os.path.join(experiment_path, date))
+            if name.endswith(".parquet") and not name.startswith(".")
+        ]
+        # Names are <kind>-<milliseconds>-<sequence>.parquet
+        return sorted(files, key=lambda f: os.path.basename(f).split("-", 1)[1])
+
+    def read_experiment(self, experiment_name):
+        """Read the current version of the runs of an experiment.
+
+        Returns:
+            pyarrow.Table: The latest version of each run that is not deleted, None if the experiment has no files.
+        """
+        files = self.files(experiment_name)
+        if not files:
+            return None
+        # Date partitions are in the paths, not in the files
+        table = concat_tables([pq.read_table(f, partitioning=None) for f in files])
+        latest = {}
+        for index, run_id in enumerate(table.column(ID_COLUMN).to_pylist()):
+            latest[run_id] = index
+        ops = table.column(OP_COLUMN).to_pylist()
+        return table.take([index for index in latest.values() if ops[index] == "upsert"])
+
+    def pull(self, full=False):
+        """Read the dataset and return the report in mlsync format.
+
+        Args:
+            full (bool): Unused, the dataset is always read in full.
+        """
+        report = {}
+        for experiment_name, metadata in self.metadata.items():
+            table = self.read_experiment(experiment_name)
+            runs = {}
+            if table is not None:
+                columns = [
+                    # Columns of bare values have no metadata
+                    (alias, template or None, table.column(alias).to_pylist())
+                    for alias, template in metadata["columns"].items()
+                    if alias in table.column_names
+                ]
+                # Files written before the _cells column have none
+                cells = (
+                    table.column(CELLS_COLUMN).to_pylist()
+                    if CELLS_COLUMN in table.column_names
+                    else [None] * table.num_rows
+                )
+                for index, run_id in enumerate(table.column(ID_COLUMN).to_pylist()):
+                    differing = {} if cells[index] is None else json.loads(cells[index])
+                    run = {}
+                    for alias, template, values in columns:
+                        if values[index] is None:
+                            continue
+                        template = differing.get(alias, template)
+                        run[alias] = values[index] if template is None else {**template, "value": values[index]}
+                    runs[run_id] = run
+            report[experiment_name] = {**metadata["experiment"], "runs": runs}
+        return report
+
+    def push(self, report, command="new", diff_report=None):
+        """Takes current MLSync report and syncs it with the dataset.
+
+        Args:
+            report (dict): MLSync report
+            command (str): The command to execute, It can be "new", "create", "update" or "delete"
+            diff_report (dict): The diff report describing the changes to be made.
+        """
+        now = time.time()
+        # Create new set of reports
+        if command == "new":
+            for experiment_name, experiment in report.items():
+                self.create_experiment(experiment_name, experiment, now)
+        # Create specific set of experiments and runs
+        elif command == "create":
+            assert diff_report is not None, "diff_report is required for create command"
+            for experiment_name in diff_report["new"]:
+                self.create_experiment(experiment_name, report[experiment_name], now)
+        # Update existing set of reports
+        elif command == "update":
+            assert diff_report is not None, "diff_report is required for update command"
+            for experiment_name, runs_diff in diff_report["updated"].items():
+                runs = report[experiment_name]["runs"]
+                self.write_delta(
+                    experiment_name,
+                    report[experiment_name],
+                    [(run_id, runs[run_id]) for run_id in runs_diff["new"] + runs_diff["updated"]],
+                    runs_diff["deleted"],
+                    now,
+                )
+                RUNS.inc(len(runs_diff["new"]), action="created")
+                RUNS.inc(len(runs_diff["updated"]), action="updated")
+                RUNS.inc(len(runs_diff["deleted"]), action="archived")
+        # Delete existing set of reports
+        elif command == "delete":
+            assert diff_report is not None, "diff_report is required for delete command"
+            for experiment_name, runs_diff in diff_report["deleted"].items():
+                self.drop_experiment(experiment_name)
+                RUNS.inc(len(runs_diff["deleted"]), action="archived")
+        else:
+            sys.exit("Command not recognized.")
+        self.compact_due(now)
+
+    def update_schema(self, report_format, report, schema_diff):
+        """Apply a change of the report format: the dataset is rewritten in the new report format.
+
+        Args:
+            report_format (dict): The new report format
+            report (dict): MLSync report, in the new report format
+            schema_diff (dict): The column changes, see mlsync.utils.report_format.diff_report_format
+        """
+        self.format = report_format
+        now = time.time()
+        for experiment_name in list(self.metadata):
+            if experiment_name in report:
+                self.create_experiment(experiment_name, report[experiment_name], now)
+
+    def create_experiment(self, experiment_name, experiment, now):
+        """Write an experiment from scratch, replacing its files if any.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+            experiment (dict): The experiment in the mlsync report.
+            now (float): Time of the sync.
+        """
+        self.drop_experiment(experiment_name)
+        runs = list(experiment["runs"].items())
+        self.write_delta(experiment_name, experiment, runs, [], now, kind="part")
+        RUNS.inc(len(runs), action="created")
+
+    def drop_experiment(self, experiment_name):
+        """Remove the files of an experiment, if any."""
+        shutil.rmtree(self.experiment_path(experiment_name), ignore_errors=True)
+        self.metadata.pop(experiment_name, None)
+        self.deltas.pop(experiment_name, None)
+        self.deltas_since.pop(experiment_name, None)
+
+    def write_delta(self, experiment_name, experiment, runs, deleted, now, kind="delta"):
+        """Write the upserted and deleted runs of an experiment to a new file.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+            experiment (dict): The experiment in the mlsync report.
+            runs (list): The new and updated runs as (run_id, run)
+            deleted (list): The uids of the deleted runs.
+            now (float): Time of the sync, which gives the date partition.
+            kind (str): delta for the changes of a sync, part for the full runs of an experiment.
+        """
+        if not runs and not deleted and experiment_name in self.metadata:
+            return
+        metadata = self.metadata.setdefault(
+            experiment_name,
+            {"experiment": {key: value for key, value in experiment.items() if key != "runs"}, "columns": {}},
+        )
+        columns = metadata["columns"]
+        # Aliases that appeared, with the metadata of their first cell
+        for _, run in runs:
+            if run.keys() <= columns.keys():
+                continue
+            for alias, cell in run.items():
+                if alias not in columns:
+                    columns[alias] = cell_template(cell) or {}
+
+        with STAGE_DURATION.time(stage="format_out"):
+            run_ids = [run_id for run_id, _ in runs] + list(deleted)
+            arrays = {
+                ID_COLUMN: pa.array(run_ids, type=pa.string()),
+                OP_COLUMN: pa.array(["upsert"] * len(runs) + ["delete"] * len(deleted), type=pa.string()),
+                SYNCED_AT_COLUMN: pa.array([int(now * 1000)] * len(run_ids), type=pa.timestamp("ms", tz="UTC")),
+            }
+            # Metadata of the cells that differ from their column, by row
+            differing = [None] * len(runs)
+            for alias, template in columns.items():
+                template = template or None
+                values = []
+                for index, (_, run) in enumerate(runs):
+                    cell = run.get(alias)
+                    values.append(cell.get("value") if isinstance(cell, dict) else cell)
+                    if cell is None:
+                        continue
+                    cell_metadata = cell_template(cell)
+                    if cell_metadata != template:
+                        if differing[index] is None:
+                            differing[index] = {}
+                        differing[index][alias] = cell_metadata
+                arrays[alias] = arrow_array(values + [None] * len(deleted), (template or {}).get("type"))
+            arrays[CELLS_COLUMN] = pa.array(
+                [None if cells is None else json.dumps(cells, default=str) for cells in differing]
+                + [None] * len(deleted),
+                type=pa.string(),
+            )
+            table = pa.table(arrays).replace_schema_metadata({METADATA_KEY: json.dumps(metadata, default=str)})
+
+        date_path = os.path.join(
+            self.experiment_path(experiment_name), "date=" + time.strftime("%Y-%m-%d", time.gmtime(now))
+        )
+        self.write_file(table, date_path, kind, now)
+        if kind == "delta":
+            self.deltas[experiment_name] = self.deltas.get(experiment_name, 0) + 1
+            self.deltas_since.setdefault(experiment_name, now)
+
+    def write_file(self, table, directory, kind, now):
+        """Write a table to a new file of a directory, atomically: readers never see a partial file."""
+        os.makedirs(directory, exist_ok=True)
+        self.sequence += 1
+        name = f"{kind}-{int(now * 1000):013d}-{self.sequence:06d}.parquet"
+        # Hidden files are ignored by the readers of the dataset
+        pq.write_table(table, os.path.join(directory, "." + name))
+        os.replace(os.path.join(directory, "." + name), os.path.join(directory, name))
+
+    def compact_due(self, now):
+        """Compact the experiments with enough deltas, or with deltas older than the compaction interval."""
+        for experiment_name, deltas in list(self.deltas.items()):
+            if deltas >= self.compaction_deltas or (
+                deltas > 1 and now - self.deltas_since[experiment_name] >= self.compaction_interval
+            ):
+                self.compact(experiment_name, now)
+
+    def compact(self, experiment_name, now=None):
+        """Merge the files of an experiment into one file per date partition, with the latest version of each run.
+
+        Runs stay in the partition of the date they were last written. The merged files are written before the
+        deltas are removed, so readers may briefly see both (and take the latest version of the runs).
+
+        Args:
+            experiment_name (str): The name of the experiment.
+            now (float): Time of the compaction (default: now)
+        """
+        now = time.time() if now is None else now
+        files = self.files(experiment_name)
+        table = self.read_experiment(experiment_name)
+        if table is None:
+            return
+        table = table.replace_schema_metadata(
+            {METADATA_KEY: json.dumps(self.metadata[experiment_name], default=str)}
+        )
+        # Date partition of each run
+        dates = [
+            time.strftime("%Y-%m-%d", time.gmtime(synced_at.timestamp()))
+            for synced_at in table.column(SYNCED_AT_COLUMN).to_pylist()
+        ]
+        partitions = {}
+        for index, date in enumerate(dates):
+            partitions.setdefault(date, []).append(index)
+        if not partitions:
+            # All the runs were deleted, an empty file keeps the experiment
+            partitions[time.strftime("%Y-%m-%d", time.gmtime(now))] = []
+        experiment_path = self.experiment_path(experiment_name)
+        for date, indices in partitions.items():
+            self.write_file(table.take(indices), os.path.join(experiment_path, "date=" + date), "part", now)
+        for f in files:
+            os.remove(f)
+        for date in os.listdir(experiment_path):
+            if not os.listdir(os.path.join(experiment_path, date)):
+                os.rmdir(os.path.join(experiment_path, date))
+        self.deltas[experiment_name] = 0
+        self.deltas_since.pop(experiment_name, None)
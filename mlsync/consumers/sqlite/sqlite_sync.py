@@ -0,0 +1,386 @@
+import sys
+import json
+import sqlite3
+import threading
+from array import array
+from contextlib import contextmanager
+from mlsync.utils.metrics import STAGE_DURATION, RUNS
+
+# Default path of the database, relative to the working directory
+SQLITE_PATH = "mlsync.db"
+# Tables of mlsync: the experiments and the metadata of the columns of their tables
+EXPERIMENTS_TABLE = "mlsync_experiments"
+COLUMNS_TABLE = "mlsync_columns"
+# Columns of the table of an experiment that are not aliases: the uid of the run, and the cells that cannot be
+# rebuilt from the value and the metadata of their column
+ID_COLUMN = "_id"
+CELLS_COLUMN = "_cells"
+# Values stored as is in the columns, other values are stored as JSON
+SCALAR_TYPES = (str, int, float, bool)
+# Types of the columns of booleans, stored as 0 and 1 by SQLite (the type of the matched cells, or the Python type of
+# the unmatched cells)
+BOOL_TYPES = ("bool", str(bool))
+# Key of the JSON objects holding a typed array, e.g. of a metric history
+ARRAY_KEY = "__array__"
+
+
+def quote(identifier):
+    """Quote an SQL identifier, e.g. an experiment name or an alias."""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def json_default(value):
+    """Serialize what JSON does not support, e.g. the typed arrays of the metric histories.
+
+    Typed arrays (and the memory views of the history store) keep their type code, see json_object.
+    """
+    if isinstance(value, array):
+        return {ARRAY_KEY: value.typecode, "items": value.tolist()}
+    if isinstance(value, memoryview):
+        return {ARRAY_KEY: value.format, "items": value.tolist()}
+    try:
+        return list(value)
+    except TypeError:
+        return str(value)
+
+
+def json_object(obj):
+    """Rebuild the typed arrays serialized by json_default."""
+    if ARRAY_KEY in obj and obj.keys() == {ARRAY_KEY, "items"}:
+        return array(obj[ARRAY_KEY], obj["items"])
+    return obj
+
+
+class SQLiteSync:
+    """Sync data from mlsync to a local SQLite database.
+
+    Each experiment gets a table named after it (see table_name), with one row per run keyed by the uid of the run,
+    and one column per alias holding the values of the runs. The metadata of the cells (type, tag, key, ...) is
+    stored once per column, so that the report is rebuilt as is by pull. Cells that differ from the metadata of their
+    column (e.g. with a metric history) are stored as JSON in the _cells column, with the typed arrays of the
+    histories tagged with their type code. Booleans are stored as 0 and 1 and read back from the type of the column.
+
+    The database is in WAL mode, so that dashboards can read it while mlsync writes. Each push is a single
+    transaction of bulk upserts and deletes.
+
+    Args:
+        path (str): Path to the database file.
+        report_format (dict): The report format
+    """
+
+    def __init__(self, path: str, report_format: dict):
+        """Initialize the SQLiteSync object"""
+        self.path = path
+        self.format = report_format
+        # Transactions are managed explicitly, see transaction. The sync loop may run in another thread than the
+        # one creating the consumer, the connection is used by one thread at a time.
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Durable at the checkpoints of the WAL, which is enough for a sink that can be re-synced
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.transaction():
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {EXPERIMENTS_TABLE} "
+                "(name TEXT PRIMARY KEY, table_name TEXT UNIQUE COLLATE NOCASE, experiment TEXT)"
+            )
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {COLUMNS_TABLE} "
+                "(experiment TEXT, name TEXT, template TEXT, PRIMARY KEY (experiment, name))"
+            )
+        # Table of each experiment: {experiment_name: table_name}
+        self.tables = dict(self.connection.execute(f"SELECT name, table_name FROM {EXPERIMENTS_TABLE}"))
+        # Metadata of the columns of each experiment table: {experiment_name: {column: template}}
+        self.columns = {}
+        for experiment_name, column, template in self.connection.execute(
+            f"SELECT experiment, name, template FROM {COLUMNS_TABLE} ORDER BY rowid"
+        ):
+            self.columns.setdefault(experiment_name, {})[column] = json.loads(template)
+
+    @classmethod
+    def from_config(cls, report_format, **kwargs):
+        """Instantiate the consumer from the keyword arguments of the Sync class.
+
+        Args:
+            report_format (dict): The report format
+
+        Keyword Args:
+            sqlite_path (str): Path to the database file (default: mlsync.db)
+        """
+        return cls(path=kwargs.get("sqlite_path") or SQLITE_PATH, report_format=report_format)
+
+    @contextmanager
+    def transaction(self):
+        """Run a block of statements in a single transaction, rolled back if the block fails."""
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def pull(self, full=False):
+        """Read the database and return the report in mlsync format.
+
+        Args:
+            full (bool): Unused, the database is always read in full.
+        """
+        report = {}
+        # A single read transaction, consistent with the last push
+        with self.transaction():
+            experiments = self.connection.execute(f"SELECT name, experiment FROM {EXPERIMENTS_TABLE}").fetchall()
+            for experiment_name, experiment in experiments:
+                report[experiment_name] = self.read_experiment(experiment_name, json.loads(experiment))
+        return report
+
+    def read_experiment(self, experiment_name, metadata):
+        """Read the table of an experiment and return the experiment in mlsync format.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+            metadata (dict): The experiment in the mlsync report, without its runs.
+        """
+        columns = self.columns.get(experiment_name, {})
+        names = list(columns)
+        templates = list(columns.values())
+        runs = {}
+        selected = ", ".join(quote(column) for column in [ID_COLUMN, *names, CELLS_COLUMN])
+        for row in self.connection.execute(f"SELECT {selected} FROM {quote(self.tables[experiment_name])}"):
+            run = {}
+            for column, template, value in zip(names, templates, row[1:-1]):
+                if value is not None:
+                    if template.get("type") in BOOL_TYPES and isinstance(value, int):
+                        value = bool(value)
+                    run[column] = {**template, "value": value}
+            if row[-1] is not None:
+                run.update(json.loads(row[-1], object_hook=json_object))
+            runs[row[0]] = run
+        return {**metadata, "runs": runs}
+
+    def push(self, report, command="new", diff_report=None):
+        """Takes current MLSync report and syncs it with the database.
+
+        Args:
+            report (dict): MLSync report
+            command (str): The command to execute, It can be "new", "create", "update" or "delete"
+            diff_report (dict): The diff report describing the changes to be made.
+        """
+        with self.transaction():
+            # Create new set of reports
+            if command == "new":
+                for experiment_name, experiment in report.items():
+                    self.create_experiment(experiment_name, experiment)
+            # Create specific set of experiments and runs
+            elif command == "create":
+                assert diff_report is not None, "diff_report is required for create command"
+                for experiment_name in diff_report["new"]:
+                    self.create_experiment(experiment_name, report[experiment_name])
+            # Update existing set of reports
+            elif command == "update":
+                assert diff_report is not None, "diff_report is required for update command"
+                for experiment_name, runs_diff in diff_report["updated"].items():
+                    runs = report[experiment_name]["runs"]
+                    self.upsert_runs(experiment_name, runs, runs_diff["new"])
+                    RUNS.inc(len(runs_diff["new"]), action="created")
+                    self.upsert_runs(experiment_name, runs, runs_diff["updated"])
+                    RUNS.inc(len(runs_diff["updated"]), action="updated")
+                    self.connection.executemany(
+                        f"DELETE FROM {quote(self.tables[experiment_name])} WHERE {ID_COLUMN} = ?",
+                        ((run_id,) for run_id in runs_diff["deleted"]),
+                    )
+                    RUNS.inc(len(runs_diff["deleted"]), action="archived")
+            # Delete existing set of reports
+            elif command == "delete":
+                assert diff_report is not None, "diff_report is required for delete command"
+                for experiment_name, runs_diff in diff_report["deleted"].items():
+                    self.drop_experiment(experiment_name)
+                    RUNS.inc(len(runs_diff["deleted"]), action="archived")
+            else:
+                sys.exit("Command not recognized.")
+
+    def backfill(self, report, checkpoint_path=None, workers=4):
+        """Write the whole report at once, in a single transaction.
+
+        An interrupted backfill is rolled back, so there is nothing to resume from.
+
+        Args:
+            report (dict): MLSync report
+            checkpoint_path (str): Unused
+            workers (int): Unused, SQLite has a single writer.
+        """
+        self.push(report, command="new")
+
+    def create_experiment(self, experiment_name, experiment):
+        """Create the table of an experiment, replacing an existing one, and insert its runs.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+            experiment (dict): The experiment in the mlsync report.
+        """
+        self.drop_experiment(experiment_name)
+        table_name = self.table_name(experiment_name)
+        metadata = {key: value for key, value in experiment.items() if key != "runs"}
+        self.connection.execute(
+            f"INSERT INTO {EXPERIMENTS_TABLE} (name, table_name, experiment) VALUES (?, ?, ?)",
+            (experiment_name, table_name, json.dumps(metadata, default=json_default)),
+        )
+        self.connection.execute(
+            f"CREATE TABLE {quote(table_name)} ({ID_COLUMN} TEXT PRIMARY KEY, {CELLS_COLUMN} TEXT)"
+        )
+        self.tables[experiment_name] = table_name
+        self.columns[experiment_name] = {}
+        self.upsert_runs(experiment_name, experiment["runs"])
+        RUNS.inc(len(experiment["runs"]), action="created")
+
+    def drop_experiment(self, experiment_name):
+        """Drop the table of an experiment and its metadata, if any.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+        """
+        table_name = self.tables.pop(experiment_name, None)
+        if table_name is None:
+            return
+        self.connection.execute(f"DROP TABLE IF EXISTS {quote(table_name)}")
+        self.connection.execute(f"DELETE FROM {EXPERIMENTS_TABLE} WHERE name = ?", (experiment_name,))
+        self.connection.execute(f"DELETE FROM {COLUMNS_TABLE} WHERE experiment = ?", (experiment_name,))
+        self.columns.pop(experiment_name, None)
+
+    def table_name(self, experiment_name):
+        """Name of the table of a new experiment: the name of the experiment, made unique.
+
+        Table names are case insensitive in SQLite, e.g. the experiments "MNIST" and "mnist" need two names.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+        """
+        taken = {table_name.lower() for table_name in self.tables.values()} | {
+            EXPERIMENTS_TABLE,
+            COLUMNS_TABLE,
+        }
+        table_name, suffix = experiment_name, 1
+        while table_name.lower() in taken or table_name.lower().startswith("sqlite_"):
+            suffix += 1
+            table_name = f"{experiment_name} ({suffix})"
+        return table_name
+
+    def add_columns(self, experiment_name, runs):
+        """Add the columns of the aliases that are new to the table of an experiment.
+
+        The metadata of a column is taken from the first cell of the alias, without its metric history. The status of
+        the runs is indexed.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+            runs (iterable): The runs.
+        """
+        table_name = self.tables[experiment_name]
+        columns = self.columns[experiment_name]
+        for run in runs:
+            if run.keys() <= columns.keys():
+                continue
+            for column, cell in run.items():
+                if column in columns or column in (ID_COLUMN, CELLS_COLUMN):
+                    continue
+                template = {**cell, "value": None} if isinstance(cell, dict) else {"value": None}
+                if "data" in template:
+                    # Histories are stored with the cells of the runs
+                    template["data"] = None
+                columns[column] = template
+                self.connection.execute(f"ALTER TABLE {quote(table_name)} ADD COLUMN {quote(column)}")
+                self.connection.execute(
+                    f"INSERT INTO {COLUMNS_TABLE} (experiment, name, template) VALUES (?, ?, ?)",
+                    (experiment_name, column, json.dumps(template, default=json_default)),
+                )
+                if template.get("tag") == "info" and template.get("key") == "status":
+                    self.connection.execute(
+                        f"CREATE INDEX IF NOT EXISTS {quote(table_name + ' status')} "
+                        f"ON {quote(table_name)} ({quote(column)})"
+                    )
+
+    def upsert_runs(self, experiment_name, runs, run_ids=None):
+        """Insert or replace runs in the table of an experiment, with a single bulk statement.
+
+        The rows are converted as SQLite consumes them rather than all at once, so that a large diff does not
+        allocate a row per run on top of the report.
+
+        Args:
+            experiment_name (str): The name of the experiment.
+            runs (dict): The runs of the experiment in the mlsync report.
+            run_ids (list): The runs to write (default: all the runs)
+        """
+        run_ids = runs.keys() if run_ids is None else run_ids
+        if not run_ids:
+            return
+        self.add_columns(experiment_name, (runs[run_id] for run_id in run_ids))
+        columns = self.columns[experiment_name]
+        layout = self.row_layout(columns)
+        names = ", ".join(quote(name) for name in [ID_COLUMN, *columns, CELLS_COLUMN])
+        with STAGE_DURATION.time(stage="push"):
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO {quote(self.tables[experiment_name])} ({names}) "
+                f"VALUES ({', '.join('?' * (len(columns) + 2))})",
+                (self.format_row(run_id, runs[run_id], layout) for run_id in run_ids),
+            )
+
+    @staticmethod
+    def format_row(run_id, run, layout):
+        """Convert a run to a row of the table of its experiment.
+
+        Args:
+            run_id (str): The uid of the run.
+            run (dict): The run in the mlsync report.
+            layout (list): The columns of the table, see row_layout.
+
+        Returns:
+            list: The uid, the value of each column, and the cells that cannot be rebuilt from their column (JSON).
+        """
+        row = [run_id]
+        cells = None
+        for column, metadata, size, boolean in layout:
+            cell = run.get(column)
+            if cell is None:
+                row.append(None)
+                continue
+            if isinstance(cell, dict):
+                value = cell.get("value")
+                if isinstance(value, SCALAR_TYPES):
+                    row.append(value)
+                    # A cell is rebuilt from its value and the metadata of its column, unless it differs from them
+                    # or its value would not read back as is (e.g. an integer in a column of booleans)
+                    if (
+                        len(cell) == size
+                        and metadata <= cell.items()
+                        and (not isinstance(value, int) or isinstance(value, bool) == boolean)
+                    ):
+                        continue
+                else:
+                    row.append(None if value is None else json.dumps(value, default=json_default))
+            else:
+                # Not a cell, e.g. a raw value of a plugin producer
+                row.append(cell if isinstance(cell, SCALAR_TYPES) else json.dumps(cell, default=json_default))
+            if cells is None:
+                cells = {}
+            cells[column] = cell
+        row.append(None if cells is None else json.dumps(cells, default=json_default))
+        return row
+
+    @staticmethod
+    def row_layout(columns):
+        """Columns of a table as (column, metadata of the cells, number of keys of the cells, whether the column holds
+        booleans), see format_row.
+
+        Args:
+            columns (dict): The metadata of the columns of the table: {column: template}
+        """
+        return [
+            (
+                column,
+                {key: value for key, value in template.items() if key != "value"}.items(),
+                len(template),
+                template.get("type") in BOOL_TYPES,
+            )
+            for column, template in columns.items()
+        ]
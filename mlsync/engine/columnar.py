@@ -0,0 +1,399 @@
+from collections.abc import Mapping
+
+# NumPy is optional, the columnar report is only usable when it is installed
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Longest strings stored in a fixed-width array, longer ones are stored as objects
+MAX_STRING_WIDTH = 64
+# Marks the rows without a cell for an alias, bare values can be None
+MISSING = object()
+
+
+def require_numpy():
+    """Raise if NumPy, needed by the columnar report, is not installed."""
+    if np is None:
+        raise ImportError("The columnar report requires numpy (pip install numpy)")
+
+
+class Column:
+    """Column of an experiment table: the cells of one alias for all the runs.
+
+    The metadata of the cells (everything but the value and the history) is stored once per distinct variant in
+    templates, and each row refers to its variant by a code (-1 if the run has no cell for the alias). Values are
+    stored in a typed array: int64, float64 or fixed-width unicode when all the values are integers, floats or short
+    strings, objects otherwise.
+    Histories, rare, are kept in an object array only when at least one run has one.
+
+    Args:
+        templates (list): The distinct metadata of the cells, None for bare values (e.g. reports read from a consumer)
+        codes (np.ndarray): Index of the template of each row, int32, -1 for missing cells.
+        values (np.ndarray): The values of the cells.
+        data (np.ndarray): The histories of the cells, None if no cell has one.
+    """
+
+    def __init__(self, templates, codes, values, data=None):
+        self.templates = templates
+        self.codes = codes
+        self.values = values
+        self.data = data
+        # Items of typed arrays are converted back to Python scalars
+        self.typed = values.dtype.kind in "ifU"
+
+    @classmethod
+    def from_cells(cls, cells):
+        """Build a column from the cells of each row.
+
+        Args:
+            cells (list): The cells of the column, dicts or bare values, MISSING for the rows without a cell.
+        """
+        size = len(cells)
+        templates = []
+        codes = [-1] * size
+        values = [None] * size
+        data = None
+        last, last_template = -1, None
+        for row, cell in enumerate(cells):
+            if cell is MISSING:
+                continue
+            if type(cell) is dict:
+                values[row] = cell.get("value")
+                if cell.get("data") is not None:
+                    if data is None:
+                        data = np.full(size, None, dtype=object)
+                    data[row] = cell["data"]
+                    template = {**cell, "value": None, "data": None}
+                else:
+                    template = {**cell, "value": None}
+            else:
+                values[row] = cell
+                template = None
+            # Runs mostly share the metadata of an alias, check the last variant first
+            if last < 0 or template != last_template:
+                last = next((code for code, known in enumerate(templates) if known == template), -1)
+                if last < 0:
+                    templates.append(template)
+                    last = len(templates) - 1
+                last_template = templates[last]
+            codes[row] = last
+        codes = np.array(codes, dtype=np.int32)
+        return cls(templates, codes, typed_array(values, codes >= 0), data)
+
+    def cell(self, row):
+        """The cell of a row, MISSING if the run has no cell for the alias."""
+        code = self.codes[row]
+        if code < 0:
+            return MISSING
+        value = self.values[row]
+        if self.typed:
+            value = value.item()
+        template = self.templates[code]
+        if template is None:
+            return value
+        cell = dict(template)
+        cell["value"] = value
+        if self.data is not None and self.data[row] is not None:
+            cell["data"] = self.data[row]
+        return cell
+
+
+def hash_ids(run_ids):
+    """64-bit hashes of run ids, to join and look up runs without comparing strings."""
+    return np.fromiter(map(hash, run_ids.tolist()), dtype=np.int64, count=len(run_ids))
+
+
+def typed_array(values, present):
+    """Store values in a typed array when they are all integers, floats or short strings, an object array otherwise.
+
+    Args:
+        values (list): The values, None for the missing ones.
+        present (np.ndarray): Mask of the rows that have a value.
+    """
+    kinds = {type(value) for value, is_present in zip(values, present) if is_present}
+    if kinds == {float}:
+        return np.array([value if value is not None else np.nan for value in values], dtype=np.float64)
+    if kinds == {int}:
+        try:
+            return np.array([value if value is not None else 0 for value in values], dtype=np.int64)
+        except OverflowError:
+            pass
+    if kinds == {str}:
+        strings = [value if value is not None else "" for value in values]
+        # Fixed-width arrays take the width of the longest string
+        if max(map(len, strings), default=0) <= MAX_STRING_WIDTH:
+            return np.array(strings, dtype=str)
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+class ExperimentTable(Mapping):
+    """Columnar experiment of an mlsync report.
+
+    Behaves like the experiment dict of a report ({"name", "id", "runs", ...}). The runs are stored as a table: an
+    index of the run ids and one typed column per alias, and rows are only rendered as run dicts when accessed.
+    Runs are looked up by the 64-bit hashes of their ids, sorted once per table.
+
+    Args:
+        info (dict): The experiment without its runs (name, id, ...)
+        run_ids (np.ndarray): The ids of the runs, in report order.
+        columns (dict): The columns of the table: {alias: Column}
+    """
+
+    def __init__(self, info, run_ids, columns):
+        self.info = info
+        self.run_ids = run_ids
+        self.columns = columns
+        self.runs = RunsView(self)
+        self.keys = hash_ids(run_ids)
+        self._order = None
+        self._sorted_keys = None
+
+    @classmethod
+    def from_experiment(cls, experiment):
+        """Build the table of an experiment of a report."""
+        require_numpy()
+        runs = experiment["runs"]
+        run_ids = list(runs)
+        rows = list(runs.values())
+        aliases = {}
+        for run in rows:
+            aliases.update(dict.fromkeys(run))
+        columns = {alias: Column.from_cells([run.get(alias, MISSING) for run in rows]) for alias in aliases}
+        info = {key: value for key, value in experiment.items() if key != "runs"}
+        return cls(info, np.array(run_ids, dtype=str), columns)
+
+    @property
+    def order(self):
+        """Rows of the table sorted by the hashes of the run ids, computed on first use."""
+        if self._order is None:
+            self._order = np.argsort(self.keys, kind="stable")
+            self._sorted_keys = self.keys[self._order]
+        return self._order
+
+    def lookup(self, run_ids, keys=None):
+        """Rows of run ids, -1 for the ids that are not in the table.
+
+        Args:
+            run_ids (np.ndarray): The run ids to look up.
+            keys (np.ndarray): The hashes of the run ids, see hash_ids (Optional)
+        """
+        order = self.order
+        if not len(order):
+            return np.full(len(run_ids), -1, dtype=np.int64)
+        keys = hash_ids(run_ids) if keys is None else keys
+        positions = np.minimum(np.searchsorted(self._sorted_keys, keys), len(order) - 1)
+        rows = order[positions]
+        found = self._sorted_keys[positions] == keys
+        matched = found & (self.run_ids[rows] == run_ids)
+        # Hash collisions: look the ids up among the runs sharing their hash
+        for i in np.nonzero(found & ~matched)[0]:
+            end = np.searchsorted(self._sorted_keys, keys[i], side="right")
+            candidates = order[positions[i] : end]
+            candidates = candidates[self.run_ids[candidates] == run_ids[i]]
+            if len(candidates):
+                rows[i], matched[i] = candidates[0], True
+        return np.where(matched, rows, -1)
+
+    def join(self, other):
+        """Rows of the runs of this table that are in the other table, and their rows in the other table."""
+        # Runs pulled in the same order: no need to sort
+        if len(self.run_ids) == len(other.run_ids) and np.array_equal(self.run_ids, other.run_ids):
+            rows = np.arange(len(self.run_ids))
+            return rows, rows
+        # Look the runs up in the order of their hashes, sorted once per table: the searches are sequential
+        order = self.order
+        rows_other = np.empty(len(order), dtype=np.int64)
+        rows_other[order] = other.lookup(self.run_ids[order], self._sorted_keys)
+        rows = np.nonzero(rows_other >= 0)[0]
+        return rows, rows_other[rows]
+
+    def row(self, row):
+        """Render a row of the table as a run dict."""
+        run = {}
+        for alias, column in self.columns.items():
+            cell = column.cell(row)
+            if cell is not MISSING:
+                run[alias] = cell
+        return run
+
+    def header(self):
+        """A run with the metadata of the first cell of each alias, to describe the columns without rendering rows."""
+        return {alias: column.templates[column.codes[column.codes >= 0][0]] for alias, column in self.columns.items()}
+
+    def __getitem__(self, key):
+        if key == "runs":
+            return self.runs
+        return self.info[key]
+
+    def __iter__(self):
+        yield from self.info
+        yield "runs"
+
+    def __len__(self):
+        return len(self.info) + 1
+
+
+class RunsView(Mapping):
+    """The runs of an experiment table, as a mapping of run ids to run dicts rendered on access."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def header(self):
+        return self.table.header()
+
+    def __getitem__(self, run_id):
+        row = self.table.lookup(np.array([run_id], dtype=str))[0] if isinstance(run_id, str) else -1
+        if row < 0:
+            raise KeyError(run_id)
+        return self.table.row(row)
+
+    def __contains__(self, run_id):
+        return isinstance(run_id, str) and self.table.lookup(np.array([run_id], dtype=str))[0] >= 0
+
+    def __iter__(self):
+        return iter(self.table.run_ids.tolist())
+
+    def __len__(self):
+        return len(self.table.run_ids)
+
+
+class ColumnarReport(Mapping):
+    """Columnar mlsync report: {experiment_name: ExperimentTable}.
+
+    A drop-in replacement of the report dict for large reports. The diff of two columnar reports joins the run
+    ids and compares the columns with vectorized operations (see diff_columnar) instead of comparing the run dicts,
+    and consumers render the rows lazily.
+
+    Args:
+        experiments (dict): The experiment tables: {experiment_name: ExperimentTable}
+    """
+
+    def __init__(self, experiments, sources=None):
+        self.experiments = experiments
+        # Experiments of the report the tables were built from, to reuse the tables of unchanged experiments
+        self.sources = sources or {}
+
+    @classmethod
+    def from_report(cls, report, previous=None):
+        """Convert a report.
+
+        Producers merge partial pulls into the report of the last pull and keep the experiments that did not change
+        (the same dicts): their tables in the previous columnar report are reused.
+
+        Args:
+            report (dict): The report.
+            previous (ColumnarReport): The columnar report of the last pull (Optional)
+        """
+        if isinstance(report, cls):
+            return report
+        experiments = {}
+        for experiment_name, experiment in report.items():
+            if previous is not None and previous.sources.get(experiment_name) is experiment:
+                experiments[experiment_name] = previous.experiments[experiment_name]
+            else:
+                experiments[experiment_name] = ExperimentTable.from_experiment(experiment)
+        return cls(experiments, sources=dict(report))
+
+    def __getitem__(self, experiment_name):
+        return self.experiments[experiment_name]
+
+    def __iter__(self):
+        return iter(self.experiments)
+
+    def __len__(self):
+        return len(self.experiments)
+
+
+def changed_rows(table_old, rows_old, table_new, rows_new):
+    """Mask of the joined rows whose runs differ between two experiment tables.
+
+    Args:
+        table_old (ExperimentTable): The old table.
+        rows_old (np.ndarray): Rows of the old table.
+        table_new (ExperimentTable): The new table.
+        rows_new (np.ndarray): Rows of the new table, joined with rows_old on the run id.
+    """
+    changed = np.zeros(len(rows_old), dtype=bool)
+    for alias in table_old.columns.keys() | table_new.columns.keys():
+        column_old, column_new = table_old.columns.get(alias), table_new.columns.get(alias)
+        if column_old is None or column_new is None:
+            # Rows that have a cell in one table only
+            column = column_old if column_new is None else column_new
+            changed |= column.codes[rows_old if column_new is None else rows_new] >= 0
+            continue
+
+        # Metadata: map the old templates to the equal new ones (-2 if none), missing cells map to -1
+        lookup = np.array(
+            [
+                next((code for code, template in enumerate(column_new.templates) if template == template_old), -2)
+                for template_old in column_old.templates
+            ]
+            + [-1],
+            dtype=np.int32,
+        )
+        codes_old, codes_new = lookup[column_old.codes[rows_old]], column_new.codes[rows_new]
+        changed |= codes_old != codes_new
+
+        # Values of the rows that have a cell in both tables
+        both = (codes_old >= 0) & (codes_new >= 0)
+        values_old, values_new = column_old.values[rows_old], column_new.values[rows_new]
+        different = np.asarray(values_old != values_new, dtype=bool)
+        if values_old.dtype.kind == "f" and values_new.dtype.kind == "f":
+            different &= ~(np.isnan(values_old) & np.isnan(values_new))
+        changed |= both & different
+
+        # Histories, compared one by one where either table has one
+        if column_old.data is not None or column_new.data is not None:
+            data_old = column_old.data[rows_old] if column_old.data is not None else np.full(len(rows_old), None)
+            data_new = column_new.data[rows_new] if column_new.data is not None else np.full(len(rows_new), None)
+            for i in np.nonzero(both & ~changed)[0]:
+                if data_old[i] is not data_new[i] and data_old[i] != data_new[i]:
+                    changed[i] = True
+    return changed
+
+
+def diff_columnar(report_old, report_new):
+    """Generate the diff report of two columnar reports.
+
+    Same result as engine.diff.diff: the runs of each experiment are joined on their ids, runs only in the old
+    table are deleted, runs only in the new table are new, and joined runs are updated when any of their cells
+    differ. Lists keep the order of the runs in the reports.
+
+    Args:
+        report_old (ColumnarReport): the old report
+        report_new (ColumnarReport): the new report
+    """
+    diff_experiment_report = {"new": {}, "deleted": {}, "updated": {}}
+    for experiment_name, table_old in report_old.items():
+        if experiment_name not in report_new:
+            diff_experiment_report["deleted"][experiment_name] = {"deleted": table_old.run_ids.tolist()}
+            continue
+        table_new = report_new[experiment_name]
+        # Tables reused by a partial pull did not change
+        if table_new is table_old:
+            continue
+
+        # Join on the run ids
+        rows_old, rows_new = table_old.join(table_new)
+        deleted = np.ones(len(table_old.run_ids), dtype=bool)
+        deleted[rows_old] = False
+        new = np.ones(len(table_new.run_ids), dtype=bool)
+        new[rows_new] = False
+        updated = rows_old[changed_rows(table_old, rows_old, table_new, rows_new)]
+
+        diff_run_report = {
+            "new": table_new.run_ids[new].tolist(),
+            "deleted": table_old.run_ids[deleted].tolist(),
+            "updated": table_old.run_ids[updated].tolist(),
+        }
+        if any(diff_run_report.values()) or table_old.info != table_new.info:
+            diff_experiment_report["updated"][experiment_name] = diff_run_report
+
+    for experiment_name in report_new:
+        if experiment_name not in report_old:
+            diff_experiment_report["new"][experiment_name] = experiment_name
+    return diff_experiment_report
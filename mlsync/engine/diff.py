@@ -1,3 +1,6 @@
+import sys
+
+
 def diff(report_old, report_new):
     """Generate the diff report
 
@@ -10,10 +13,20 @@ def diff(report_old, report_new):
     MLSync reports can NOT change the following ways:
     1. Older experiments/runs have different metrics
 
+    Two columnar reports (see mlsync.engine.columnar) are compared with vectorized joins instead.
+
     Args:
         report_old: the old report
         report_new: the new report
     """
+    # The columnar module (and numpy) is only loaded in columnar mode, no report can be columnar before
+    columnar = sys.modules.get("mlsync.engine.columnar")
+    if (
+        columnar is not None
+        and isinstance(report_old, columnar.ColumnarReport)
+        and isinstance(report_new, columnar.ColumnarReport)
+    ):
+        return columnar.diff_columnar(report_old, report_new)
     diff_experiment_report = {"new": {}, "deleted": {}, "updated": {}}
     # Only if the reports dont match, we will generate the diff
     if report_old != report_new:
@@ -65,3 +78,90 @@ def diff(report_old, report_new):
                 diff_experiment_report["new"][experiment_name] = experiment_name
 
     return diff_experiment_report
+
+
+def rebase_report(report_old, report_new, schema_diff):
+    """Bring the old report to the schema of the new report, after a schema update of the consumer.
+
+    Cells of renamed columns are moved to their new alias. Cells of added and changed columns were backfilled in the
+    consumer and are taken from the new report. Cells whose value did not change are taken from the new report as
+    well, so that format-only changes (e.g. descriptions) do not show up in the diff. Remaining cells keep their old
+    value, so that the diff against the new report still finds the runs whose values changed.
+
+    Args:
+        report_old: the old report
+        report_new: the new report
+        schema_diff: the column changes, see mlsync.utils.report_format.diff_report_format
+    """
+    aliases_old = {alias_new: alias_old for alias_old, alias_new in schema_diff["renamed"].items()}
+    backfilled = set(schema_diff["added"]) | set(schema_diff["changed"])
+    report = {}
+    for experiment_name, experiment_old in report_old.items():
+        experiment_new = report_new.get(experiment_name, {"runs": {}})
+        runs = {}
+        for run_id, run_old in experiment_old["runs"].items():
+            run_new = experiment_new["runs"].get(run_id)
+            if run_new is None:
+                runs[run_id] = run_old
+                continue
+            run = {}
+            for alias, cell in run_new.items():
+                cell_old = run_old.get(aliases_old.get(alias, alias))
+                if alias in backfilled or (isinstance(cell_old, dict) and cell_old["value"] == cell["value"]):
+                    run[alias] = cell
+                elif cell_old is not None:
+                    run[alias] = cell_old
+            runs[run_id] = run
+        report[experiment_name] = {**experiment_old, "runs": runs}
+    return report
+
+
+def consumer_value(cell):
+    """Value of a cell pulled from a consumer: a cell of the mlsync report, or a bare value (e.g., Notion)."""
+    return cell["value"] if isinstance(cell, dict) else cell
+
+
+def reconcile_report(report, consumer_report):
+    """Bring the synced report in line with a pull of the consumer, e.g. after manual edits in the consumer.
+
+    Runs (and experiments) missing in the consumer are dropped, so that the diff against the producer creates them
+    again. Runs only in the consumer are added, so that the diff deletes them. Runs whose values in the consumer
+    differ from the synced ones take the consumer values, so that the diff updates them. Columns only in the
+    consumer (e.g., added by hand) are ignored. Experiments that did not change are kept as is.
+
+    Args:
+        report: the report synced to the consumer
+        consumer_report: the report pulled from the consumer
+    """
+
+    def consumer_runs(runs):
+        return {
+            run_id: {alias: {"value": consumer_value(cell)} for alias, cell in run.items()} for run_id, run in runs.items()
+        }
+
+    reconciled = {}
+    for experiment_name, experiment in report.items():
+        if experiment_name not in consumer_report:
+            continue
+        runs_new = consumer_report[experiment_name]["runs"]
+        runs = {}
+        for run_id, run in experiment["runs"].items():
+            run_new = runs_new.get(run_id)
+            if run_new is None:
+                continue
+            values = {alias: consumer_value(run_new[alias]) if alias in run_new else None for alias in run}
+            if all(values[alias] == cell["value"] for alias, cell in run.items()):
+                runs[run_id] = run
+            else:
+                runs[run_id] = {alias: {**cell, "value": values[alias]} for alias, cell in run.items()}
+        runs.update(
+            consumer_runs({run_id: run for run_id, run in runs_new.items() if run_id not in experiment["runs"]})
+        )
+        if runs == experiment["runs"]:
+            reconciled[experiment_name] = experiment
+        else:
+            reconciled[experiment_name] = {**experiment, "runs": runs}
+    for experiment_name, experiment in consumer_report.items():
+        if experiment_name not in report:
+            reconciled[experiment_name] = {**experiment, "runs": consumer_runs(experiment["runs"])}
+    return reconciled
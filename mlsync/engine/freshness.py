@@ -0,0 +1,112 @@
+import time
+from collections import deque
+
+from mlsync.utils.metrics import METRICS
+
+FRESHNESS = METRICS.gauge(
+    "mlsync_freshness_seconds",
+    "Seconds between a run change in the producer and its write to the consumer, by percentile.",
+    ["experiment", "quantile"],
+)
+FRESHNESS_SLO_VIOLATIONS = METRICS.counter(
+    "mlsync_freshness_slo_violations_total", "Run changes written to the consumer later than the freshness SLO.", ["experiment"]
+)
+# Percentiles exported for each experiment
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def percentile(values, quantile):
+    """Percentile of a sorted list with the nearest-rank method.
+
+    Args:
+        values (list): Sorted values.
+        quantile (float): Quantile between 0 and 1.
+    """
+    return values[min(len(values) - 1, max(0, int(round(quantile * len(values))) - 1))]
+
+
+class FreshnessTracker:
+    """Tracks how long after the producer records a run change it becomes visible in the consumer.
+
+    Run changes found by the diff are stamped with their producer-side timestamp (latest of the run start and end
+    times and metric timestamps). When the consumer write of a change succeeds, the lag since that timestamp is
+    recorded. Changes recorded before the sync started are not tracked, their lag says nothing about the sync.
+
+    Args:
+        slo (float): Freshness SLO in seconds, a warning is printed for runs written later than this (Optional)
+        window (int): Number of latest lags kept per experiment to compute the percentiles.
+    """
+
+    def __init__(self, slo=None, window=1000):
+        """Initialize the freshness tracker"""
+        self.slo = slo
+        self.window = window
+        self.started_at = time.time()
+        # Producer timestamps (seconds) of the changes waiting to be written: {experiment_name: {run_id: timestamp}}
+        self.pending = {}
+        # Latest lags per experiment
+        self.lags = {}
+
+    def stamp(self, diff_report, report, timestamps):
+        """Stamp the run changes of a diff report with their producer timestamps.
+
+        Args:
+            diff_report (dict): The diff report.
+            report (dict): The new report.
+            timestamps (dict): Producer timestamps in milliseconds: {experiment_name: {run_id: timestamp}}
+        """
+        changes = {experiment_name: list(report[experiment_name]["runs"]) for experiment_name in diff_report["new"]}
+        for experiment_name, diff_run_report in diff_report["updated"].items():
+            changes[experiment_name] = diff_run_report["new"] + diff_run_report["updated"]
+        for experiment_name, run_ids in changes.items():
+            experiment_timestamps = timestamps.get(experiment_name, {})
+            for run_id in run_ids:
+                timestamp = experiment_timestamps.get(run_id)
+                if timestamp is not None and timestamp / 1000 >= self.started_at:
+                    self.pending.setdefault(experiment_name, {})[run_id] = timestamp / 1000
+
+    def commit(self, experiment_names):
+        """Record the lags of the stamped changes of experiments whose consumer write succeeded.
+
+        Args:
+            experiment_names (iterable): The experiments written to the consumer.
+        """
+        now = time.time()
+        for experiment_name in experiment_names:
+            stamped = self.pending.pop(experiment_name, None)
+            if not stamped:
+                continue
+            lags = [now - timestamp for timestamp in stamped.values()]
+            self.lags.setdefault(experiment_name, deque(maxlen=self.window)).extend(lags)
+            self.export(experiment_name)
+            # Flag the changes that took longer than the SLO
+            if self.slo is not None:
+                late = [lag for lag in lags if lag > self.slo]
+                if late:
+                    FRESHNESS_SLO_VIOLATIONS.inc(len(late), experiment=experiment_name)
+                    print(
+                        f"WARNING: Freshness SLO of {self.slo}s exceeded for {len(late)} run(s) of experiment "
+                        f"{experiment_name} (max lag {max(late):.1f}s)"
+                    )
+
+    def percentiles(self, experiment_name):
+        """Freshness percentiles of an experiment in seconds.
+
+        Args:
+            experiment_name (str): The experiment.
+        """
+        lags = sorted(self.lags.get(experiment_name, ()))
+        if not lags:
+            return {}
+        return {quantile: percentile(lags, quantile) for quantile in QUANTILES}
+
+    def export(self, experiment_name):
+        """Export the freshness percentiles of an experiment to the metrics.
+
+        Args:
+            experiment_name (str): The experiment.
+        """
+        if not METRICS.enabled:
+            return
+        for quantile, lag in self.percentiles(experiment_name).items():
+            FRESHNESS.set(lag, experiment=experiment_name, quantile=quantile)
@@ -0,0 +1,59 @@
+import threading
+import time
+
+
+class RunHints:
+    """Thread-safe set of hints that runs changed, posted by change sources and consumed by the sync loop.
+
+    A hint is a pair (experiment_id, run_id). A run_id of None means the experiment itself changed (e.g. created or
+    deleted), and (None, None) means anything may have changed: both call for a full pull.
+    """
+
+    def __init__(self):
+        """Initialize the RunHints object"""
+        self.condition = threading.Condition()
+        self.hints = set()
+
+    def add(self, experiment_id=None, run_id=None):
+        """Hint that a run (or an experiment, or anything) changed.
+
+        Args:
+            experiment_id (str): The id of the experiment (Optional)
+            run_id (str): The id of the run (Optional)
+        """
+        with self.condition:
+            self.hints.add((experiment_id, run_id))
+            self.condition.notify_all()
+
+    def wait(self, timeout, debounce=0.0):
+        """Wait for hints, then collect the hints that follow within the debounce delay.
+
+        Args:
+            timeout (float): Maximum time to wait for a first hint in seconds.
+            debounce (float): Time to keep collecting hints after the first one, so that bursts of writes to the
+                same runs are handled at once.
+
+        Returns:
+            set: The hints, empty if none arrived before the timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while not self.hints:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return set()
+                self.condition.wait(remaining)
+        if debounce:
+            time.sleep(debounce)
+        with self.condition:
+            hints, self.hints = self.hints, set()
+        return hints
+
+    @staticmethod
+    def needs_full_pull(hints):
+        """Whether the hints call for a full pull rather than re-reading the hinted runs.
+
+        Args:
+            hints (set): The hints, as returned by wait.
+        """
+        return any(run_id is None for _, run_id in hints)
@@ -0,0 +1,154 @@
+import http.client
+import json
+import os
+import socket
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Where training scripts send their hints by default, e.g. http://127.0.0.1:5055 or unix:///tmp/mlsync.sock
+INGEST_URL_ENV = "MLSYNC_INGEST_URL"
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    """HTTP server on a Unix socket."""
+
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ("local", 0)
+
+
+class IngestServer:
+    """Local endpoint where training scripts post hints that their runs changed.
+
+    POST /hints with a JSON body {"run_id": ..., "experiment_id": ...} (both optional, a body without run_id asks
+    for a full pull) adds a hint for the sync engine, which then fetches just that run instead of waiting for the
+    next poll. Listens on a localhost port or on a Unix socket.
+
+    Args:
+        hints (RunHints): The hints of the sync engine.
+        host (str): Host to bind to.
+        port (int): Port to bind to, 0 picks a free port. Ignored with a Unix socket.
+        socket_path (str): Path of a Unix socket to listen on instead of a port (Optional)
+    """
+
+    def __init__(self, hints, host="127.0.0.1", port=0, socket_path=None):
+        """Initialize the ingest server"""
+        self.hints = hints
+        self.socket_path = socket_path
+        if socket_path:
+            # Remove the socket of a previous run
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self.server = ThreadingUnixHTTPServer(socket_path, self.handler())
+        else:
+            self.server = ThreadingHTTPServer((host, port), self.handler())
+            self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        """URL of the server, to use as MLSYNC_INGEST_URL."""
+        if self.socket_path:
+            return f"unix://{os.path.abspath(self.socket_path)}"
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve in a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handler(self):
+        """Request handler class bound to this server."""
+        server = self
+
+        class IngestRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def respond(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                if self.path != "/hints":
+                    return self.respond(404, {"error": f"No endpoint for POST {self.path}"})
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length)) if length else {}
+                    run_id, experiment_id = body.get("run_id"), body.get("experiment_id")
+                except (ValueError, AttributeError):
+                    return self.respond(400, {"error": "The body must be a JSON object"})
+                server.hints.add(experiment_id, run_id)
+                self.respond(202, {})
+
+        return IngestRequestHandler
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket."""
+
+    def __init__(self, socket_path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def notify(run_id=None, experiment_id=None, url=None, timeout=1.0):
+    """Tell the sync engine that a run changed, so that it syncs it right away.
+
+    Meant to be called from training code, e.g. after logging metrics. Errors are ignored (the run is still
+    synced at the next poll), training must not fail because mlsync is not running.
+
+    Args:
+        run_id (str): The id of the run (Optional)
+        experiment_id (str): The id of the experiment of the run (Optional)
+        url (str): URL of the ingest server, http://host:port or unix:///path (default: $MLSYNC_INGEST_URL)
+        timeout (float): Timeout of the request in seconds.
+
+    Returns:
+        bool: True if the hint was delivered.
+    """
+    url = url or os.environ.get(INGEST_URL_ENV)
+    if not url:
+        return False
+    if url.startswith("unix://"):
+        connection = UnixHTTPConnection(url[len("unix://") :], timeout)
+    else:
+        connection = http.client.HTTPConnection(url.split("://", 1)[-1].rstrip("/"), timeout=timeout)
+    body = json.dumps({"run_id": run_id, "experiment_id": experiment_id})
+    try:
+        connection.request("POST", "/hints", body=body, headers={"Content-Type": "application/json"})
+        return connection.getresponse().status == 202
+    except OSError:
+        return False
+    finally:
+        connection.close()
@@ -0,0 +1,81 @@
+import time
+
+from mlsync.utils.metrics import METRICS
+
+# Runs in these states do not change anymore
+TERMINAL_STATUSES = ("FINISHED", "FAILED", "KILLED")
+
+RUNS_TRACKED = METRICS.gauge("mlsync_runs_tracked", "Number of runs known to the sync engine, by lifecycle state.", ["state"])
+
+
+class RunLifecycle:
+    """Track the status of the runs, so that each tick only pulls the runs that can still change.
+
+    Runs in a terminal state (FINISHED, FAILED, KILLED) are frozen: they are kept from the last pull and only
+    re-checked by a full reconciliation every reconcile_rate seconds. Between reconciliations, the producer pulls
+    the active runs (RUNNING, SCHEDULED), the runs started since the last pull and the runs that stopped being
+    active (see MLFlowSync.pull_active).
+
+    Args:
+        reconcile_rate (float): Interval of the full reconciliations in seconds.
+    """
+
+    def __init__(self, reconcile_rate=300):
+        """Initialize the RunLifecycle object"""
+        self.reconcile_rate = reconcile_rate
+        self.reconciled_at = None
+        # {experiment_id: {run_id: status}}
+        self.statuses = {}
+        # Latest start time seen in each experiment: {experiment_id: start_time}
+        self.started_until = {}
+
+    def reconcile_due(self, now=None):
+        """Whether a full reconciliation is due."""
+        now = time.time() if now is None else now
+        return self.reconciled_at is None or now - self.reconciled_at >= self.reconcile_rate
+
+    def reconcile(self, statuses, now=None):
+        """Replace the tracked runs after a full pull.
+
+        Args:
+            statuses (dict): Status and start time of all the runs: {experiment_id: {run_id: (status, start_time)}}
+        """
+        self.reconciled_at = time.time() if now is None else now
+        self.statuses = {}
+        self.started_until = {}
+        for experiment_id, runs in statuses.items():
+            for run_id, (status, start_time) in runs.items():
+                self.observe(experiment_id, run_id, status, start_time)
+        self.record()
+
+    def observe(self, experiment_id, run_id, status, start_time=None):
+        """Record the status of a run.
+
+        Args:
+            experiment_id (str): The id of the experiment.
+            run_id (str): The id of the run.
+            status (str): The status of the run, e.g. RUNNING
+            start_time (int): The start time of the run (Optional)
+        """
+        self.statuses.setdefault(experiment_id, {})[run_id] = status
+        if start_time is not None and start_time > self.started_until.get(experiment_id, -1):
+            self.started_until[experiment_id] = start_time
+
+    def forget(self, experiment_id, run_id):
+        """Stop tracking a deleted run."""
+        self.statuses.get(experiment_id, {}).pop(run_id, None)
+
+    def active(self, experiment_id):
+        """Ids of the runs of an experiment that are not frozen."""
+        return {
+            run_id for run_id, status in self.statuses.get(experiment_id, {}).items() if status not in TERMINAL_STATUSES
+        }
+
+    def record(self):
+        """Update the gauges of the tracked runs."""
+        if not METRICS.enabled:
+            return
+        active = sum(len(self.active(experiment_id)) for experiment_id in self.statuses)
+        total = sum(len(runs) for runs in self.statuses.values())
+        RUNS_TRACKED.set(active, state="active")
+        RUNS_TRACKED.set(total - active, state="frozen")
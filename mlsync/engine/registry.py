@@ -0,0 +1,73 @@
+import importlib
+
+# Built-in producers and consumers as "module:class", imported only when selected
+PRODUCERS = {
+    "mlflow": "mlsync.producers.mlflow.mlflow_sync:MLFlowSync",
+    "tensorboard": "mlsync.producers.tensorboard.tensorboard_sync:TensorBoardSync",
+}
+CONSUMERS = {
+    "notion": "mlsync.consumers.notion.notion_sync:NotionSync",
+    "sqlite": "mlsync.consumers.sqlite.sqlite_sync:SQLiteSync",
+    "parquet": "mlsync.consumers.parquet.parquet_sync:ParquetSync",
+    "changelog": "mlsync.consumers.changelog.changelog_sync:ChangelogSync",
+}
+
+# Entry point groups for producers and consumers provided by other packages
+PRODUCERS_GROUP = "mlsync.producers"
+CONSUMERS_GROUP = "mlsync.consumers"
+
+
+def entry_points(group):
+    """Entry points of a group as {name: entry point}.
+
+    Args:
+        group (str): The entry point group.
+    """
+    # Imported here, scanning the installed packages is only needed for plugins that are not built-in
+    from importlib import metadata
+
+    eps = metadata.entry_points()
+    # Python < 3.10 returns a dict of groups
+    eps = eps.select(group=group) if hasattr(eps, "select") else eps.get(group, [])
+    return {ep.name: ep for ep in eps}
+
+
+def load(name, builtins, group):
+    """Resolve a producer or consumer by name and import its class.
+
+    Built-in plugins are resolved first, then the entry points of the group.
+
+    Args:
+        name (str): The name of the producer or consumer, e.g. mlflow
+        builtins (dict): Built-in plugins as {name: "module:class"}
+        group (str): The entry point group of the plugins.
+
+    Raises:
+        NotImplementedError: If no plugin has this name.
+    """
+    if name in builtins:
+        module_name, class_name = builtins[name].split(":")
+        return getattr(importlib.import_module(module_name), class_name)
+    plugins = entry_points(group)
+    if name in plugins:
+        return plugins[name].load()
+    available = sorted(set(builtins) | set(plugins))
+    raise NotImplementedError(f"{name} is not implemented. Available: {', '.join(available)}")
+
+
+def load_producer(name):
+    """Import the class of a producer by name.
+
+    Args:
+        name (str): The name of the producer, e.g. mlflow
+    """
+    return load(name, PRODUCERS, PRODUCERS_GROUP)
+
+
+def load_consumer(name):
+    """Import the class of a consumer by name.
+
+    Args:
+        name (str): The name of the consumer, e.g. notion
+    """
+    return load(name, CONSUMERS, CONSUMERS_GROUP)
@@ -0,0 +1,79 @@
+def cell_fingerprint(alias, cell):
+    """Hashable summary of a cell of a run: its metadata and value, and the length of its history."""
+    if not isinstance(cell, dict):
+        return (alias, cell)
+    data = cell.get("data")
+    points = len(data.get("value", ())) if isinstance(data, dict) else None
+    return (alias, cell.get("key"), cell.get("type"), cell.get("value"), points)
+
+
+def run_fingerprint(run):
+    """64-bit fingerprint of a run, kept instead of the run to find out whether it changed at the next pull.
+
+    Args:
+        run (dict): A run of the mlsync report.
+    """
+    try:
+        return hash(tuple(cell_fingerprint(alias, cell) for alias, cell in run.items()))
+    except TypeError:
+        # Unhashable values (e.g. lists of a plugin producer)
+        return hash(repr(run))
+
+
+def experiment_fingerprints(experiment):
+    """Fingerprints of the runs of an experiment: {run_id: fingerprint}"""
+    return {run_id: run_fingerprint(run) for run_id, run in experiment["runs"].items()}
+
+
+def report_fingerprints(report):
+    """Fingerprints of the runs of a report: {experiment_name: {run_id: fingerprint}}"""
+    return {experiment_name: experiment_fingerprints(experiment) for experiment_name, experiment in report.items()}
+
+
+def diff_experiment(experiment_name, experiment, fingerprints_old):
+    """Generate the diff report of one experiment against the fingerprints of its runs at the last sync.
+
+    Streaming counterpart of engine.diff.diff: only the fingerprints of the synced runs are kept between syncs,
+    not the runs themselves.
+
+    Args:
+        experiment_name (str): The name of the experiment.
+        experiment (dict): The experiment in the new report.
+        fingerprints_old (dict): The fingerprints of the synced runs of the experiment, None if it is not synced.
+
+    Returns:
+        (dict, dict): The diff report of the experiment, and the fingerprints of its runs in the new report.
+    """
+    diff_report = {"new": {}, "deleted": {}, "updated": {}}
+    fingerprints = experiment_fingerprints(experiment)
+    if fingerprints_old is None:
+        diff_report["new"][experiment_name] = experiment_name
+    elif fingerprints != fingerprints_old:
+        diff_report["updated"][experiment_name] = {
+            "new": [run_id for run_id in fingerprints if run_id not in fingerprints_old],
+            "deleted": [run_id for run_id in fingerprints_old if run_id not in fingerprints],
+            "updated": [
+                run_id
+                for run_id, fingerprint in fingerprints_old.items()
+                if run_id in fingerprints and fingerprints[run_id] != fingerprint
+            ],
+        }
+    return diff_report, fingerprints
+
+
+def diff_deleted(fingerprints_old, experiment_names):
+    """Generate the diff report of the synced experiments that were not in the new report.
+
+    Args:
+        fingerprints_old (dict): The fingerprints of the synced runs: {experiment_name: {run_id: fingerprint}}
+        experiment_names (set): The experiments of the new report.
+    """
+    return {
+        "new": {},
+        "deleted": {
+            experiment_name: {"deleted": list(fingerprints)}
+            for experiment_name, fingerprints in fingerprints_old.items()
+            if experiment_name not in experiment_names
+        },
+        "updated": {},
+    }
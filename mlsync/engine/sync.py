@@ -1,15 +1,36 @@
 import sys
 import os
 import time
-from mlsync.producers.mlflow.mlflow_sync import MLFlowSync
-from mlsync.consumers.notion.notion_sync import NotionSync
-from mlsync.engine.diff import diff
+import yaml
+from mlsync.engine.diff import diff, rebase_report, reconcile_report
+from mlsync.engine.registry import load_producer, load_consumer
+from mlsync.engine.freshness import FreshnessTracker
+from mlsync.engine.hints import RunHints
+from mlsync.engine.ingest import IngestServer
+from mlsync.engine.lifecycle import RunLifecycle
+from mlsync.engine.stream import diff_deleted, diff_experiment, report_fingerprints
+from mlsync.utils.metrics import STAGE_DURATION, SYNC_LAG
+from mlsync.utils.utils import CONVERSION_FAILURES
+from mlsync.utils.report_format import load_report_format, diff_report_format
+
+# Delay collecting the hints that follow a first one, so that bursts of writes to a run are pulled at once
+HINTS_DEBOUNCE = 0.25
+# With change notifications, interval in seconds of the full pulls catching up with missed notifications
+HINTS_RECONCILE_INTERVAL = 60
+# Interval in seconds of the full pulls re-checking the runs in a terminal state
+RECONCILE_RATE = 300
+# Interval in seconds of the pulls of the consumer catching up with the changes made in the consumer
+CONSUMER_PULL_RATE = 300
+# Every this many pulls of the consumer, all of its entries are read rather than the ones changed since the last pull
+CONSUMER_FULL_PULL_EVERY = 12
 
 
 class Sync:
     """Main class that runs the sync process.
 
-    Instantiates producer and destination APIs. Check docs for more details.
+    Instantiates producer and destination APIs. Check docs for more details. Producers and consumers are resolved
+    by name (built-in, or registered by other packages under the mlsync.producers and mlsync.consumers entry point
+    groups) and only the selected ones are imported.
 
     Args:
         report_format (str): Path to the report format file in YAML format (see docs for more details)
@@ -20,6 +41,18 @@ class Sync:
         mlflow_uri (str): MLFlow URI during the run (Optional)
         notion_token (str): Notion token (Optional)
         notion_page_id (str): Notion page ID (Optional)
+        notion_base_url (str): Root URL of the Notion API, e.g. a local NotionServer (Optional)
+        freshness_slo (float): Seconds after which a run change that is not yet in the consumer is flagged (Optional)
+        format_path (str): Path to the report format file, reloaded by the sync process when it changes (Optional)
+        mlflow_mlruns_dir (str): Local mlruns/ directory, watched for changes instead of polling (Optional)
+        ingest_port (int): Port of the local ingest endpoint where training scripts post run hints (Optional)
+        ingest_socket (str): Unix socket of the local ingest endpoint, instead of a port (Optional)
+        reconcile_rate (float): Interval of the full pulls re-checking the runs in a terminal state, 0 to pull all
+            the runs at every tick (Optional)
+        consumer_pull_rate (float): Interval of the pulls of the consumer catching up with the changes made in the
+            consumer, 0 to only pull it at startup (Optional)
+        columnar (bool): Diff the reports as columnar tables with vectorized operations (requires numpy)
+        streaming (bool): Sync one experiment at a time, keeping only fingerprints of the synced runs (Optional)
 
     Raises:
         NotImplementedError: If the producer or destination is not supported
@@ -39,88 +72,335 @@ class Sync:
         self.format = report_format
 
         # Pick the producer and instantiate the API
-        if producer == "mlflow":
-            # Make sure mlflow_uri is provided
-            if "mlflow_uri" not in kwargs:
-                raise ValueError("mlflow_uri is required for mlflow producer")
-            # Instantiate MLFlow API
-            self.producer_sync = MLFlowSync(kwargs["mlflow_uri"], self.format)
-        else:
-            raise NotImplementedError(f"producer {producer} not implemented")
+        self.producer_sync = load_producer(producer).from_config(self.format, **kwargs)
 
         # Destination
-        if consumer == "notion":
-            # Make sure notion_token and notion_page_id are provided
-            if "notion_token" not in kwargs or "notion_page_id" not in kwargs:
-                raise ValueError("notion_token and notion_page_id are required for notion destination")
-
-            # Instantiate Notion Sync
-            self.consumer_sync = NotionSync(
-                notion_token=kwargs["notion_token"], root_page_id=kwargs["notion_page_id"], report_format=self.format
-            )
-        else:
-            raise NotImplementedError(f"Destination {consumer} not implemented.")
+        self.consumer_sync = load_consumer(consumer).from_config(self.format, **kwargs)
+
+        # Report format file, watched for changes
+        self.format_path = kwargs.get("format_path")
+        self.format_mtime = self.stat_format()
+
+        # Hints of the changed runs, posted by the producer when it can watch for changes
+        self.hints = RunHints()
+        self.watching = hasattr(self.producer_sync, "watch") and self.producer_sync.watch(self.hints)
+        # Training scripts can post hints of the runs they changed, for producers that can re-read only those runs
+        self.ingest_server = None
+        ingest = kwargs.get("ingest_port") is not None or kwargs.get("ingest_socket")
+        if ingest and not hasattr(self.producer_sync, "pull_runs"):
+            print(f"WARNING: {type(self.producer_sync).__name__} does not support run hints, not listening for them.")
+        elif ingest:
+            self.ingest_server = IngestServer(
+                self.hints, port=kwargs.get("ingest_port") or 0, socket_path=kwargs.get("ingest_socket")
+            ).start()
+            print(f"Listening for run hints on {self.ingest_server.url}")
+
+        # Runs in a terminal state are only pulled again by a periodic reconciliation
+        reconcile_rate = kwargs.get("reconcile_rate")
+        reconcile_rate = RECONCILE_RATE if reconcile_rate is None else reconcile_rate
+        self.lifecycle = None
+        if reconcile_rate and hasattr(self.producer_sync, "pull_active"):
+            self.lifecycle = RunLifecycle(reconcile_rate=reconcile_rate)
+
+        # The consumer is pulled again periodically, e.g. for the entries edited or removed by hand
+        consumer_pull_rate = kwargs.get("consumer_pull_rate")
+        self.consumer_pull_rate = CONSUMER_PULL_RATE if consumer_pull_rate is None else consumer_pull_rate
+
+        # Columnar reports for large sweeps
+        self.columnar = kwargs.get("columnar", False)
+        if self.columnar:
+            # Imported on demand, numpy is only needed in columnar mode
+            from mlsync.engine.columnar import require_numpy
+
+            require_numpy()
+
+        # Experiments flow one at a time through pull, diff and push
+        self.streaming = kwargs.get("streaming", False)
+        if self.streaming and not hasattr(self.producer_sync, "pull_experiments"):
+            raise NotImplementedError(f"{type(self.producer_sync).__name__} does not support streaming")
+        # Fingerprints of the synced runs, in streaming mode: {experiment_name: {run_id: fingerprint}}
+        self.fingerprints = {}
+
+        # Lag between the producer recording a run change and the consumer write
+        self.freshness = FreshnessTracker(slo=kwargs.get("freshness_slo"))
 
         # TODO: For simplicity, we use dict as the database. In the future, we intend to use a better database
         # implementation to imprve performance.
         self.mlsync_db = None
 
-    def sync(self, refresh_rate):
+    def backfill(self, checkpoint_path=None, workers=4):
+        """Bulk initial sync of the whole producer report to the consumer.
+
+        Args:
+            checkpoint_path (str): Path to the checkpoint file used to resume an interrupted backfill (Optional)
+            workers (int): Number of concurrent requests to the consumer
+
+        Returns:
+            dict: The report that was synced, to hand off to the incremental sync.
+        """
+        if not hasattr(self.consumer_sync, "backfill"):
+            raise NotImplementedError(f"{type(self.consumer_sync).__name__} does not support backfill")
+        report = self.producer_sync.pull()
+        CONVERSION_FAILURES.warn()
+        self.consumer_sync.backfill(report, checkpoint_path=checkpoint_path, workers=workers)
+        return report
+
+    def stat_format(self):
+        """Modification time of the report format file, None if it is not watched or missing."""
+        if self.format_path is None:
+            return None
+        try:
+            return os.stat(self.format_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload_format(self, report):
+        """Reload the report format file if it changed, and apply the column changes to the consumer.
+
+        Added, removed, renamed and retyped columns are pushed as a schema update and a backfill of the affected
+        columns, rather than a full re-sync. Consumers without schema updates catch up through the regular diff.
+
+        Args:
+            report (dict): The report synced to the consumer.
+
+        Returns:
+            dict: The report synced to the consumer, in the new report format.
+        """
+        format_mtime = self.stat_format()
+        if format_mtime is None or format_mtime == self.format_mtime:
+            return report
+        self.format_mtime = format_mtime
+        try:
+            report_format = load_report_format(self.format_path)
+        except (ValueError, yaml.YAMLError) as e:
+            print(f"WARNING: Could not reload the report format {self.format_path}, keeping the current one: {e}")
+            return report
+        if report_format.get("digest") == self.format.get("digest"):
+            return report
+        if not hasattr(self.producer_sync, "update_format"):
+            print(f"WARNING: {type(self.producer_sync).__name__} does not support reloading the report format")
+            return report
+
+        print("\n\nReport format changed. Syncing ..\n\n")
+        schema_diff = diff_report_format(self.format, report_format)
+        self.format = report_format
+        self.producer_sync.update_format(report_format)
+        if not hasattr(self.consumer_sync, "update_schema"):
+            return report
+        with STAGE_DURATION.time(stage="pull"):
+            new_report = self.producer_sync.pull()
+        with STAGE_DURATION.time(stage="push"):
+            self.consumer_sync.update_schema(report_format, new_report, schema_diff)
+        return rebase_report(report, new_report, schema_diff)
+
+    def push(self, report, diff_report):
+        """Push the changes of a diff report to the consumer.
+
+        Args:
+            report (dict): The new report.
+            diff_report (dict): The diff report describing the changes.
+        """
+        self.freshness.stamp(diff_report, report, getattr(self.producer_sync, "run_timestamps", {}))
+        # Added Experiments
+        if diff_report["new"]:
+            print("\n\nNew Experiments added. Syncing ..\n\n")
+            with STAGE_DURATION.time(stage="push"):
+                self.consumer_sync.push(
+                    report,
+                    command="create",
+                    diff_report=diff_report,
+                )
+            self.freshness.commit(diff_report["new"])
+        # Updated Experiments
+        if diff_report["updated"]:
+            print("\n\nUpdated Experiments. Syncing ..\n\n")
+            with STAGE_DURATION.time(stage="push"):
+                self.consumer_sync.push(
+                    report,
+                    command="update",
+                    diff_report=diff_report,
+                )
+            self.freshness.commit(diff_report["updated"])
+        # Deleted Experiments
+        if diff_report["deleted"]:
+            print("\n\nDeleted Experiments. Syncing ..\n\n")
+            with STAGE_DURATION.time(stage="push"):
+                self.consumer_sync.push(
+                    report,
+                    command="delete",
+                    diff_report=diff_report,
+                )
+
+    def stream(self):
+        """Sync the producer with the consumer one experiment at a time.
+
+        Each experiment is pulled, diffed against the fingerprints of its synced runs, pushed and released before
+        the next one is pulled, so that memory is bounded by the largest experiment rather than the whole report.
+        Experiments that were synced but not pulled anymore are deleted at the end.
+        """
+        # The consumer applies column changes, the fingerprints of the runs catch up with the new format
+        self.reload_format({})
+        experiments = self.producer_sync.pull_experiments()
+        experiment_names = set()
+        while True:
+            with STAGE_DURATION.time(stage="pull"):
+                experiment_name, experiment = next(experiments, (None, None))
+            if experiment_name is None:
+                break
+            experiment_names.add(experiment_name)
+            with STAGE_DURATION.time(stage="diff"):
+                diff_report, self.fingerprints[experiment_name] = diff_experiment(
+                    experiment_name, experiment, self.fingerprints.get(experiment_name)
+                )
+            if diff_report["new"] or diff_report["updated"]:
+                self.push({experiment_name: experiment}, diff_report)
+            if hasattr(self.consumer_sync, "release"):
+                self.consumer_sync.release(experiment_name)
+            experiment = None
+
+        # Experiments that are gone
+        diff_report = diff_deleted(self.fingerprints, experiment_names)
+        if diff_report["deleted"]:
+            self.push({}, diff_report)
+            for experiment_name in diff_report["deleted"]:
+                del self.fingerprints[experiment_name]
+
+    def sync(self, refresh_rate, report=None):
         """Sync between the producer and the destination.
 
         Creates a diff report whenever there is a difference between the producer and the destination.
         Then the diff report is uploaded to the destination. We do not update the producer for any changes.
         The sync process runs in a loop until the user stops it. Refresh rate is an argument.
 
+        When the producer watches for changes (e.g. file system notifications on a local mlruns/ directory), the
+        loop wakes up on the hints instead of the refresh rate and only re-reads the hinted runs. A full pull still
+        happens every HINTS_RECONCILE_INTERVAL seconds to catch up with missed notifications. Hints posted to the
+        ingest endpoint are handled the same way, between the full pulls at the refresh rate.
+
+        Producers that track the lifecycle of the runs only pull the runs that can still change at each tick, and
+        re-check the runs in a terminal state every reconcile_rate seconds.
+
+        The consumer is pulled again every consumer_pull_rate seconds, so that the changes made in the consumer
+        (e.g. rows edited or removed by hand) are reverted by the next push (see reconcile_report). These pulls only
+        read the entries changed since the previous one, except every CONSUMER_FULL_PULL_EVERY pulls, which read all
+        the entries to catch up with removed ones.
+
+        In streaming mode, each tick streams all the experiments through pull, diff and push (see stream), and
+        hints only wake the loop up. The consumer is only pulled at startup.
+
         Args:
             refresh_rate (int): Refresh rate in seconds
+            report (dict): The report already synced to the consumer, e.g., by a backfill (Optional)
         """
 
         # Get current destination state and convert to mlflow report
-        # Note: We currently do not sync with Consumer regularly, we only push updates.
-        # Assumption here is that the user does not change content in the consumer.
-        # We may change this in the future based on the user's needs.
-        report = self.consumer_sync.pull()
+        if report is None:
+            report = self.consumer_sync.pull(full=True)
+        # Streaming only keeps the fingerprints of the synced runs
+        if self.streaming:
+            self.fingerprints = report_fingerprints(report)
+            report = None
+            for experiment_name in self.fingerprints:
+                if hasattr(self.consumer_sync, "release"):
+                    self.consumer_sync.release(experiment_name)
+
+        # Time of the last tick that brought the consumer in sync with the producer
+        synced_at = [None]
+        SYNC_LAG.set_function(lambda: None if synced_at[0] is None else time.time() - synced_at[0])
+
+        if self.watching:
+            print("Watching the producer for changes, polling is disabled.")
+        hints = set()
+        full_pull_at = None
+        # Columnar report of the synced report, in columnar mode
+        columnar_report = None
+        if self.columnar:
+            from mlsync.engine.columnar import ColumnarReport
+        # Interval of the full pulls
+        full_pull_interval = HINTS_RECONCILE_INTERVAL if self.watching else refresh_rate
+        # Time and count of the pulls of the consumer
+        consumer_pull_at = time.time()
+        consumer_pulls = 0
 
         # Keep running in the background to sync
         while True:
-            # Get current MLFlow report
-            new_report = self.producer_sync.pull()
+            tick_start = time.time()
+            if self.streaming:
+                self.stream()
+                CONVERSION_FAILURES.warn()
+                full_pull_at = synced_at[0] = tick_start
+                hints = self.wait(refresh_rate, full_pull_at + full_pull_interval)
+                continue
+
+            # Apply the changes of the report format file
+            report = self.reload_format(report)
+
+            # Catch up with the changes made in the consumer. The producer still merges its partial pulls into the
+            # report it pulled, not the one of the consumer
+            producer_report = report
+            if self.consumer_pull_rate and tick_start >= consumer_pull_at + self.consumer_pull_rate:
+                consumer_pulls += 1
+                with STAGE_DURATION.time(stage="consumer_pull"):
+                    consumer_report = self.consumer_sync.pull(full=consumer_pulls % CONSUMER_FULL_PULL_EVERY == 0)
+                report = reconcile_report(report, consumer_report)
+                consumer_pull_at = tick_start
+
+            # Get current MLFlow report: only the hinted runs, or everything
+            with STAGE_DURATION.time(stage="pull"):
+                if (
+                    hints
+                    and hasattr(self.producer_sync, "pull_runs")
+                    and full_pull_at is not None
+                    and tick_start < full_pull_at + full_pull_interval
+                    and not RunHints.needs_full_pull(hints)
+                ):
+                    new_report = self.producer_sync.pull_runs(producer_report, hints)
+                elif self.lifecycle is not None:
+                    new_report = self.producer_sync.pull_active(producer_report, self.lifecycle)
+                    full_pull_at = tick_start
+                else:
+                    new_report = self.producer_sync.pull()
+                    full_pull_at = tick_start
+            # A single warning for the values of the tick that could not be typified
+            CONVERSION_FAILURES.warn()
 
             # Find out if there is any change
-            diff_report = diff(report, new_report)
+            with STAGE_DURATION.time(stage="diff"):
+                if self.columnar:
+                    # The producer merges its partial pulls into the dict report, only the diff is columnar. The
+                    # tables of the synced report are reused, unless e.g. a new report format rebased it
+                    columnar_report = ColumnarReport.from_report(report, columnar_report)
+                    new_columnar_report = ColumnarReport.from_report(new_report, columnar_report)
+                    diff_report = diff(columnar_report, new_columnar_report)
+                else:
+                    diff_report = diff(report, new_report)
 
             # Update Notion page if there is any change
             if diff_report:
                 # Update the report
                 report = new_report
-                # Added Experiments
-                if diff_report["new"]:
-                    print("\n\nNew Experiments added. Syncing ..\n\n")
-                    self.consumer_sync.push(
-                        report,
-                        command="create",
-                        diff_report=diff_report,
-                    )
-                # Updated Experiments
-                if diff_report["updated"]:
-                    print("\n\nUpdated Experiments. Syncing ..\n\n")
-                    self.consumer_sync.push(
-                        report,
-                        command="update",
-                        diff_report=diff_report,
-                    )
-                # Deleted Experiments
-                if diff_report["deleted"]:
-                    print("\n\nDeleted Experiments. Syncing ..\n\n")
-                    notion_state = self.consumer_sync.push(
-                        report,
-                        command="delete",
-                        diff_report=diff_report,
-                    )
-
-            # Sleep for x seconds
-            time.sleep(refresh_rate)
+                if self.columnar:
+                    columnar_report = new_columnar_report
+                    self.push(columnar_report, diff_report)
+                else:
+                    self.push(report, diff_report)
+            synced_at[0] = tick_start
+            hints = self.wait(refresh_rate, full_pull_at + full_pull_interval)
+
+    def wait(self, refresh_rate, full_pull_due):
+        """Wait for hints until the next full pull, or sleep for the refresh rate.
+
+        Args:
+            refresh_rate (int): Refresh rate in seconds
+            full_pull_due (float): Time of the next full pull.
+
+        Returns:
+            set: The hints collected, empty after a sleep.
+        """
+        if self.watching or self.ingest_server:
+            return self.hints.wait(timeout=full_pull_due - time.time(), debounce=HINTS_DEBOUNCE)
+        time.sleep(refresh_rate)
+        return set()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from mlsync.producers.mlflow.mlflow_formatter import MLFlowFormatter
+from mlsync.utils.utils import CONVERSION_FAILURES
+
+# Runs per page of the searches formatted by the pool, each page is a chunk of work for a worker
+FORMAT_POOL_CHUNK = 2000
+# Pulls with fewer runs are formatted in the sync process. Formatting costs ~75us per run, rebuilding the runs sent
+# back by the workers ~30us per run in the sync process, so the pool needs at least 2 CPUs, and below this the startup
+# of the workers and the transfers of the pages are not amortized
+FORMAT_POOL_THRESHOLD = 20000
+
+# Formatter of a worker process, created once from the compiled report format
+worker_formatter = None
+
+
+def init_worker(report_format):
+    """Create the formatter of a worker process.
+
+    Args:
+        report_format (dict): The compiled report format.
+    """
+    global worker_formatter
+    worker_formatter = MLFlowFormatter.from_compiled(report_format)
+
+
+def format_page(page, formatter=None):
+    """Parse and format a page of runs, as returned by the MLFlow search.
+
+    The formatted runs are packed to be cheap to send back: the metadata shared by the cells of an alias is sent
+    once per page as a template, and each cell as (alias, template, value). See unpack_runs.
+
+    Args:
+        page (bytes): The raw JSON response of runs/search.
+        formatter (MLFlowFormatter): The formatter (default: the formatter of the worker process)
+
+    Returns:
+        dict: {"templates": [cell metadata], "runs": [(run_id, [(alias, template, value)])] in search order,
+            "timestamps": {run_id: timestamp}, "statuses": {run_id: (status, start_time)},
+            "failures": the failed conversions, see ConversionFailures.pop}
+    """
+    from mlsync.producers.mlflow.mlflow_sync import MLFlowSync
+
+    formatter = formatter or worker_formatter
+    runs = json.loads(page).get("runs", [])
+    templates = []
+    # Template of the last cell of each alias, runs mostly share the metadata of an alias
+    last_templates = {}
+    packed_runs = []
+    for run_id, run in formatter.generate_run(runs, False).items():
+        cells = []
+        for alias, cell in run.items():
+            template = {**cell, "value": None}
+            index = last_templates.get(alias)
+            if index is None or templates[index] != template:
+                templates.append(template)
+                index = last_templates[alias] = len(templates) - 1
+            cells.append((alias, index, cell["value"]))
+        packed_runs.append((run_id, cells))
+    return {
+        "templates": templates,
+        "runs": packed_runs,
+        "timestamps": {run["info"]["run_id"]: MLFlowSync.run_timestamp(run) for run in runs},
+        "statuses": {run["info"]["run_id"]: MLFlowSync.run_status(run) for run in runs},
+        # Reported by the sync process
+        "failures": CONVERSION_FAILURES.pop(),
+    }
+
+
+def unpack_runs(formatted_page):
+    """Rebuild the runs of a formatted page, see format_page, and record its failed conversions.
+
+    Yields:
+        (str, dict): The id of the run and the run.
+    """
+    CONVERSION_FAILURES.merge(formatted_page["failures"])
+    templates = formatted_page["templates"]
+    for run_id, cells in formatted_page["runs"]:
+        yield run_id, {alias: {**templates[index], "value": value} for alias, index, value in cells}
+
+
+def count_runs(page):
+    """Estimate the number of runs of a raw page without parsing it."""
+    return page.count(b'"run_id"')
+
+
+class FormatPool:
+    """Formats the pages of large pulls in worker processes.
+
+    Formatting is pure Python and bound to a single core by the GIL. Pages of runs are shipped to the workers as
+    the raw JSON bytes returned by MLFlow, and each worker parses and formats them with the compiled report format
+    it received once at startup. Only pulls of more than threshold runs use the workers (and only with more than one
+    CPU), smaller pulls are formatted in the sync process. Metric histories are fetched over HTTP and are not
+    formatted by the pool.
+
+    Args:
+        report_format (dict): The compiled report format.
+        workers (int): Number of worker processes (default: number of CPUs)
+        threshold (int): Minimum number of runs of a pull to use the workers.
+    """
+
+    def __init__(self, report_format, workers=None, threshold=FORMAT_POOL_THRESHOLD):
+        """Initialize the FormatPool object"""
+        self.report_format = report_format
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self.formatter = MLFlowFormatter.from_compiled(report_format)
+        self.executor = None
+
+    def parallel(self, pages):
+        """Whether the pages are worth formatting in the workers."""
+        return self.workers > 1 and sum(count_runs(page) for page in pages) >= self.threshold
+
+    def format_pages(self, pages):
+        """Parse and format pages of runs, see format_page.
+
+        Args:
+            pages (list): The raw JSON responses of runs/search.
+
+        Returns:
+            list: The formatted pages, in order.
+        """
+        if not self.parallel(pages):
+            return [format_page(page, self.formatter) for page in pages]
+        if self.executor is None:
+            # Spawned workers do not inherit the threads (watchers, ingest server) of the sync process
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(self.report_format,),
+            )
+        return list(self.executor.map(format_page, pages))
+
+    def close(self):
+        """Stop the worker processes."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
@@ -1,3 +1,4 @@
+import re
 import requests
 import time
 import sys
@@ -5,6 +6,11 @@ import subprocess
 from urllib.parse import urlparse, urljoin
 
 from mlsync.utils.utils import url_remove_trailing_slug
+from mlsync.utils.metrics import METRICS, HTTP_REQUESTS, HTTP_BYTES
+
+# Token of the next page in a raw runs/search response. Quotes are escaped in the values of the runs, which cannot
+# match.
+NEXT_PAGE_TOKEN = re.compile(rb'"next_page_token"\s*:\s*"([^"]*)"')
 
 
 class MLFlowAPI:
@@ -29,7 +35,7 @@ class MLFlowAPI:
         status = False
         # Test if the URL is up
         try:
-            r = requests.head(url.netloc)
+            r = requests.head(url)
             status = r.status_code == 200
         # Connection Error
         except:
@@ -66,6 +72,21 @@ class MLFlowAPI:
         if not status:
             sys.exit("Max Attempts reached. MLFlow server is not up. Manually try to start the server with `mlflow ui`")
 
+    def request(self, method, endpoint, **kwargs):
+        """Send a request to the MLFlow REST API.
+
+        Args:
+            method (str): HTTP method
+            endpoint (str): API endpoint, e.g. runs/search
+            **kwargs: Arguments of requests.request (e.g. json)
+        """
+        r = requests.request(method, f"{self.mlflowRoot}/2.0/mlflow/{endpoint}", **kwargs)
+        if METRICS.enabled:
+            HTTP_REQUESTS.inc(api="mlflow", method=endpoint, status=r.status_code)
+            HTTP_BYTES.inc(len(r.request.body or b""), api="mlflow", direction="sent")
+            HTTP_BYTES.inc(len(r.content), api="mlflow", direction="received")
+        return r
+
     def getExperiment(self, experiment_id):
         """
         Get the experiment with the given id
@@ -73,15 +94,13 @@ class MLFlowAPI:
         Args:
             experiment_id (str): experiment id
         """
-        url = f"{self.mlflowRoot}/2.0/mlflow/experiments/get"
-        r = requests.get(url, json={"experiment_id": experiment_id})
+        r = self.request("GET", "experiments/get", json={"experiment_id": experiment_id})
         result_dict = r.json()
         return result_dict["experiment"]
 
     def getExperiments(self):
         """Get all the experiments"""
-        url = f"{self.mlflowRoot}/2.0/mlflow/experiments/list"
-        r = requests.get(url)
+        r = self.request("GET", "experiments/list")
         result_dict = r.json()
         return result_dict["experiments"]
 
@@ -92,29 +111,80 @@ class MLFlowAPI:
         max_results=50000,
         order_by=None,
         page_token=None,
+        all_pages=True,
     ):
         """Get the runs with the given experiment id and other filters
 
         Args:
             experiment_id (str): experiment id
             filter_string (str): filter string for the query
-            max_results (int): max number of results to return
+            max_results (int): max number of results to return per page
             order_by (str): order by field
             page_token (str): page token
+            all_pages (bool): follow the next page tokens until all the runs are fetched
         """
-        url = f"{self.mlflowRoot}/2.0/mlflow/runs/search"
-        r = requests.post(
-            url,
-            json={
-                "experiment_ids": [experiment_id],
-                "filter_string": filter_string,
-                "max_results": max_results,
-                "order_by": order_by,
-                "page_token": page_token,
-            },
-        )
+        runs = []
+        while True:
+            r = self.request(
+                "POST",
+                "runs/search",
+                json={
+                    "experiment_ids": [experiment_id],
+                    "filter_string": filter_string,
+                    "max_results": max_results,
+                    "order_by": order_by,
+                    "page_token": page_token,
+                },
+            )
+            result_dict = r.json()
+            runs.extend(result_dict["runs"] if ('runs' in result_dict) else [])
+            page_token = result_dict.get("next_page_token")
+            if not (all_pages and page_token):
+                return runs
+
+    def getExperimentRunsPages(self, experiment_id, filter_string=None, max_results=50000, order_by=None, all_pages=True):
+        """Get the runs with the given experiment id and other filters, as the raw JSON responses.
+
+        Same arguments as getExperimentRuns. The responses are not parsed, e.g. to parse them in other processes.
+
+        Returns:
+            list: The raw JSON responses (bytes), one per page.
+        """
+        pages = []
+        page_token = None
+        while True:
+            r = self.request(
+                "POST",
+                "runs/search",
+                json={
+                    "experiment_ids": [experiment_id],
+                    "filter_string": filter_string,
+                    "max_results": max_results,
+                    "order_by": order_by,
+                    "page_token": page_token,
+                },
+            )
+            pages.append(r.content)
+            tokens = NEXT_PAGE_TOKEN.findall(r.content)
+            page_token = tokens[-1].decode() if tokens else None
+            if not (all_pages and page_token):
+                return pages
+
+    def getRun(self, run_id):
+        """
+        Get the run with the given id
+
+        Args:
+            run_id (str): run id, unique for each run
+
+        Returns:
+            dict: The run, None if it does not exist.
+        """
+        r = self.request("GET", "runs/get", json={"run_id": run_id})
+        if r.status_code == 404:
+            return None
         result_dict = r.json()
-        return result_dict["runs"] if ('runs' in result_dict) else []
+        return result_dict["run"]
 
     def getRunMetric(self, run_id, metric_key):
         """
@@ -124,8 +194,7 @@ class MLFlowAPI:
             run_id (str): run id, unique for each run
             metric_key (str): metric key to get. For example, accuracy
         """
-        url = f"{self.mlflowRoot}/2.0/mlflow/metrics/get-history"
-        r = requests.get(url, json={"run_id": run_id, "metric_key": metric_key})
+        r = self.request("GET", "metrics/get-history", json={"run_id": run_id, "metric_key": metric_key})
         result_dict = r.json()
         return result_dict["metrics"] if ('metrics' in result_dict) else []
 
@@ -1,5 +1,9 @@
+from array import array
+
 from mlsync.producers.mlflow.mlflow_api import MLFlowAPI
-from mlsync.utils.utils import typify
+from mlsync.utils.downsample import downsample
+from mlsync.utils.utils import typify_column
+from mlsync.utils.report_format import compile_report_format
 
 
 class MLFlowFormatter:
@@ -8,13 +12,40 @@ class MLFlowFormatter:
     Args:
         report_format (dict): The report format to be used.
         mlflow_api (MLFlowAPI): The MLFlow API object.
+        history_store (HistoryStore): Local store of the metric histories, see mlsync.utils.history_store (Optional)
     """
 
-    def __init__(self, report_format: dict, mlflow_api: MLFlowAPI):
+    def __init__(self, report_format: dict, mlflow_api: MLFlowAPI, history_store=None):
         """Initialize the MLFlowFormatter object"""
         self.mlflow_api = mlflow_api
+        self.history_store = history_store
+        # The compiled report format is cached and shared, it must not be modified
+        self.report_format = compile_report_format(report_format, "mlflow", self.compile_report_format)
+
+    @classmethod
+    def from_compiled(cls, report_format, mlflow_api=None, history_store=None):
+        """Create a formatter from an already compiled report format, e.g. in a worker process.
+
+        Args:
+            report_format (dict): The compiled report format (the report_format of another formatter).
+            mlflow_api (MLFlowAPI): The MLFlow API object, only needed for the metric histories (Optional)
+            history_store (HistoryStore): Local store of the metric histories (Optional)
+        """
+        formatter = cls.__new__(cls)
+        formatter.mlflow_api = mlflow_api
+        formatter.history_store = history_store
+        formatter.report_format = report_format
+        return formatter
+
+    def compile_report_format(self, report_format):
+        """Augment the report format and add the alias table.
+
+        Args:
+            report_format (dict): Report format dict.
+        """
         self.report_format = self.augment_report_format(report_format)
         self.add_alias_table()
+        return self.report_format
 
     def augment_report_format(self, report_format):
         """This function will augment over the user provided report format.
@@ -57,6 +88,7 @@ class MLFlowFormatter:
             "experiment": experiment_report_format,
             "policies": report_format["policies"],
             "order": report_format["order"],
+            "history": report_format.get("history") or {},
         }
 
     def format_in(self, experiments: dict, runs: dict, detailed_metrics: bool) -> dict:
@@ -137,6 +169,8 @@ class MLFlowFormatter:
         """
         # Placeholder for the run report
         report = {}
+        # Cells of each element, typified by column once all the runs are added: key -> (type, cells, values)
+        columns = {}
 
         # Formats
         run_report_format = self.report_format["run"]
@@ -160,9 +194,12 @@ class MLFlowFormatter:
                 if key in elements:
                     alias = elements[key]["alias"]
                     val_type = elements[key]['type']
-                    # Try and convert the value to the correct type
-                    updated_value = typify(value, val_type)
-                    report[run_id][alias] = {**elements[key], "key": key, "value": updated_value}
+                    cell = report[run_id][alias] = {**elements[key], "key": key, "value": value}
+                    column = columns.get(key)
+                    if column is None:
+                        column = columns[key] = (val_type, [], [])
+                    column[1].append(cell)
+                    column[2].append(value)
                 else:
                     if policies["unmatched_policy"]['info'] == "add":
                         report[run_id][key] = {"key": key, "value": value, "type": str(type(value))}
@@ -178,23 +215,24 @@ class MLFlowFormatter:
                         if element_type == "metrics" and detailed_metrics:
                             # Add the detailed metrics
                             # Get the detailed data for each metric
-                            metric_data = self.mlflow_api.getRunMetric(run_id, metric["key"])
-                            # Post process the metric data
-                            metric_data = self.generate_run_metrics(metric_data)
+                            metric_data = self.run_metric_history(run_id, metric)
                         else:
                             metric_data = None
                         # Check if the metric is part of elements
                         if key in elements:
                             alias = elements[key]['alias']
                             val_type = elements[key]['type']
-                            # Try and convert the value to the correct type
-                            updated_value = typify(value, val_type)
-                            report[run_id][alias] = {
+                            cell = report[run_id][alias] = {
                                 **elements[key],
                                 "key": key,
-                                "value": updated_value,
+                                "value": value,
                                 "data": metric_data,
                             }
+                            column = columns.get(key)
+                            if column is None:
+                                column = columns[key] = (val_type, [], [])
+                            column[1].append(cell)
+                            column[2].append(value)
                         else:
                             if policies["unmatched_policy"][element_type] == "add":
                                 report[run_id][key] = {
@@ -227,29 +265,77 @@ class MLFlowFormatter:
                     "value": str(run_id),
                     "data": None,
                 }
+
+        # Convert the values to the correct type, one column at a time
+        for val_type, cells, values in columns.values():
+            for cell, value in zip(cells, typify_column(values, val_type)):
+                cell["value"] = value
         return report
 
+    def run_metric_history(self, run_id, metric):
+        """Get the history of a metric of a run.
+
+        With a history store, the history is only fetched from MLFlow when its latest point is not stored yet, and
+        only the new points are appended to the store. When the fetched history also has points before the last
+        stored one (e.g. a batch of earlier steps, or a run resumed from an earlier step), it replaces the stored
+        history. Such points are picked up when the latest point of the metric changes. The history is then read
+        from the store without a copy.
+
+        Args:
+            run_id (str): The id of the run.
+            metric (dict): The latest point of the metric, as in the run data returned by MLFlow.
+        """
+        if self.history_store is None:
+            # Post process the metric data
+            return self.generate_run_metrics(self.mlflow_api.getRunMetric(run_id, metric["key"]))
+
+        key = metric["key"]
+        last_point = self.history_store.last_point(run_id, key)
+        if last_point != (int(metric["step"]), int(metric["timestamp"])):
+            points = self.metric_points(self.mlflow_api.getRunMetric(run_id, key))
+            new_points = points
+            if last_point is not None:
+                new_points = [point for point in points if (int(point["step"]), int(point["timestamp"])) > last_point]
+            if len(points) > self.history_store.length(run_id, key) + len(new_points):
+                self.history_store.replace(run_id, key, *self.history_arrays(points))
+            else:
+                self.history_store.append(run_id, key, *self.history_arrays(new_points))
+        history = self.history_store.read(run_id, key)
+        return {"key": key, **self.downsample_history(history["value"], history["timestamp"], history["step"])}
+
+    def metric_points(self, report_metric):
+        """Points of a metric history ordered by step (then timestamp)."""
+        return sorted(report_metric, key=lambda metric: (int(metric["step"]), int(metric["timestamp"])))
+
+    def history_arrays(self, points):
+        """Typed arrays of the values (doubles), timestamps and steps (64-bit integers) of metric points."""
+        return (
+            array("d", (float(point["value"]) for point in points)),
+            array("q", (int(point["timestamp"]) for point in points)),
+            array("q", (int(point["step"]) for point in points)),
+        )
+
+    def downsample_history(self, value, timestamp, step):
+        """Downsample a metric history to history.max_points points, if the report format sets it."""
+        history = self.report_format.get("history", {})
+        if history.get("max_points"):
+            value, timestamp, step = downsample(value, timestamp, step, history["max_points"], history.get("method", "lttb"))
+        return {"value": value, "timestamp": timestamp, "step": step}
+
     def generate_run_metrics(self, report_metric):
         """Generate the run metrics
 
+        The history is stored in typed arrays (values as doubles, timestamps and steps as 64-bit integers) ordered
+        by step, and downsampled to history.max_points points if the report format sets it.
+
         Args:
             report_metric (dict): The metric information from MLFlow
         """
         # TODO: clean up the run metrics based on report.yaml
         # TODO: based on type of the metric, change the return type
         if report_metric:
-            value, timestamp, step = [], [], []
-            for metric in report_metric:
-                value.append(metric["value"])
-                timestamp.append(metric["timestamp"])
-                step.append(metric["step"])
-            metric_info = {
-                "key": report_metric[0]["key"],
-                "value": value,
-                "timestamp": timestamp,
-                "step": step,
-            }
-            return metric_info
+            points = self.metric_points(report_metric)
+            return {"key": points[0]["key"], **self.downsample_history(*self.history_arrays(points))}
         else:
             return {}
 
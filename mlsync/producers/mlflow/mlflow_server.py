@@ -0,0 +1,500 @@
+import base64
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Statuses of runs that are still going on, and of runs that are over
+ACTIVE_STATUSES = ["RUNNING", "SCHEDULED"]
+TERMINAL_STATUSES = ["FINISHED", "FAILED", "KILLED"]
+
+# Entities of the search filter and order by clauses
+FILTER_ENTITIES = {
+    "attributes": "attributes",
+    "attribute": "attributes",
+    "attr": "attributes",
+    "run": "attributes",
+    "metrics": "metrics",
+    "metric": "metrics",
+    "params": "params",
+    "param": "params",
+    "parameter": "params",
+    "parameters": "params",
+    "tags": "tags",
+    "tag": "tags",
+}
+FILTER_CLAUSE = re.compile(
+    r"\s*(?P<entity>\w+)\.(?P<key>`[^`]+`|\"[^\"]+\"|[\w.]+)\s*"
+    r"(?P<op>!=|<=|>=|=|<|>|\bNOT\s+IN\b|\bIN\b|\bILIKE\b|\bLIKE\b)\s*"
+    r"(?P<value>\([^)]*\)|'[^']*'|\"[^\"]*\"|[-+\w.]+)\s*",
+    re.IGNORECASE,
+)
+
+
+class MLFlowServerError(Exception):
+    """An error returned by the MLFlow stand-in, in the format of the MLFlow REST API."""
+
+    def __init__(self, status, error_code, message):
+        super().__init__(message)
+        self.status = status
+        self.error_code = error_code
+        self.message = message
+
+
+def parse_filter(filter_string):
+    """Parse an MLFlow search filter into a list of (entity, key, operator, value) clauses.
+
+    Supports the subset of the MLFlow search syntax used by mlsync: comparisons on attributes, metrics, params
+    and tags joined with AND.
+
+    Args:
+        filter_string (str): The filter, e.g. "attributes.status = 'RUNNING' AND metrics.accuracy > 0.9"
+    """
+    clauses = []
+    if not filter_string or not filter_string.strip():
+        return clauses
+    for clause in re.split(r"\s+AND\s+", filter_string.strip(), flags=re.IGNORECASE):
+        match = FILTER_CLAUSE.fullmatch(clause)
+        if not match or match["entity"].lower() not in FILTER_ENTITIES:
+            raise MLFlowServerError(400, "INVALID_PARAMETER_VALUE", f"Invalid clause(s) in filter string: {clause}")
+        entity = FILTER_ENTITIES[match["entity"].lower()]
+        key = match["key"].strip("`\"")
+        value = match["value"]
+        if value.startswith("("):
+            value = [item.strip().strip("'\"") for item in value[1:-1].split(",") if item.strip()]
+        elif value[0] in "'\"":
+            value = value[1:-1]
+        else:
+            value = float(value)
+        clauses.append((entity, key, " ".join(match["op"].upper().split()), value))
+    return clauses
+
+
+def match_clause(run_value, operator, value):
+    """Check a value of a run against a clause of the filter."""
+    if run_value is None:
+        return False
+    if operator in ("LIKE", "ILIKE"):
+        pattern = "^" + re.escape(value).replace("%", ".*").replace("_", ".") + "$"
+        return re.match(pattern, str(run_value), re.IGNORECASE if operator == "ILIKE" else 0) is not None
+    if operator == "IN":
+        return str(run_value) in value
+    if operator == "NOT IN":
+        return str(run_value) not in value
+    if isinstance(value, float):
+        run_value = float(run_value)
+    else:
+        run_value = str(run_value)
+    return {
+        "=": run_value == value,
+        "!=": run_value != value,
+        "<": run_value < value,
+        "<=": run_value <= value,
+        ">": run_value > value,
+        ">=": run_value >= value,
+    }[operator]
+
+
+class MLFlowServer:
+    """Local stand-in of the MLFlow tracking server REST API used by mlsync, for tests and benchmarks.
+
+    Implements experiments/list|get, runs/search (with filter_string, order_by, max_results and page_token),
+    runs/get and metrics/get-history on a localhost HTTP server. The tracking data is generated with generate()
+    and can evolve over time with mutate() to simulate live sweeps. Point MLFlowAPI to f"{server.url}/api".
+
+    Args:
+        host (str): Host to bind to.
+        port (int): Port to bind to, 0 picks a free port.
+        latency (float): Latency added to each request in seconds.
+        seed (int): Seed of the workload generator.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, seed=0):
+        """Initialize the MLFlow server"""
+        self.latency = latency
+        self.random = random.Random(seed)
+        # Tracking data
+        self.experiments = {}
+        self.runs = {}
+        self.histories = {}
+        self.lock = threading.Lock()
+        # Number of requests by (method, endpoint, status)
+        self.requests = Counter()
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+        self.mutator = None
+        self.mutating = threading.Event()
+
+    @property
+    def url(self):
+        """URL of the server, MLFlowAPI expects this URL followed by /api."""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve in a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop mutating and serving."""
+        self.stop_mutating()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        """Number of requests by (method, endpoint, status)."""
+        with self.lock:
+            return dict(self.requests)
+
+    # -- Tracking data -- #
+
+    def add_experiment(self, name):
+        """Add an experiment.
+
+        Args:
+            name (str): The name of the experiment.
+
+        Returns:
+            str: The id of the experiment.
+        """
+        with self.lock:
+            experiment_id = str(len(self.experiments))
+            now = int(time.time() * 1000)
+            self.experiments[experiment_id] = {
+                "experiment_id": experiment_id,
+                "name": name,
+                "artifact_location": f"./mlruns/{experiment_id}",
+                "lifecycle_stage": "active",
+                "last_update_time": now,
+                "creation_time": now,
+            }
+        return experiment_id
+
+    def add_run(self, experiment_id, status="RUNNING", params=None, tags=None, start_time=None):
+        """Add a run to an experiment.
+
+        Args:
+            experiment_id (str): The id of the experiment.
+            status (str): The status of the run.
+            params (dict): Parameters of the run.
+            tags (dict): Tags of the run.
+            start_time (int): Start time in milliseconds, defaults to now.
+
+        Returns:
+            str: The id of the run.
+        """
+        run_id = uuid.UUID(int=self.random.getrandbits(128)).hex
+        start_time = int(time.time() * 1000) if start_time is None else start_time
+        with self.lock:
+            self.runs[run_id] = {
+                "info": {
+                    "run_id": run_id,
+                    "run_uuid": run_id,
+                    "experiment_id": experiment_id,
+                    "user_id": "mlsync",
+                    "status": status,
+                    "start_time": start_time,
+                    "artifact_uri": f"./mlruns/{experiment_id}/{run_id}/artifacts",
+                    "lifecycle_stage": "active",
+                },
+                "data": {
+                    "metrics": [],
+                    "params": [{"key": key, "value": str(value)} for key, value in (params or {}).items()],
+                    "tags": [{"key": key, "value": str(value)} for key, value in (tags or {}).items()],
+                },
+            }
+            if status in TERMINAL_STATUSES:
+                self.runs[run_id]["info"]["end_time"] = start_time
+        return run_id
+
+    def log_metric(self, run_id, key, value, step=0, timestamp=None):
+        """Log a metric point of a run, updating its latest value.
+
+        Args:
+            run_id (str): The id of the run.
+            key (str): The metric key.
+            value (float): The metric value.
+            step (int): The step of the point.
+            timestamp (int): Timestamp of the point in milliseconds, defaults to now.
+        """
+        point = {
+            "key": key,
+            "value": value,
+            "timestamp": int(time.time() * 1000) if timestamp is None else timestamp,
+            "step": step,
+        }
+        with self.lock:
+            self.histories.setdefault((run_id, key), []).append(point)
+            metrics = self.runs[run_id]["data"]["metrics"]
+            for index, metric in enumerate(metrics):
+                if metric["key"] == key:
+                    metrics[index] = point
+                    break
+            else:
+                metrics.append(point)
+
+    def set_status(self, run_id, status, end_time=None):
+        """Change the status of a run, setting its end time if it is over.
+
+        Args:
+            run_id (str): The id of the run.
+            status (str): The new status.
+            end_time (int): End time in milliseconds, defaults to now.
+        """
+        with self.lock:
+            info = self.runs[run_id]["info"]
+            info["status"] = status
+            if status in TERMINAL_STATUSES:
+                info["end_time"] = int(time.time() * 1000) if end_time is None else end_time
+
+    def delete_run(self, run_id):
+        """Delete a run.
+
+        Args:
+            run_id (str): The id of the run.
+        """
+        with self.lock:
+            self.runs.pop(run_id)
+            for key in [key for key in self.histories if key[0] == run_id]:
+                del self.histories[key]
+
+    def generate(self, experiments=1, runs=10, metrics=3, history=10, running_fraction=0.0):
+        """Generate a synthetic workload of experiments x runs x metrics x history points.
+
+        Metric, param and tag names follow the example report format (train_loss, accuracy, test_loss,
+        batch_size, epochs, lr, gamma, mlflow.runName), extra metrics are named metric_<i>.
+
+        Args:
+            experiments (int): Number of experiments.
+            runs (int): Number of runs per experiment.
+            metrics (int): Number of metrics per run.
+            history (int): Number of history points per metric.
+            running_fraction (float): Fraction of the runs still RUNNING, the others are FINISHED.
+        """
+        metric_keys = (["train_loss", "accuracy", "test_loss"] + [f"metric_{i}" for i in range(3, metrics)])[:metrics]
+        now = int(time.time() * 1000)
+        for experiment_index in range(experiments):
+            experiment_id = self.add_experiment(f"Experiment {experiment_index}")
+            for run_index in range(runs):
+                running = self.random.random() < running_fraction
+                start_time = now - (runs - run_index) * 60000
+                run_id = self.add_run(
+                    experiment_id,
+                    status="RUNNING" if running else "FINISHED",
+                    params={
+                        "batch_size": self.random.choice([32, 64, 128]),
+                        "epochs": history,
+                        "lr": self.random.choice([0.1, 0.01, 0.001]),
+                        "gamma": round(self.random.uniform(0.5, 1), 2),
+                    },
+                    tags={"mlflow.runName": f"run-{experiment_index}-{run_index}"},
+                    start_time=start_time,
+                )
+                for key in metric_keys:
+                    for step in range(history):
+                        self.log_metric(run_id, key, self.random.random(), step=step, timestamp=start_time + step)
+                if not running:
+                    self.set_status(run_id, "FINISHED", end_time=start_time + history)
+
+    def mutate(self, finish_probability=0.1, points=1, new_runs=0):
+        """Evolve the workload by one step: RUNNING runs log new points and may finish, new runs may start.
+
+        Args:
+            finish_probability (float): Probability for each RUNNING run to become FINISHED.
+            points (int): Number of points appended to each metric of the RUNNING runs.
+            new_runs (int): Number of RUNNING runs added to random experiments.
+        """
+        with self.lock:
+            running = [run_id for run_id, run in self.runs.items() if run["info"]["status"] == "RUNNING"]
+            experiment_ids = list(self.experiments)
+        for run_id in running:
+            with self.lock:
+                last_points = list(self.runs[run_id]["data"]["metrics"])
+            for metric in last_points:
+                for step in range(1, points + 1):
+                    self.log_metric(run_id, metric["key"], self.random.random(), step=metric["step"] + step)
+            if self.random.random() < finish_probability:
+                self.set_status(run_id, "FINISHED")
+        for _ in range(new_runs if experiment_ids else 0):
+            run_id = self.add_run(self.random.choice(experiment_ids), status="RUNNING")
+            self.log_metric(run_id, "train_loss", self.random.random(), step=0)
+
+    def start_mutating(self, interval=1.0, **kwargs):
+        """Call mutate() every interval seconds in a background thread to simulate a live sweep.
+
+        Args:
+            interval (float): Seconds between two mutations.
+            **kwargs: Arguments of mutate().
+        """
+        self.mutating.set()
+
+        def loop():
+            while self.mutating.is_set():
+                self.mutate(**kwargs)
+                time.sleep(interval)
+
+        self.mutator = threading.Thread(target=loop, daemon=True)
+        self.mutator.start()
+
+    def stop_mutating(self):
+        """Stop the background mutations."""
+        self.mutating.clear()
+        if self.mutator:
+            self.mutator.join()
+            self.mutator = None
+
+    # -- Endpoints -- #
+
+    def run_value(self, run, entity, key):
+        """Value of a run for an entity and key of the search syntax."""
+        if entity == "attributes":
+            key = {"run_id": "run_uuid", "run_name": "run_name"}.get(key, key)
+            return run["info"].get(key)
+        for item in run["data"][entity]:
+            if item["key"] == key:
+                return item["value"]
+        return None
+
+    def search_runs(self, body):
+        experiment_ids = body.get("experiment_ids") or []
+        clauses = parse_filter(body.get("filter_string"))
+        runs = [
+            run
+            for run in self.runs.values()
+            if run["info"]["experiment_id"] in experiment_ids
+            and all(match_clause(self.run_value(run, *clause[:2]), *clause[2:]) for clause in clauses)
+        ]
+        # Order by the given keys, then start time (latest first) and run id, as MLFlow does
+        runs.sort(key=lambda run: run["info"]["run_id"])
+        runs.sort(key=lambda run: run["info"]["start_time"], reverse=True)
+        for order in reversed(body.get("order_by") or []):
+            tokens = order.split()
+            entity, key = tokens[0].split(".", 1)
+            entity = FILTER_ENTITIES.get(entity.lower(), "attributes")
+            descending = len(tokens) > 1 and tokens[1].upper() == "DESC"
+            # Runs without the key go last
+            present = [run for run in runs if self.run_value(run, entity, key) is not None]
+            missing = [run for run in runs if self.run_value(run, entity, key) is None]
+            present.sort(key=lambda run: self.run_value(run, entity, key), reverse=descending)
+            runs = present + missing
+        # Pagination
+        max_results = int(body.get("max_results") or 1000)
+        offset = json.loads(base64.b64decode(body["page_token"]))["offset"] if body.get("page_token") else 0
+        page = runs[offset : offset + max_results]
+        response = {"runs": page} if page else {}
+        if offset + max_results < len(runs):
+            response["next_page_token"] = base64.b64encode(json.dumps({"offset": offset + max_results}).encode()).decode()
+        return response
+
+    def get_experiment(self, body):
+        experiment_id = str(body.get("experiment_id"))
+        if experiment_id not in self.experiments:
+            raise MLFlowServerError(404, "RESOURCE_DOES_NOT_EXIST", f"No Experiment with id={experiment_id} exists")
+        return {"experiment": self.experiments[experiment_id]}
+
+    def get_run(self, body):
+        run_id = body.get("run_id") or body.get("run_uuid")
+        if run_id not in self.runs:
+            raise MLFlowServerError(404, "RESOURCE_DOES_NOT_EXIST", f"Run '{run_id}' not found.")
+        return {"run": self.runs[run_id]}
+
+    def get_history(self, body):
+        return {"metrics": self.histories.get((body.get("run_id") or body.get("run_uuid"), body.get("metric_key")), [])}
+
+    def route(self, method, path, body):
+        """Dispatch a request to its endpoint.
+
+        Returns:
+            (str, dict): The name of the endpoint and the response.
+        """
+        routes = {
+            ("GET", "/api/2.0/mlflow/experiments/list"): ("experiments.list", lambda: {"experiments": list(self.experiments.values())}),
+            ("GET", "/api/2.0/mlflow/experiments/get"): ("experiments.get", lambda: self.get_experiment(body)),
+            ("POST", "/api/2.0/mlflow/runs/search"): ("runs.search", lambda: self.search_runs(body)),
+            ("GET", "/api/2.0/mlflow/runs/get"): ("runs.get", lambda: self.get_run(body)),
+            ("GET", "/api/2.0/mlflow/metrics/get-history"): ("metrics.get-history", lambda: self.get_history(body)),
+        }
+        if (method, path) not in routes:
+            raise MLFlowServerError(404, "ENDPOINT_NOT_FOUND", f"No endpoint for {method} {path}")
+        endpoint, handle = routes[(method, path)]
+        with self.lock:
+            # Serialize under the lock, the data may be mutated concurrently
+            return endpoint, json.dumps(handle()).encode()
+
+    def handler(self):
+        """Request handler class bound to this server."""
+        server = self
+
+        class MLFlowRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def respond(self, endpoint, status, data):
+                with server.lock:
+                    server.requests[(self.command, endpoint, status)] += 1
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(data)
+
+            def handle_request(self):
+                url = urlparse(self.path)
+                # The UI root, used to check if the server is up
+                if url.path in ("", "/"):
+                    return self.respond("root", 200, b"{}")
+                # Parameters are passed as query strings or, by MLFlowAPI, as JSON bodies (even with GET)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else {}
+                for key, values in parse_qs(url.query).items():
+                    body.setdefault(key, values if key in ("experiment_ids", "order_by") else values[0])
+                if server.latency:
+                    time.sleep(server.latency)
+                try:
+                    endpoint, data = server.route(self.command, url.path.rstrip("/"), body)
+                except MLFlowServerError as e:
+                    error = {"error_code": e.error_code, "message": e.message}
+                    return self.respond("error", e.status, json.dumps(error).encode())
+                self.respond(endpoint, 200, data)
+
+            do_GET = do_POST = do_HEAD = handle_request
+
+        return MLFlowRequestHandler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local stand-in of the MLFlow tracking server.")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--experiments", type=int, default=2)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--metrics", type=int, default=3)
+    parser.add_argument("--history", type=int, default=100)
+    parser.add_argument("--running-fraction", type=float, default=0.2)
+    parser.add_argument("--mutate-interval", type=float, default=0, help="Seconds between mutations, 0 to disable")
+    args = parser.parse_args()
+
+    mlflow_server = MLFlowServer(port=args.port)
+    mlflow_server.generate(args.experiments, args.runs, args.metrics, args.history, args.running_fraction)
+    if args.mutate_interval:
+        mlflow_server.start_mutating(args.mutate_interval, new_runs=1)
+    print(f"MLFlow tracking server stand-in on {mlflow_server.url}")
+    mlflow_server.server.serve_forever()
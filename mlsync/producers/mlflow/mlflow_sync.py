@@ -1,43 +1,493 @@
+import os
+import time
+
 from mlsync.producers.mlflow.mlflow_api import MLFlowAPI
 from mlsync.producers.mlflow.mlflow_formatter import MLFlowFormatter
+from mlsync.producers.mlflow.format_pool import FormatPool, FORMAT_POOL_CHUNK, FORMAT_POOL_THRESHOLD, unpack_runs
 from mlsync.utils.utils import yaml_loader
+from mlsync.utils.metrics import STAGE_DURATION
+from mlsync.utils.history_store import HistoryStore
+from mlsync.utils.report_format import parse_duration
+
+# MLFlow search filter of the runs that are not in a terminal state (RUNNING, SCHEDULED)
+ACTIVE_RUNS_FILTER = "attributes.status != 'FINISHED' AND attributes.status != 'FAILED' AND attributes.status != 'KILLED'"
 
 
 class MLFlowSync:
     """Generate the report"""
 
-    def __init__(self, mlflow_uri, report_format):
+    def __init__(
+        self, mlflow_uri, report_format, mlruns_dir=None, history_store=None, format_workers=None, format_threshold=None
+    ):
         """Initialize the sync process
 
         Args:
             mlflow_uri (str): The root of the MLFlow server
             report_format (dict): The report format
+            mlruns_dir (str): Local mlruns/ directory of the tracking server, watched for changes (Optional)
+            history_store (str): Directory of the local store of the metric histories (Optional)
+            format_workers (int): Worker processes formatting the runs of large pulls (default: number of CPUs, 0 to
+                format in the sync process)
+            format_threshold (int): Minimum number of runs of a pull to format it in the workers (Optional)
         """
         self.mlflow_api = MLFlowAPI(mlflow_uri)
-        self.mlflow_formatter = MLFlowFormatter(report_format, self.mlflow_api)
+        self.history_store = HistoryStore(history_store) if history_store else None
+        self.mlflow_formatter = MLFlowFormatter(report_format, self.mlflow_api, history_store=self.history_store)
+        # Formatting of large pulls in worker processes
+        self.format_workers = (os.cpu_count() or 1) if format_workers is None else format_workers
+        self.format_threshold = format_threshold or FORMAT_POOL_THRESHOLD
+        self.format_pool = None
+        # Number of runs of the last full pull, the pages of the pool are only searched for large pulls
+        self.pulled_runs = None
+        # A single worker gains nothing over formatting in the sync process
+        if self.format_workers > 1:
+            self.format_pool = FormatPool(
+                self.mlflow_formatter.report_format, workers=self.format_workers, threshold=self.format_threshold
+            )
+        # Runs to sync for each experiment name ("*" for the others), pushed down to the MLFlow search
+        self.selection = report_format.get("selection") or {}
+        # Fetch the history of the metrics
+        self.detailed_metrics = (report_format.get("history") or {}).get("enabled", False)
+        self.mlruns_dir = mlruns_dir
+        self.watcher = None
+        # Experiments of the last pull: {experiment_id: experiment}
+        self.experiments = {}
+        # Status and start time of each run: {experiment_id: {run_id: (status, start_time)}}
+        self.run_statuses = {}
+        # Producer-side timestamp (ms) of the latest change of each run: {experiment_name: {run_id: timestamp}}
+        self.run_timestamps = {}
+
+    @classmethod
+    def from_config(cls, report_format, **kwargs):
+        """Instantiate the producer from the keyword arguments of the Sync class.
+
+        Args:
+            report_format (dict): The report format
+
+        Keyword Args:
+            mlflow_uri (str): The root of the MLFlow server
+            mlflow_mlruns_dir (str): Local mlruns/ directory of the tracking server (Optional)
+            mlflow_history_store (str): Directory of the local store of the metric histories (Optional)
+            mlflow_format_workers (int): Worker processes formatting the runs of large pulls, 0 to disable (Optional)
+
+        Raises:
+            ValueError: If mlflow_uri is not provided
+        """
+        # Make sure mlflow_uri is provided
+        if "mlflow_uri" not in kwargs:
+            raise ValueError("mlflow_uri is required for mlflow producer")
+        return cls(
+            kwargs["mlflow_uri"],
+            report_format,
+            mlruns_dir=kwargs.get("mlflow_mlruns_dir"),
+            history_store=kwargs.get("mlflow_history_store"),
+            format_workers=kwargs.get("mlflow_format_workers"),
+        )
+
+    def update_format(self, report_format):
+        """Switch to a new report format, e.g. when the format file changes.
+
+        Args:
+            report_format (dict): The new report format
+        """
+        self.mlflow_formatter = MLFlowFormatter(report_format, self.mlflow_api, history_store=self.history_store)
+        if self.format_pool is not None:
+            # The workers hold the compiled report format
+            self.format_pool.close()
+            self.format_pool = FormatPool(
+                self.mlflow_formatter.report_format, workers=self.format_workers, threshold=self.format_threshold
+            )
+        self.selection = report_format.get("selection") or {}
+        self.detailed_metrics = (report_format.get("history") or {}).get("enabled", False)
+
+    def watch(self, hints):
+        """Post hints of the changed runs from file system notifications on the local mlruns/ directory.
+
+        Args:
+            hints (RunHints): The hints of the sync engine.
+
+        Returns:
+            bool: False if there is no local mlruns/ directory or notifications are not available.
+        """
+        if self.mlruns_dir is None:
+            return False
+        # Imported here, only needed with a local mlruns/ directory
+        from mlsync.producers.mlflow.mlruns_watcher import MLRunsWatcher
+
+        self.watcher = MLRunsWatcher(self.mlruns_dir, hints)
+        if not self.watcher.start():
+            print(f"WARNING: Could not watch {self.mlruns_dir} for changes, polling instead.")
+            self.watcher = None
+            return False
+        return True
 
     def push(self, report):
         """Push the report to MLFLow"""
         # We will not push any changes to MLFlow
         raise NotImplementedError
 
-    def pull(self, detailed_metrics=False):
-        """Generate the MLFlow report based on the given format"""
+    def pull(self, detailed_metrics=None):
+        """Generate the MLFlow report based on the given format
+
+        Args:
+            detailed_metrics (bool): Fetch the history of the metrics (default: history.enabled of the report format)
+        """
+        if detailed_metrics is None:
+            detailed_metrics = self.detailed_metrics
 
         # Get all the experiments
         experiments = self.mlflow_api.getExperiments()
+        self.experiments = {experiment["experiment_id"]: experiment for experiment in experiments}
+        # Runs formatted in worker processes, the metric histories are fetched by the formatter. The searches are
+        # split in pages for the workers unless the last pull was too small for them
+        if (
+            self.format_pool is not None
+            and not detailed_metrics
+            and (self.pulled_runs is None or self.pulled_runs >= self.format_threshold)
+        ):
+            return self.pull_pages(experiments)
         # Get all the runs
-        runs = {experiment["experiment_id"]: self.mlflow_api.getExperimentRuns(experiment["experiment_id"]) for experiment in experiments}
+        runs = {experiment["experiment_id"]: self.search_runs(experiment) for experiment in experiments}
 
         # Generate the report
-        report = self.mlflow_formatter.format_in(experiments, runs, detailed_metrics)
+        with STAGE_DURATION.time(stage="format_in"):
+            report = self.mlflow_formatter.format_in(experiments, runs, detailed_metrics)
+
+        self.pulled_runs = sum(len(experiment_runs) for experiment_runs in runs.values())
 
         # Step 4: Generate the report
         # Remove all empty experiments from the report (experiment with no runs)
         report = {k: v for k, v in report.items() if v["runs"]}
 
+        # Timestamp of the latest change of each run
+        run_timestamps = self.run_timestamps
+        self.run_timestamps = {
+            experiment["name"]: {run["info"]["run_id"]: self.run_timestamp(run) for run in runs[experiment["experiment_id"]]}
+            for experiment in experiments
+        }
+        # Status and start time of each run
+        self.run_statuses = {
+            experiment["experiment_id"]: {run["info"]["run_id"]: self.run_status(run) for run in runs[experiment["experiment_id"]]}
+            for experiment in experiments
+        }
+        self.forget_runs(run_timestamps)
+
+        return report
+
+    def pull_pages(self, experiments):
+        """Generate the MLFlow report from the raw pages of the searches, formatted by the format pool.
+
+        Args:
+            experiments (list): The experiments as returned by MLFlow.
+        """
+        pages = {experiment["experiment_id"]: self.search_runs(experiment, raw=True) for experiment in experiments}
+        self.pulled_runs = 0
+        with STAGE_DURATION.time(stage="format_in"):
+            formatted_pages = iter(
+                self.format_pool.format_pages([page for experiment_pages in pages.values() for page in experiment_pages])
+            )
+            report = self.mlflow_formatter.generate_experiment(experiments)
+        run_timestamps = self.run_timestamps
+        self.run_timestamps, self.run_statuses = {}, {}
+        for experiment in experiments:
+            experiment_id, experiment_name = experiment["experiment_id"], experiment["name"]
+            runs = {}
+            timestamps, statuses = {}, {}
+            for _ in pages[experiment_id]:
+                formatted_page = next(formatted_pages)
+                for run_id, run in unpack_runs(formatted_page):
+                    # The fallback name is the position of the run in the experiment, not in its page
+                    if run["Name"]["key"] == "Name":
+                        run["Name"]["value"] = "Run " + str(len(runs))
+                    runs[run_id] = run
+                self.pulled_runs += len(formatted_page["runs"])
+                timestamps.update(formatted_page["timestamps"])
+                statuses.update(formatted_page["statuses"])
+            self.run_timestamps[experiment_name] = timestamps
+            self.run_statuses[experiment_id] = statuses
+            if runs:
+                report[experiment_name]["runs"] = runs
+            else:
+                report.pop(experiment_name, None)
+        self.forget_runs(run_timestamps)
+        return report
+
+    def pull_experiments(self, detailed_metrics=None):
+        """Generate the MLFlow report one experiment at a time.
+
+        The runs of an experiment are only fetched and formatted when the previous experiment has been consumed,
+        so that a streaming sync holds a single experiment in memory. Empty experiments are skipped, as in pull.
+
+        Args:
+            detailed_metrics (bool): Fetch the history of the metrics (default: history.enabled of the report format)
+
+        Yields:
+            (str, dict): The name of the experiment and its report.
+        """
+        if detailed_metrics is None:
+            detailed_metrics = self.detailed_metrics
+
+        experiments = self.mlflow_api.getExperiments()
+        self.experiments = {experiment["experiment_id"]: experiment for experiment in experiments}
+        run_timestamps = self.run_timestamps
+        self.run_timestamps, self.run_statuses = {}, {}
+        for experiment in experiments:
+            experiment_id, experiment_name = experiment["experiment_id"], experiment["name"]
+            runs = self.search_runs(experiment)
+            with STAGE_DURATION.time(stage="format_in"):
+                report = self.mlflow_formatter.format_in([experiment], {experiment_id: runs}, detailed_metrics)
+            self.run_timestamps[experiment_name] = {run["info"]["run_id"]: self.run_timestamp(run) for run in runs}
+            self.run_statuses[experiment_id] = {run["info"]["run_id"]: self.run_status(run) for run in runs}
+            # Release the runs returned by MLFlow before handing the experiment over
+            runs = None
+            experiment_report = report.get(experiment_name)
+            report = None
+            if experiment_report and experiment_report["runs"]:
+                yield experiment_name, experiment_report
+        self.forget_runs(run_timestamps)
+
+    def pull_runs(self, report, hints, detailed_metrics=None):
+        """Re-read only the hinted runs from MLFlow and merge them into the report.
+
+        The report is not modified, the experiments that changed are copied. Hints of experiments (rather than
+        runs) or of unknown experiments fall back to a full pull.
+
+        Args:
+            report (dict): The report of the last pull.
+            hints (set): The (experiment_id, run_id) of the changed runs, see mlsync.engine.hints.RunHints
+            detailed_metrics (bool): Fetch the history of the metrics (default: history.enabled of the report format)
+        """
+        # Fetch the hinted runs: {experiment_id: {run_id: run, None if deleted}}
+        hinted_runs = {}
+        for experiment_id, run_id in hints:
+            if run_id is None:
+                return self.pull(detailed_metrics)
+            run = self.mlflow_api.getRun(run_id)
+            # Hints may come without the experiment (e.g. from training scripts)
+            if run is not None:
+                experiment_id = run["info"]["experiment_id"]
+            if experiment_id not in self.experiments:
+                return self.pull(detailed_metrics)
+            # Runs that were deleted are gone, or marked as deleted
+            if run is not None and run["info"].get("lifecycle_stage", "active") != "active":
+                run = None
+            hinted_runs.setdefault(experiment_id, {})[run_id] = run
+
+        for experiment_id, experiment_runs in hinted_runs.items():
+            experiment = self.experiments[experiment_id]
+            rules = self.selection_rules(experiment)
+            # A hinted run may enter or leave the top-K of its experiment
+            if "top_k" in rules:
+                hinted_runs[experiment_id] = self.top_k_changes(experiment, report)
+            # Hinted runs outside of the filter or the retention window are not synced (deleted if they were)
+            elif "filter" in rules or "since" in rules:
+                self.select_runs(experiment, experiment_runs)
+
+        return self.merge_runs(report, hinted_runs, detailed_metrics)
+
+    def pull_active(self, report, lifecycle, detailed_metrics=None):
+        """Pull only the runs that can still change and merge them into the report.
+
+        For each experiment, the runs that are not in a terminal state and the runs started since the last pull are
+        searched with filters pushed down to MLFlow, and the runs that were active but are not anymore are read one
+        by one for their final state. Terminal runs are left as they are in the report. New or deleted experiments,
+        and due reconciliations, fall back to a full pull.
+
+        Args:
+            report (dict): The report of the last pull.
+            lifecycle (RunLifecycle): The status of the runs, see mlsync.engine.lifecycle
+            detailed_metrics (bool): Fetch the history of the metrics (default: history.enabled of the report format)
+        """
+        experiments = {experiment["experiment_id"]: experiment for experiment in self.mlflow_api.getExperiments()}
+        if lifecycle.reconcile_due() or set(experiments) != set(self.experiments):
+            report = self.pull(detailed_metrics)
+            lifecycle.reconcile(self.run_statuses)
+            return report
+        self.experiments = experiments
+
+        changed_runs = {}
+        for experiment_id, experiment in self.experiments.items():
+            # The top-K is small but may change at any time, it is searched again
+            if "top_k" in self.selection_rules(experiment):
+                experiment_runs = self.top_k_changes(experiment, report)
+            else:
+                # Active runs, and runs started since the last pull (they may be terminal already)
+                runs = self.search_runs(experiment, ACTIVE_RUNS_FILTER)
+                if experiment_id in lifecycle.started_until:
+                    runs += self.search_runs(
+                        experiment, f"attributes.start_time >= {lifecycle.started_until[experiment_id]}"
+                    )
+                experiment_runs = {run["info"]["run_id"]: run for run in runs}
+                # Runs that stopped being active: finished, or deleted
+                for run_id in lifecycle.active(experiment_id) - set(experiment_runs):
+                    run = self.mlflow_api.getRun(run_id)
+                    if run is not None and run["info"].get("lifecycle_stage", "active") != "active":
+                        run = None
+                    experiment_runs[run_id] = run
+            for run_id, run in experiment_runs.items():
+                if run is None:
+                    lifecycle.forget(experiment_id, run_id)
+                else:
+                    lifecycle.observe(experiment_id, run_id, run["info"]["status"], run["info"].get("start_time"))
+            if experiment_runs:
+                changed_runs[experiment_id] = experiment_runs
+        lifecycle.record()
+
+        return self.merge_runs(report, changed_runs, detailed_metrics)
+
+    def forget_runs(self, run_timestamps):
+        """Drop the histories of the runs that are not in the last full pull anymore (deleted, or out of the
+        selection).
+
+        Args:
+            run_timestamps (dict): The run timestamps before the pull: {experiment_name: {run_id: timestamp}}
+        """
+        if self.history_store is None:
+            return
+        run_ids = {run_id for timestamps in self.run_timestamps.values() for run_id in timestamps}
+        for timestamps in run_timestamps.values():
+            for run_id in timestamps:
+                if run_id not in run_ids:
+                    self.history_store.delete_run(run_id)
+
+    def selection_rules(self, experiment):
+        """Selection rules of an experiment from the report format, see mlsync.utils.report_format.
+
+        Args:
+            experiment (dict): The experiment as returned by MLFlow.
+        """
+        return self.selection.get(experiment["name"], self.selection.get("*")) or {}
+
+    def search_runs(self, experiment, filter_string=None, raw=False):
+        """Search the runs of an experiment, with its selection rules pushed down to MLFlow.
+
+        The filter and the retention window (since) become the search filter, and the top-K by a metric
+        (top_k, order_by) becomes a single page of the ordered search.
+
+        Args:
+            experiment (dict): The experiment as returned by MLFlow.
+            filter_string (str): Additional search filter, joined with AND (Optional)
+            raw (bool): Return the raw JSON pages of the search, in pages of FORMAT_POOL_CHUNK runs
+        """
+        rules = self.selection_rules(experiment)
+        filters = [rules.get("filter"), filter_string]
+        if "since" in rules:
+            filters.append(f"attributes.start_time >= {int((time.time() - parse_duration(rules['since'])) * 1000)}")
+        kwargs = {"filter_string": " AND ".join(f for f in filters if f) or None}
+        if "order_by" in rules:
+            kwargs["order_by"] = [rules["order_by"]] if isinstance(rules["order_by"], str) else rules["order_by"]
+        if "top_k" in rules:
+            kwargs["max_results"] = rules["top_k"]
+            kwargs["all_pages"] = False
+        if raw:
+            kwargs.setdefault("max_results", FORMAT_POOL_CHUNK)
+            return self.mlflow_api.getExperimentRunsPages(experiment["experiment_id"], **kwargs)
+        return self.mlflow_api.getExperimentRuns(experiment["experiment_id"], **kwargs)
+
+    def select_runs(self, experiment, experiment_runs):
+        """Set the runs outside of the selection of an experiment to None (to delete), with a single search.
+
+        Args:
+            experiment (dict): The experiment as returned by MLFlow.
+            experiment_runs (dict): The runs as returned by MLFlow, None if deleted: {run_id: run}, updated in place
+        """
+        run_ids = [run_id for run_id, run in experiment_runs.items() if run is not None]
+        if not run_ids:
+            return
+        run_filter = "attributes.run_id IN (" + ", ".join(f"'{run_id}'" for run_id in run_ids) + ")"
+        selected = {run["info"]["run_id"] for run in self.search_runs(experiment, run_filter)}
+        for run_id in run_ids:
+            if run_id not in selected:
+                experiment_runs[run_id] = None
+
+    def top_k_changes(self, experiment, report):
+        """Search the top-K runs of an experiment, with the runs that left the top-K as None (to delete).
+
+        Args:
+            experiment (dict): The experiment as returned by MLFlow.
+            report (dict): The report of the last pull.
+        """
+        experiment_runs = {run["info"]["run_id"]: run for run in self.search_runs(experiment)}
+        for run_id in report.get(experiment["name"], {}).get("runs", {}):
+            experiment_runs.setdefault(run_id, None)
+        return experiment_runs
+
+    def merge_runs(self, report, changed_runs, detailed_metrics=None):
+        """Format the runs that changed and merge them into the report.
+
+        The report is not modified, the experiments that changed are copied.
+
+        Args:
+            report (dict): The report of the last pull.
+            changed_runs (dict): The runs as returned by MLFlow, None if deleted: {experiment_id: {run_id: run}}
+            detailed_metrics (bool): Fetch the history of the metrics (default: history.enabled of the report format)
+        """
+        if detailed_metrics is None:
+            detailed_metrics = self.detailed_metrics
+        report = dict(report)
+        run_timestamps = dict(self.run_timestamps)
+        run_statuses = dict(self.run_statuses)
+        for experiment_id, experiment_changed_runs in changed_runs.items():
+            experiment = self.experiments[experiment_id]
+            experiment_name = experiment["name"]
+            runs = [run for run in experiment_changed_runs.values() if run is not None]
+            deleted = [run_id for run_id, run in experiment_changed_runs.items() if run is None]
+            with STAGE_DURATION.time(stage="format_in"):
+                experiment_report = self.mlflow_formatter.format_in([experiment], {experiment_id: runs}, detailed_metrics)
+            experiment_report = experiment_report.get(experiment_name, {"runs": {}})
+
+            # Merge the runs
+            experiment_runs = dict(report[experiment_name]["runs"]) if experiment_name in report else {}
+            for run_id in deleted:
+                experiment_runs.pop(run_id, None)
+            for run_id, run in experiment_report["runs"].items():
+                # The fallback name depends on the position of the run in the experiment, keep the current one
+                if run["Name"]["key"] == "Name" and run_id in experiment_runs:
+                    run["Name"] = experiment_runs[run_id]["Name"]
+                experiment_runs[run_id] = run
+            if experiment_runs:
+                report[experiment_name] = {**report.get(experiment_name, experiment_report), "runs": experiment_runs}
+            else:
+                report.pop(experiment_name, None)
+
+            # Timestamps and statuses of the runs
+            timestamps = dict(run_timestamps.get(experiment_name, {}))
+            statuses = dict(run_statuses.get(experiment_id, {}))
+            for run_id in deleted:
+                timestamps.pop(run_id, None)
+                statuses.pop(run_id, None)
+                if self.history_store is not None:
+                    self.history_store.delete_run(run_id)
+            timestamps.update({run["info"]["run_id"]: self.run_timestamp(run) for run in runs})
+            statuses.update({run["info"]["run_id"]: self.run_status(run) for run in runs})
+            run_timestamps[experiment_name] = timestamps
+            run_statuses[experiment_id] = statuses
+        self.run_timestamps = run_timestamps
+        self.run_statuses = run_statuses
+
         return report
 
+    @staticmethod
+    def run_status(run):
+        """Status and start time of a run.
+
+        Args:
+            run (dict): The run as returned by MLFlow.
+        """
+        return run["info"]["status"], run["info"].get("start_time")
+
+    @staticmethod
+    def run_timestamp(run):
+        """Timestamp (ms) of the latest change of a run: its start or end time or its latest metric.
+
+        Args:
+            run (dict): The run as returned by MLFlow.
+        """
+        timestamps = [run["info"].get("start_time"), run["info"].get("end_time")]
+        timestamps += [metric.get("timestamp") for metric in run.get("data", {}).get("metrics", [])]
+        timestamps = [int(timestamp) for timestamp in timestamps if timestamp is not None]
+        return max(timestamps) if timestamps else None
+
 
 if __name__ == "__main__":
     import os
@@ -0,0 +1,168 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+# inotify(7) events
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# struct inotify_event {int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[];}
+EVENT_HEADER = struct.Struct("iIII")
+
+# Directories of the mlruns/ file store that are not experiments, and directories of a run that are not tracking data
+IGNORED_EXPERIMENT_DIRS = ("models",)
+IGNORED_RUN_DIRS = ("artifacts",)
+
+
+def load_libc():
+    """The C library with inotify support, None if not available (e.g. not on Linux)."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+class MLRunsWatcher:
+    """Watch a local MLFlow file store (mlruns/ directory) with inotify and post hints of the changed runs.
+
+    The file store keeps one directory per experiment and per run (mlruns/<experiment_id>/<run_id>/), with the run
+    info in meta.yaml and one file per metric, param and tag. Writes to these files are turned into
+    (experiment_id, run_id) hints, and changes of the experiments themselves into (experiment_id, None) hints.
+
+    Args:
+        mlruns_dir (str): Path to the mlruns/ directory.
+        hints (RunHints): The hints of the sync engine.
+    """
+
+    def __init__(self, mlruns_dir, hints):
+        """Initialize the MLRunsWatcher object"""
+        self.mlruns_dir = os.path.abspath(mlruns_dir)
+        self.hints = hints
+        self.libc = load_libc()
+        self.fd = None
+        # Watched directories: {watch descriptor: path}
+        self.paths = {}
+        self.thread = None
+        self.stopped = threading.Event()
+
+    @staticmethod
+    def available():
+        """Whether file system notifications are available on this platform."""
+        return load_libc() is not None
+
+    def start(self):
+        """Start watching in a background thread.
+
+        Returns:
+            bool: False if the notifications are not available, the caller should keep polling.
+        """
+        if self.libc is None or not os.path.isdir(self.mlruns_dir):
+            return False
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            return False
+        self.watch_tree(self.mlruns_dir)
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """Stop watching."""
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def depth(self, path):
+        """Depth of a path below mlruns/: 0 for mlruns/, 1 for an experiment, 2 for a run."""
+        relative = os.path.relpath(path, self.mlruns_dir)
+        return 0 if relative == "." else len(relative.split(os.sep))
+
+    def watch_tree(self, path):
+        """Watch a directory and the directories below it that hold tracking data.
+
+        Args:
+            path (str): The directory.
+        """
+        name, depth = os.path.basename(path), self.depth(path)
+        if depth > 0 and name.startswith("."):
+            return
+        if (depth == 1 and name in IGNORED_EXPERIMENT_DIRS) or (depth == 3 and name in IGNORED_RUN_DIRS):
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            # E.g. the directory was removed meanwhile, or the watch limit was reached
+            return
+        self.paths[wd] = path
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                self.watch_tree(entry.path)
+
+    def hint(self, path):
+        """Post the hint for a changed path.
+
+        Args:
+            path (str): The path that changed.
+        """
+        parts = os.path.relpath(path, self.mlruns_dir).split(os.sep)
+        if parts[0].startswith(".") or parts[0] in IGNORED_EXPERIMENT_DIRS:
+            return
+        if len(parts) == 1 or parts[1] == "meta.yaml":
+            self.hints.add(parts[0], None)
+        elif not parts[1].startswith("."):
+            self.hints.add(parts[0], parts[1])
+
+    def loop(self):
+        """Read the inotify events until stopped."""
+        while not self.stopped.is_set():
+            readable, _, _ = select.select([self.fd], [], [], 0.5)
+            if not readable:
+                continue
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+                name = buffer[offset + EVENT_HEADER.size : offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost
+                    self.hints.add()
+                    continue
+                if mask & IN_IGNORED:
+                    self.paths.pop(wd, None)
+                    continue
+                if wd not in self.paths:
+                    continue
+                path = os.path.join(self.paths[wd], os.fsdecode(name)) if name else self.paths[wd]
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self.watch_tree(path)
+                self.hint(path)
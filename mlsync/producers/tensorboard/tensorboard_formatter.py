@@ -0,0 +1,30 @@
+from mlsync.producers.mlflow.mlflow_formatter import MLFlowFormatter
+
+
+class TensorBoardFormatter(MLFlowFormatter):
+    """Creates the report format for TensorBoard runs.
+
+    The runs are read from the event files in the shape of MLFlow runs (see TensorBoardSync.mlflow_run), so the
+    report format is the same as for MLFlow. The metric histories are read from the event files rather than fetched.
+
+    Args:
+        report_format (dict): The report format to be used.
+        runs (dict): The runs read from the event files: {run_id: EventRun}
+    """
+
+    def __init__(self, report_format: dict, runs: dict):
+        """Initialize the TensorBoardFormatter object"""
+        super().__init__(report_format, None)
+        self.runs = runs
+
+    def run_metric_history(self, run_id, metric):
+        """Get the history of a scalar of a run from its event files.
+
+        Args:
+            run_id (str): The id of the run.
+            metric (dict): The latest point of the metric.
+        """
+        history = self.runs[run_id].history(metric["key"])
+        if history is None:
+            return {}
+        return {"key": metric["key"], **self.downsample_history(*history)}
@@ -0,0 +1,330 @@
+import os
+import time
+from array import array
+
+from mlsync.producers.tensorboard.tensorboard_formatter import TensorBoardFormatter
+from mlsync.producers.tensorboard.tfevents import parse_event, read_records
+from mlsync.utils.metrics import STAGE_DURATION
+
+# Runs without a status from the hparams plugin are RUNNING until their event files are idle for this many seconds
+IDLE_TIMEOUT = 300
+
+
+class EventRun:
+    """A run of TensorBoard, read incrementally from the event files of its directory.
+
+    Args:
+        run_id (str): Path of the directory of the run, relative to the log directory.
+        experiment_name (str): The experiment of the run.
+        run_name (str): The name of the run in its experiment.
+        keep_history (bool): Keep the history of the scalars, not only their latest point.
+    """
+
+    def __init__(self, run_id, experiment_name, run_name, keep_history=False):
+        """Initialize the EventRun object"""
+        self.run_id = run_id
+        self.experiment_name = experiment_name
+        self.run_name = run_name
+        self.keep_history = keep_history
+        # Offset of the end of the records read in each event file: {path: offset}
+        self.offsets = {}
+        # Plugin of the tags of each event file, only in the first summary of a tag: {path: {tag: plugin}}
+        self.plugins = {}
+        # Wall times (seconds) of the first and latest events
+        self.start_time = None
+        self.last_time = None
+        # Latest point of each scalar, by step then wall time: {tag: (step, wall_time, value)}
+        self.scalars = {}
+        # History of each scalar as typed arrays of values, timestamps (ms) and steps: {tag: (value, ts, step)}
+        self.histories = {}
+        # Hparams and session of the hparams plugin
+        self.hparams = {}
+        self.session = {}
+        # Latest modification time of the event files
+        self.mtime = 0
+
+    def read(self, path, size, mtime):
+        """Read the records appended to an event file since the last read.
+
+        Args:
+            path (str): Path to the event file.
+            size (int): Size of the file.
+            mtime (float): Modification time of the file.
+
+        Returns:
+            bool: Whether new records were read.
+        """
+        self.mtime = max(self.mtime, mtime)
+        offset = self.offsets.get(path, 0)
+        if size <= offset:
+            return False
+        records, self.offsets[path] = read_records(path, offset)
+        plugins = self.plugins.setdefault(path, {})
+        for record in records:
+            wall_time, step, values = parse_event(record, plugins)
+            # The first event of a file only holds its version
+            if wall_time:
+                self.start_time = wall_time if self.start_time is None else min(self.start_time, wall_time)
+                self.last_time = wall_time if self.last_time is None else max(self.last_time, wall_time)
+            for tag, plugin, value in values:
+                if plugin == "hparams":
+                    self.hparams.update(value.pop("hparams", {}))
+                    self.session.update(value)
+                else:
+                    self.add_scalar(tag, step, wall_time, value)
+        return bool(records)
+
+    def add_scalar(self, tag, step, wall_time, value):
+        """Add a point of a scalar."""
+        latest = self.scalars.get(tag)
+        if latest is None or (step, wall_time) >= latest[:2]:
+            self.scalars[tag] = (step, wall_time, value)
+        if self.keep_history:
+            history = self.histories.get(tag)
+            if history is None:
+                history = self.histories[tag] = (array("d"), array("q"), array("q"))
+            history[0].append(float(value))
+            history[1].append(int(wall_time * 1000))
+            history[2].append(step)
+
+    def history(self, tag):
+        """History of a scalar ordered by step (then timestamp), None if it is not kept.
+
+        Returns:
+            (array, array, array): The values, timestamps (ms) and steps.
+        """
+        history = self.histories.get(tag)
+        if history is None:
+            return None
+        value, timestamp, step = history
+        points = list(zip(step, timestamp))
+        if any(point > next_point for point, next_point in zip(points, points[1:])):
+            # Several event files (e.g. a resumed training) interleave
+            order = sorted(range(len(points)), key=points.__getitem__)
+            value = array("d", (value[i] for i in order))
+            timestamp = array("q", (timestamp[i] for i in order))
+            step = array("q", (step[i] for i in order))
+        return value, timestamp, step
+
+    def status(self, now, idle_timeout):
+        """Status of the run: from the hparams plugin, or RUNNING until its event files are idle."""
+        if self.session.get("status"):
+            return self.session["status"]
+        return "RUNNING" if now - self.mtime < idle_timeout else "FINISHED"
+
+    def timestamp(self):
+        """Timestamp (ms) of the latest event of the run."""
+        times = [self.last_time, self.session.get("end_time")]
+        times = [t for t in times if t is not None]
+        return int(max(times) * 1000) if times else None
+
+
+class TensorBoardSync:
+    """Generate the report from the event files of TensorBoard.
+
+    Each directory of the log directory with event files (events.out.tfevents.*) is a run, and the first directory
+    under the log directory is its experiment (the log directory itself for runs directly under it). The event files
+    are tailed: the offset of the end of the records read is kept for each file, and each pull only parses the
+    records appended since, and formats the runs that changed.
+
+    Runs are formatted in the shape of MLFlow runs, with the same report format: the latest value of each scalar is a
+    metric (keyed by its tag), hparams are params, the name of the run is the mlflow.runName tag, and the status,
+    start and end times are info. Scalars written as tensors (TensorFlow 2) and as simple values are both read.
+
+    Args:
+        logdir (str): The log directory of TensorBoard.
+        report_format (dict): The report format
+        idle_timeout (float): Runs without a status from the hparams plugin are RUNNING until their event files are
+            idle for this many seconds.
+    """
+
+    def __init__(self, logdir, report_format, idle_timeout=IDLE_TIMEOUT):
+        """Initialize the sync process"""
+        self.logdir = os.path.abspath(logdir)
+        self.idle_timeout = idle_timeout
+        self.update_format(report_format)
+
+    @classmethod
+    def from_config(cls, report_format, **kwargs):
+        """Instantiate the producer from the keyword arguments of the Sync class.
+
+        Args:
+            report_format (dict): The report format
+
+        Keyword Args:
+            tensorboard_logdir (str): The log directory of TensorBoard
+            tensorboard_idle_timeout (float): Seconds after which a run without a status is FINISHED (Optional)
+
+        Raises:
+            ValueError: If tensorboard_logdir is not provided
+        """
+        if not kwargs.get("tensorboard_logdir"):
+            raise ValueError("tensorboard_logdir is required for tensorboard producer")
+        idle_timeout = kwargs.get("tensorboard_idle_timeout")
+        return cls(
+            kwargs["tensorboard_logdir"],
+            report_format,
+            idle_timeout=IDLE_TIMEOUT if idle_timeout is None else idle_timeout,
+        )
+
+    def update_format(self, report_format):
+        """Switch to a new report format, e.g. when the format file changes.
+
+        The event files are read again: the histories of the scalars are only kept when the report format enables
+        them.
+
+        Args:
+            report_format (dict): The new report format
+        """
+        self.detailed_metrics = (report_format.get("history") or {}).get("enabled", False)
+        # Runs read from the event files: {run_id: EventRun}
+        self.runs = {}
+        self.formatter = TensorBoardFormatter(report_format, self.runs)
+        # Formatted runs and their status when formatted: {run_id: (run, status)}
+        self.formatted = {}
+        # Event files that could not be read, skipped
+        self.corrupted = set()
+        # Producer-side timestamp (ms) of the latest change of each run: {experiment_name: {run_id: timestamp}}
+        self.run_timestamps = {}
+
+    def push(self, report):
+        """Push the report to TensorBoard"""
+        # We will not push any changes to TensorBoard
+        raise NotImplementedError
+
+    def event_files(self):
+        """Event files of the log directory by run directory: {run directory: [path]}"""
+        event_dirs = {}
+        for dirpath, dirnames, filenames in os.walk(self.logdir):
+            # Hidden directories (e.g. .ipynb_checkpoints) are not runs
+            dirnames[:] = [dirname for dirname in dirnames if not dirname.startswith(".")]
+            paths = [os.path.join(dirpath, filename) for filename in filenames if ".tfevents." in filename]
+            if paths:
+                event_dirs[dirpath] = sorted(paths)
+        return event_dirs
+
+    def new_run(self, run_dir):
+        """Create a run from its directory, see the class documentation for the experiments."""
+        run_id = os.path.relpath(run_dir, self.logdir).replace(os.sep, "/")
+        parts = run_id.split("/")
+        if run_id == "." or len(parts) == 1:
+            experiment_name = os.path.basename(self.logdir)
+            run_name = os.path.basename(run_dir)
+        else:
+            experiment_name, run_name = parts[0], "/".join(parts[1:])
+        return EventRun(run_id, experiment_name, run_name, keep_history=self.detailed_metrics)
+
+    def read(self):
+        """Read the records appended to the event files, and forget the runs whose event files are gone.
+
+        Returns:
+            set: The ids of the runs with new records.
+        """
+        changed = set()
+        run_ids = set()
+        for run_dir, paths in self.event_files().items():
+            run = self.new_run(run_dir)
+            run = self.runs.setdefault(run.run_id, run)
+            run_ids.add(run.run_id)
+            stats = {}
+            for path in paths:
+                try:
+                    stats[path] = os.stat(path)
+                except FileNotFoundError:
+                    continue
+            # A file that shrank was rewritten, the run is read again
+            if any(stat.st_size < run.offsets.get(path, 0) for path, stat in stats.items()):
+                run = self.runs[run.run_id] = self.new_run(run_dir)
+                self.corrupted.difference_update(paths)
+            for path, stat in stats.items():
+                if path in self.corrupted:
+                    continue
+                try:
+                    if run.read(path, stat.st_size, stat.st_mtime):
+                        changed.add(run.run_id)
+                except FileNotFoundError:
+                    continue
+                except ValueError as e:
+                    print(f"WARNING: {e}, skipping the rest of the file.")
+                    self.corrupted.add(path)
+        for run_id in set(self.runs) - run_ids:
+            del self.runs[run_id]
+            self.formatted.pop(run_id, None)
+        return changed
+
+    def mlflow_run(self, run, status):
+        """A run in the shape of the runs returned by MLFlow, see MLFlowFormatter.
+
+        Args:
+            run (EventRun): The run.
+            status (str): The status of the run.
+        """
+        info = {
+            "run_id": run.run_id,
+            "run_name": run.run_name,
+            "experiment_id": run.experiment_name,
+            "status": status,
+            "lifecycle_stage": "active",
+        }
+        start_time = run.session.get("start_time", run.start_time)
+        if start_time is not None:
+            info["start_time"] = int(start_time * 1000)
+        if status != "RUNNING":
+            end_time = run.session.get("end_time", run.last_time)
+            if end_time is not None:
+                info["end_time"] = int(end_time * 1000)
+        return {
+            "info": info,
+            "data": {
+                "metrics": [
+                    {"key": tag, "value": value, "step": step, "timestamp": int(wall_time * 1000)}
+                    for tag, (step, wall_time, value) in run.scalars.items()
+                ],
+                "params": [{"key": key, "value": value} for key, value in run.hparams.items()],
+                "tags": [{"key": "mlflow.runName", "value": run.run_name}],
+            },
+        }
+
+    def pull(self, detailed_metrics=None):
+        """Generate the report from the event files based on the given format
+
+        Only the runs with new records, or whose status changed, are formatted again.
+
+        Args:
+            detailed_metrics (bool): Unused, the histories of the scalars follow history.enabled of the report format
+        """
+        changed = self.read()
+        now = time.time()
+        # Runs to format by experiment: {experiment_name: [(run, status)]}
+        dirty = {}
+        for run_id, run in self.runs.items():
+            status = run.status(now, self.idle_timeout)
+            formatted = self.formatted.get(run_id)
+            if run_id in changed or formatted is None or formatted[1] != status:
+                dirty.setdefault(run.experiment_name, []).append((run, status))
+
+        with STAGE_DURATION.time(stage="format_in"):
+            for experiment_name, runs in dirty.items():
+                experiment = {"name": experiment_name, "experiment_id": experiment_name}
+                report = self.formatter.format_in(
+                    [experiment], {experiment_name: [self.mlflow_run(run, status) for run, status in runs]},
+                    self.detailed_metrics,
+                )
+                for run, status in runs:
+                    formatted_run = report[experiment_name]["runs"][run.run_id]
+                    # The fallback name depends on the position of the run in the experiment, keep the current one
+                    if formatted_run["Name"]["key"] == "Name" and run.run_id in self.formatted:
+                        formatted_run["Name"] = self.formatted[run.run_id][0]["Name"]
+                    self.formatted[run.run_id] = (formatted_run, status)
+
+        # The report is rebuilt, unchanged runs are shared with the last report
+        report = {}
+        run_timestamps = {}
+        for run_id, run in sorted(self.runs.items()):
+            experiment_name = run.experiment_name
+            if experiment_name not in report:
+                report[experiment_name] = {"name": experiment_name, "id": experiment_name, "runs": {}}
+            report[experiment_name]["runs"][run_id] = self.formatted[run_id][0]
+            run_timestamps.setdefault(experiment_name, {})[run_id] = run.timestamp()
+        self.run_timestamps = run_timestamps
+        return report
@@ -0,0 +1,251 @@
+import struct
+
+# Masked CRC32C of the length of the records, see masked_crc32c
+RECORD_HEADER = struct.Struct("<QI")
+# Length header (8 bytes), its CRC (4 bytes), then the data and its CRC (4 bytes)
+RECORD_OVERHEAD = RECORD_HEADER.size + 4
+
+# Protobuf wire types
+VARINT, FIXED64, LENGTH_DELIMITED, FIXED32 = 0, 1, 2, 5
+
+# Values of a TensorProto by dtype (tensorflow/core/framework/types.proto): (packed field, struct format)
+TENSOR_DTYPES = {
+    1: (5, "f"),  # DT_FLOAT, float_val
+    2: (6, "d"),  # DT_DOUBLE, double_val
+    3: (7, "i"),  # DT_INT32, int_val
+    9: (10, "q"),  # DT_INT64, int64_val
+    10: (11, "?"),  # DT_BOOL, bool_val
+}
+
+# Status of a session in the hparams plugin (tensorboard/plugins/hparams/api.proto) as the status of a run
+SESSION_STATUSES = {1: "FINISHED", 2: "FAILED", 3: "RUNNING"}
+
+
+def crc32c_table():
+    """Lookup table of the CRC32C (Castagnoli) polynomial."""
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x82F63B78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC32C_TABLE = crc32c_table()
+
+
+def masked_crc32c(data):
+    """Masked CRC32C of the TFRecord format.
+
+    Args:
+        data (bytes): The data to checksum.
+    """
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc = CRC32C_TABLE[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    crc ^= 0xFFFFFFFF
+    return (((crc >> 15) | (crc << 17)) + 0xA282EAD8) & 0xFFFFFFFF
+
+
+def read_records(path, offset=0):
+    """Read the records appended to an event file since an offset.
+
+    Only complete records are returned: a record that is still being written is read at the next call, from the
+    returned offset. The CRC of the length of each record is checked, the CRC of the data is not (it would dominate
+    the cost of parsing in pure Python).
+
+    Args:
+        path (str): Path to the event file.
+        offset (int): Offset of the first record to read, the end of the records read before.
+
+    Returns:
+        (list, int): The records (bytes), and the offset after the last complete record.
+
+    Raises:
+        ValueError: If the file is corrupted at the offset.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    records = []
+    position = 0
+    while len(data) - position >= RECORD_HEADER.size:
+        length, length_crc = RECORD_HEADER.unpack_from(data, position)
+        if masked_crc32c(data[position : position + 8]) != length_crc:
+            if records:
+                break
+            raise ValueError(f"Corrupted record in {path} at offset {offset + position}")
+        end = position + RECORD_HEADER.size + length
+        if len(data) < end + 4:
+            break
+        records.append(data[position + RECORD_HEADER.size : end])
+        position = end + 4
+    return records, offset + position
+
+
+def read_varint(data, position):
+    """Decode a varint, returns the value and the position after it."""
+    result = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+
+def iter_fields(data):
+    """Decode the fields of a protobuf message.
+
+    Yields:
+        (int, int, object): The field number, the wire type and the value (int for varints, bytes otherwise).
+    """
+    position = 0
+    end = len(data)
+    while position < end:
+        tag, position = read_varint(data, position)
+        field, wire_type = tag >> 3, tag & 7
+        if wire_type == VARINT:
+            value, position = read_varint(data, position)
+        elif wire_type == FIXED64:
+            value, position = data[position : position + 8], position + 8
+        elif wire_type == LENGTH_DELIMITED:
+            length, position = read_varint(data, position)
+            value, position = data[position : position + length], position + length
+        elif wire_type == FIXED32:
+            value, position = data[position : position + 4], position + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield field, wire_type, value
+
+
+def parse_tensor(data):
+    """First value of a numeric TensorProto, None for other tensors (e.g. strings)."""
+    dtype, content, values = None, None, {}
+    for field, wire_type, value in iter_fields(data):
+        if field == 1:
+            dtype = value
+        elif field == 4:
+            content = value
+        else:
+            values.setdefault(field, []).append((wire_type, value))
+    if dtype not in TENSOR_DTYPES:
+        return None
+    field, fmt = TENSOR_DTYPES[dtype]
+    if content:
+        return struct.unpack_from("<" + fmt, content)[0]
+    for wire_type, value in values.get(field, ()):
+        if wire_type == LENGTH_DELIMITED:
+            # Packed values
+            if fmt in "iq?":
+                return read_varint(value, 0)[0] if value else None
+            return struct.unpack_from("<" + fmt, value)[0] if value else None
+        if wire_type == FIXED32:
+            return struct.unpack("<f", value)[0]
+        if wire_type == FIXED64:
+            return struct.unpack("<d", value)[0]
+        return value
+    return None
+
+
+def parse_protobuf_value(data):
+    """Python value of a google.protobuf.Value (number, string or bool)."""
+    for field, _, value in iter_fields(data):
+        if field == 2:
+            return struct.unpack("<d", value)[0]
+        if field == 3:
+            return bytes(value).decode("utf-8", "replace")
+        if field == 4:
+            return bool(value)
+    return None
+
+
+def parse_hparams(data):
+    """Parse the content of a summary of the hparams plugin.
+
+    Returns:
+        dict: {"hparams": {name: value}, "start_time": seconds} for the start of a session, {"status": status,
+            "end_time": seconds} for its end, {} for other contents (e.g. the hparams of the experiment).
+    """
+    for field, _, value in iter_fields(data):
+        if field == 3:
+            session = {"hparams": {}}
+            for session_field, _, session_value in iter_fields(value):
+                if session_field == 1:
+                    entry = dict((entry_field, entry_value) for entry_field, _, entry_value in iter_fields(session_value))
+                    session["hparams"][bytes(entry.get(1, b"")).decode("utf-8", "replace")] = parse_protobuf_value(
+                        entry.get(2, b"")
+                    )
+                elif session_field == 5:
+                    session["start_time"] = struct.unpack("<d", session_value)[0]
+            return session
+        if field == 4:
+            session = {}
+            for session_field, _, session_value in iter_fields(value):
+                if session_field == 1:
+                    session["status"] = SESSION_STATUSES.get(session_value)
+                elif session_field == 2:
+                    session["end_time"] = struct.unpack("<d", session_value)[0]
+            return session
+    return {}
+
+
+def parse_event(record, plugins):
+    """Parse the scalars and hparams of an Event.
+
+    TensorFlow 2 writes scalars as tensors, with the plugin of the tag only in the first summary of the tag.
+
+    Args:
+        record (bytes): The Event protobuf.
+        plugins (dict): Plugin of each tag seen so far in the file, updated: {tag: plugin name}
+
+    Returns:
+        (float, int, list): The wall time (seconds), the step and the values as (tag, plugin, value), with the
+            parsed content of the plugin (see parse_hparams) as value for hparams.
+    """
+    wall_time, step, values = 0.0, 0, []
+    for field, _, value in iter_fields(record):
+        if field == 1:
+            wall_time = struct.unpack("<d", value)[0]
+        elif field == 2:
+            step = value
+        elif field == 5:
+            # Summary
+            for summary_field, _, summary_value in iter_fields(value):
+                if summary_field == 1:
+                    values.append(parse_summary_value(summary_value, plugins))
+    return wall_time, step, [value for value in values if value is not None]
+
+
+def parse_summary_value(data, plugins):
+    """Parse a Summary.Value as (tag, plugin, value), None if it is neither a scalar nor hparams."""
+    tag, simple_value, tensor, plugin, content = None, None, None, None, None
+    for field, _, value in iter_fields(data):
+        if field == 1:
+            tag = bytes(value).decode("utf-8", "replace")
+        elif field == 2:
+            simple_value = struct.unpack("<f", value)[0]
+        elif field == 8:
+            tensor = value
+        elif field == 9:
+            # SummaryMetadata.plugin_data
+            for metadata_field, _, metadata_value in iter_fields(value):
+                if metadata_field == 1:
+                    for plugin_field, _, plugin_value in iter_fields(metadata_value):
+                        if plugin_field == 1:
+                            plugin = bytes(plugin_value).decode("utf-8", "replace")
+                        elif plugin_field == 2:
+                            content = plugin_value
+    if plugin is not None:
+        plugins[tag] = plugin
+    plugin = plugins.get(tag, plugin)
+    if simple_value is not None:
+        return tag, "scalars", simple_value
+    if plugin == "hparams":
+        return tag, plugin, parse_hparams(content or b"")
+    if plugin == "scalars" and tensor is not None:
+        value = parse_tensor(tensor)
+        return None if value is None else (tag, plugin, value)
+    return None
@@ -0,0 +1,101 @@
+from array import array
+
+# Downsampling methods of the metric histories
+DOWNSAMPLING_METHODS = ("lttb", "minmax")
+
+
+def lttb(x, y, n_out):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points, and in each of the n_out - 2 buckets in between the point forming the largest
+    triangle with the point kept in the previous bucket and the average of the next bucket. Preserves the visual
+    shape of the curve.
+
+    Args:
+        x (sequence): The x coordinates (e.g. steps), increasing.
+        y (sequence): The y coordinates (values).
+        n_out (int): Number of points to keep, at least 3.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return list(range(n))
+    indices = [0]
+    bucket_size = (n - 2) / (n_out - 2)
+    previous = 0
+    for bucket in range(n_out - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        # Average of the next bucket (the last point for the last bucket)
+        next_start, next_end = end, min(int((bucket + 2) * bucket_size) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        count = next_end - next_start
+        x_avg = sum(x[next_start:next_end]) / count
+        y_avg = sum(y[next_start:next_end]) / count
+        # Point of the bucket forming the largest triangle
+        x_prev, y_prev = x[previous], y[previous]
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            area = abs((x_prev - x_avg) * (y[i] - y_prev) - (x_prev - x[i]) * (y_avg - y_prev))
+            if area > best_area:
+                best, best_area = i, area
+        indices.append(best)
+        previous = best
+    indices.append(n - 1)
+    return indices
+
+
+def minmax(x, y, n_out):
+    """Indices of the points kept by min/max downsampling.
+
+    Keeps the first and last points, and the minimum and maximum of each of the (n_out - 2) / 2 buckets in
+    between, in order. Preserves the extremes (e.g. loss spikes).
+
+    Args:
+        x (sequence): The x coordinates (e.g. steps), increasing.
+        y (sequence): The y coordinates (values).
+        n_out (int): Number of points to keep, at least 4.
+    """
+    n = len(x)
+    buckets = (n_out - 2) // 2
+    if n_out >= n or buckets < 1:
+        return list(range(n))
+    indices = [0]
+    bucket_size = (n - 2) / buckets
+    for bucket in range(buckets):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        if start >= end:
+            continue
+        low = min(range(start, end), key=y.__getitem__)
+        high = max(range(start, end), key=y.__getitem__)
+        indices.extend(sorted({low, high}))
+    indices.append(n - 1)
+    return indices
+
+
+def downsample(value, timestamp, step, max_points, method="lttb"):
+    """Downsample a metric history to at most max_points points, along the steps.
+
+    Args:
+        value (array): The values of the metric, an array or a typed memoryview.
+        timestamp (array): The timestamps of the values.
+        step (array): The steps of the values.
+        max_points (int): Maximum number of points to keep.
+        method (str): lttb (shape preserving) or minmax (extremes preserving)
+
+    Returns:
+        (array, array, array): The downsampled values, timestamps and steps.
+    """
+    if len(value) <= max_points:
+        return value, timestamp, step
+    if method == "lttb":
+        indices = lttb(step, value, max_points)
+    elif method == "minmax":
+        indices = minmax(step, value, max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method {method} (supported: {DOWNSAMPLING_METHODS})")
+    return tuple(
+        array(getattr(column, "typecode", None) or column.format, (column[i] for i in indices))
+        for column in (value, timestamp, step)
+    )
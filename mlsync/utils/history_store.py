@@ -0,0 +1,199 @@
+import mmap
+import os
+import shutil
+import sys
+import threading
+import weakref
+from array import array
+from urllib.parse import quote
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Columns of a metric history, with their array type codes: doubles for the values, 64-bit integers otherwise
+HISTORY_COLUMNS = (("value", "d"), ("timestamp", "q"), ("step", "q"))
+# Memory maps keep a duplicate of the descriptor of their file open for as long as they live, unless they can be
+# created without it (Python 3.13+)
+MMAP_TRACKFD = sys.version_info < (3, 13)
+# Maximum number of memory-mapped files, and at most a quarter of the limit of open files of the process
+MAX_MAPPED_FILES = 4096
+
+
+def mapped_files_budget():
+    """Number of files that can be memory-mapped at once, see MAX_MAPPED_FILES."""
+    if resource is None:
+        return MAX_MAPPED_FILES
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return MAX_MAPPED_FILES
+    return min(MAX_MAPPED_FILES, soft // 4)
+
+
+class HistoryStore:
+    """Local append-only store of metric histories, one set of columnar files per run and metric.
+
+    Each history is kept in three files of fixed-size items (root/<run_id>/<metric>.value, .timestamp and .step),
+    ordered by step. New points are appended (histories with points inserted before their last point are replaced), and histories are read back as memoryviews over memory-mapped files:
+    reading does not copy the points, and the histories stay in the page cache rather than in the resident memory
+    of the process. The store persists across restarts, so histories that did not change are not fetched again.
+
+    The mapping of each file is kept and shared by the reads of the file, and only mapped again when the file grew.
+    Before Python 3.13, each mapping holds an open file descriptor for as long as a history reads from it: past a
+    budget of mappings (see mapped_files_budget), histories are read as copies instead.
+
+    Args:
+        root (str): Directory of the store.
+    """
+
+    def __init__(self, root):
+        """Initialize the HistoryStore object"""
+        self.root = root
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        # Latest mapping of each file: {path: mmap}
+        self.mappings = {}
+        # Mappings alive, held by self.mappings or by the histories read from them
+        self.live_mappings = weakref.WeakSet()
+        self.max_mappings = mapped_files_budget()
+
+    def path(self, run_id, key, column):
+        """Path of a column of a metric history."""
+        return os.path.join(self.root, quote(run_id, safe=""), f"{quote(key, safe='')}.{column}")
+
+    def length(self, run_id, key):
+        """Number of points stored for a metric history. Columns of an interrupted append are ignored past it."""
+        lengths = []
+        for column, typecode in HISTORY_COLUMNS:
+            try:
+                lengths.append(os.path.getsize(self.path(run_id, key, column)) // array(typecode).itemsize)
+            except OSError:
+                return 0
+        return min(lengths)
+
+    def last_point(self, run_id, key):
+        """(step, timestamp) of the last point stored for a metric history, None if there is none.
+
+        Args:
+            run_id (str): The id of the run.
+            key (str): The metric key.
+        """
+        length = self.length(run_id, key)
+        if not length:
+            return None
+        point = []
+        for column in ("step", "timestamp"):
+            item = array("q")
+            with open(self.path(run_id, key, column), "rb") as f:
+                f.seek((length - 1) * item.itemsize)
+                item.frombytes(f.read(item.itemsize))
+            point.append(item[0])
+        return tuple(point)
+
+    def append(self, run_id, key, value, timestamp, step):
+        """Append points to a metric history.
+
+        Args:
+            run_id (str): The id of the run.
+            key (str): The metric key.
+            value (array): The values, array('d').
+            timestamp (array): The timestamps, array('q').
+            step (array): The steps, array('q').
+        """
+        if not len(value):
+            return
+        columns = {"value": value, "timestamp": timestamp, "step": step}
+        with self.lock:
+            length = self.length(run_id, key)
+            os.makedirs(os.path.dirname(self.path(run_id, key, "value")), exist_ok=True)
+            for column, typecode in HISTORY_COLUMNS:
+                with open(self.path(run_id, key, column), "ab") as f:
+                    # Drop the tail of an interrupted append
+                    f.truncate(length * array(typecode).itemsize)
+                    f.write(array(typecode, columns[column]).tobytes())
+
+    def replace(self, run_id, key, value, timestamp, step):
+        """Replace a metric history, e.g. when points were logged before its last stored point.
+
+        The columns are written to new files that replace the stored ones, so that the histories read from the
+        previous files keep their points.
+
+        Args:
+            run_id (str): The id of the run.
+            key (str): The metric key.
+            value (array): The values, array('d').
+            timestamp (array): The timestamps, array('q').
+            step (array): The steps, array('q').
+        """
+        columns = {"value": value, "timestamp": timestamp, "step": step}
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path(run_id, key, "value")), exist_ok=True)
+            for column, typecode in HISTORY_COLUMNS:
+                path = self.path(run_id, key, column)
+                with open(f"{path}.tmp", "wb") as f:
+                    f.write(array(typecode, columns[column]).tobytes())
+                os.replace(f"{path}.tmp", path)
+                self.mappings.pop(path, None)
+
+    def read(self, run_id, key):
+        """Read a metric history without copying it.
+
+        Args:
+            run_id (str): The id of the run.
+            key (str): The metric key.
+
+        Returns:
+            dict: {"value", "timestamp", "step"} as memoryviews over the stored files, empty arrays if none.
+        """
+        length = self.length(run_id, key)
+        history = {}
+        for column, typecode in HISTORY_COLUMNS:
+            if not length:
+                history[column] = array(typecode)
+                continue
+            path = self.path(run_id, key, column)
+            size = length * array(typecode).itemsize
+            mapped = self.map(path, size)
+            if mapped is None:
+                history[column] = array(typecode)
+                with open(path, "rb") as f:
+                    history[column].frombytes(f.read(size))
+            else:
+                history[column] = memoryview(mapped)[:size].cast(typecode)
+        return history
+
+    def map(self, path, size):
+        """Memory-map a file of at least size bytes, reusing its current mapping if it is large enough.
+
+        Returns:
+            mmap: The mapping, None if the budget of mappings is used up.
+        """
+        with self.lock:
+            mapped = self.mappings.get(path)
+            if mapped is not None and len(mapped) >= size:
+                return mapped
+            # The previous mapping stays alive as long as histories read from it
+            self.mappings.pop(path, None)
+            if MMAP_TRACKFD and len(self.live_mappings) >= self.max_mappings:
+                return None
+            with open(path, "rb") as f:
+                if MMAP_TRACKFD:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ, trackfd=False)
+            self.mappings[path] = mapped
+            self.live_mappings.add(mapped)
+            return mapped
+
+    def delete_run(self, run_id):
+        """Delete the histories of a run.
+
+        Args:
+            run_id (str): The id of the run.
+        """
+        with self.lock:
+            run_dir = os.path.join(self.root, quote(run_id, safe=""))
+            for path in [path for path in self.mappings if os.path.dirname(path) == run_dir]:
+                del self.mappings[path]
+            shutil.rmtree(run_dir, ignore_errors=True)
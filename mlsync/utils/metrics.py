@@ -0,0 +1,318 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Default histogram buckets in seconds, as in Prometheus client libraries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Metric:
+    """Base class of the metrics, holding one value per combination of labels.
+
+    Args:
+        registry (MetricsRegistry): The registry of the metric.
+        name (str): The name of the metric.
+        description (str): The help text of the metric.
+        labels (tuple): The label names of the metric.
+    """
+
+    type = None
+
+    def __init__(self, registry, name, description, labels=()):
+        """Initialize the metric"""
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        """Label values in the order of the label names."""
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def format_labels(self, key, extra=None):
+        """Prometheus label set of a key."""
+        pairs = list(zip(self.labels, key)) + (extra or [])
+        if not pairs:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(label, value.replace('"', '\\"')) for label, value in pairs) + "}"
+
+    def samples(self):
+        """List of (name, label set, value) samples of the metric."""
+        with self.lock:
+            return [(self.name, self.format_labels(key), value) for key, value in self.values.items()]
+
+    def summary(self):
+        """Values of the metric for the structured log line."""
+        with self.lock:
+            return {",".join(key) or "_": value for key, value in self.values.items()}
+
+
+class Counter(Metric):
+    """Monotonically increasing counter."""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        """Increment the counter.
+
+        Args:
+            amount (float): The increment.
+            **labels: The label values.
+        """
+        if not self.registry.enabled:
+            return
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that can go up and down, or be computed when collected."""
+
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        """Initialize the gauge"""
+        super().__init__(*args, **kwargs)
+        self.functions = {}
+
+    def set(self, value, **labels):
+        """Set the gauge.
+
+        Args:
+            value (float): The value.
+            **labels: The label values.
+        """
+        if not self.registry.enabled:
+            return
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_function(self, function, **labels):
+        """Compute the gauge with a function when it is collected.
+
+        Args:
+            function (callable): Function returning the value, or None if there is no value yet.
+            **labels: The label values.
+        """
+        with self.lock:
+            self.functions[self.key(labels)] = function
+
+    def samples(self):
+        samples = super().samples()
+        with self.lock:
+            functions = list(self.functions.items())
+        for key, function in functions:
+            value = function()
+            if value is not None:
+                samples.append((self.name, self.format_labels(key), value))
+        return samples
+
+    def summary(self):
+        summary = super().summary()
+        with self.lock:
+            functions = list(self.functions.items())
+        for key, function in functions:
+            value = function()
+            if value is not None:
+                summary[",".join(key) or "_"] = value
+        return summary
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets.
+
+    Durations observed with time are exclusive: a block timed within another block of the same thread (e.g. the
+    format_in stage within the pull of a producer) is not counted in the duration of the enclosing block, so that the
+    stages add up to the duration of a sync cycle.
+    """
+
+    type = "histogram"
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        """Initialize the histogram"""
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        # Blocks being timed by the thread, see time: [labels, duration of the nested blocks]
+        self.timed = threading.local()
+
+    def observe(self, value, **labels):
+        """Observe a value.
+
+        Args:
+            value (float): The observed value.
+            **labels: The label values.
+        """
+        if not self.registry.enabled:
+            return
+        key = self.key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0, 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block of code, without the nested blocks (see the class documentation).
+
+        Args:
+            **labels: The label values.
+        """
+        if not self.registry.enabled:
+            yield
+            return
+        stack = self.timed.__dict__.setdefault("stack", [])
+        parent = stack[-1] if stack else None
+        # A block within a block with the same labels (e.g. the push of a consumer within the push stage) is part of it
+        if parent is not None and parent[0] == labels:
+            yield
+            return
+        block = [labels, 0.0]
+        stack.append(block)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            if parent is not None:
+                parent[1] += duration
+            self.observe(duration - block[1], **labels)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            values = list(self.values.items())
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((f"{self.name}_bucket", self.format_labels(key, [("le", le)]), cumulative))
+            samples.append((f"{self.name}_sum", self.format_labels(key), total))
+            samples.append((f"{self.name}_count", self.format_labels(key), count))
+        return samples
+
+    def summary(self):
+        with self.lock:
+            return {
+                ",".join(key) or "_": {"count": count, "sum": round(total, 6)}
+                for key, (_, total, count) in self.values.items()
+            }
+
+
+class MetricsRegistry:
+    """Registry of the metrics of mlsync.
+
+    Metrics are disabled by default: updates return immediately and nothing is recorded until enable() is called.
+    """
+
+    def __init__(self):
+        """Initialize the registry"""
+        self.enabled = False
+        self.metrics = {}
+
+    def enable(self):
+        """Start recording metrics."""
+        self.enabled = True
+
+    def register(self, metric):
+        """Add a metric to the registry."""
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, description, labels=()):
+        """Create and register a counter."""
+        return self.register(Counter(self, name, description, labels))
+
+    def gauge(self, name, description, labels=()):
+        """Create and register a gauge."""
+        return self.register(Gauge(self, name, description, labels))
+
+    def histogram(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        """Create and register a histogram."""
+        return self.register(Histogram(self, name, description, labels, buckets=buckets))
+
+    def render(self):
+        """Metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Metrics as a dict, for the structured log line."""
+        return {name: metric.summary() for name, metric in self.metrics.items() if metric.summary()}
+
+    def serve(self, port, host="127.0.0.1"):
+        """Expose the metrics on http://host:port/metrics from a background thread.
+
+        Args:
+            port (int): The port to listen on.
+            host (str): The host to bind to.
+
+        Returns:
+            ThreadingHTTPServer: The server.
+        """
+        registry = self
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                data = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def log_periodically(self, interval):
+        """Print the metrics as a JSON log line every interval seconds from a background thread.
+
+        Args:
+            interval (float): Seconds between two log lines.
+        """
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                print(json.dumps({"event": "mlsync.metrics", "time": time.time(), "metrics": self.summary()}))
+
+        threading.Thread(target=loop, daemon=True).start()
+
+
+# Registry shared by all of mlsync
+METRICS = MetricsRegistry()
+
+STAGE_DURATION = METRICS.histogram(
+    "mlsync_stage_duration_seconds",
+    "Duration of each stage of the sync (pull, format_in, diff, format_out, push, consumer_pull), without the "
+    "nested stages.",
+    ["stage"],
+)
+HTTP_REQUESTS = METRICS.counter(
+    "mlsync_http_requests_total", "HTTP requests to producers and consumers.", ["api", "method", "status"]
+)
+HTTP_BYTES = METRICS.counter("mlsync_http_bytes_total", "Bytes transferred with producers and consumers.", ["api", "direction"])
+RUNS = METRICS.counter("mlsync_runs_total", "Runs written to the consumer.", ["action"])
+QUEUE_DEPTH = METRICS.gauge("mlsync_queue_depth", "Number of items waiting in a queue.", ["queue"])
+SYNC_LAG = METRICS.gauge("mlsync_sync_lag_seconds", "Seconds since the consumer was last in sync with the producer.")
@@ -0,0 +1,333 @@
+import base64
+import datetime
+import hashlib
+import json
+import os
+import re
+
+import yaml
+
+from mlsync.utils.utils import yaml_fast_loader
+from mlsync.utils.downsample import DOWNSAMPLING_METHODS
+
+# Bump when the validation or the compiled forms change, to invalidate the on-disk cache
+FORMAT_CACHE_VERSION = 5
+# Number of report formats kept in the on-disk cache, the least recently used ones are removed
+FORMAT_CACHE_SIZE = 64
+# Key of the JSON objects of the cache holding a value that JSON does not keep, e.g. a dict with non-string keys
+CACHE_TAG = "__mlsync__"
+CACHE_CONTAINERS = {"tuple": tuple, "set": set, "frozenset": frozenset}
+# Types of the elements supported by the report format
+ELEMENT_TYPES = ("int", "integer", "float", "str", "string", "bool", "select", "timestamp")
+# Sections of the policies of the report format
+POLICY_TAGS = ("info", "metrics", "params", "tags")
+# Rules of the optional selection section, per experiment name ("*" for all the other experiments)
+SELECTION_RULES = ("filter", "since", "top_k", "order_by")
+# Durations of the selection, e.g. 14d
+DURATION = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhdw])\s*$")
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+# Settings of the optional history section (metric histories, a.k.a. detailed metrics)
+HISTORY_SETTINGS = ("enabled", "max_points", "method")
+
+# In-memory caches shared by all the pipelines of the process
+# formats: {digest: report format}, compiled: {(digest, name): compiled report format}
+FORMATS = {}
+COMPILED = {}
+
+
+def format_cache_dir():
+    """Directory of the on-disk cache of report formats ($MLSYNC_CACHE_DIR or ~/.cache/mlsync)."""
+    cache_dir = os.environ.get("MLSYNC_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "mlsync")
+    return os.path.join(cache_dir, "formats")
+
+
+def validate_report_format(report_format):
+    """Validate a report format.
+
+    Args:
+        report_format (dict): The report format, as loaded from format.yaml
+
+    Raises:
+        ValueError: If the report format is not valid.
+    """
+    if not isinstance(report_format, dict):
+        raise ValueError("Report format must be a mapping with elements, policies and order")
+    for section in ("elements", "policies", "order"):
+        if section not in report_format:
+            raise ValueError(f"Report format is missing the {section} section")
+    if not isinstance(report_format["elements"], dict) or not report_format["elements"]:
+        raise ValueError("Report format elements must be a non-empty mapping")
+    aliases = set()
+    for key, element in report_format["elements"].items():
+        if not isinstance(element, dict) or "alias" not in element or "type" not in element:
+            raise ValueError(f"Element {key} of the report format must have an alias and a type")
+        if element["type"] not in ELEMENT_TYPES:
+            raise ValueError(f"Element {key} has an unsupported type {element['type']} (supported: {ELEMENT_TYPES})")
+        if element["type"] == "select" and not isinstance(element.get("options"), list):
+            raise ValueError(f"Element {key} of type select must list its options")
+        if element["alias"] in aliases:
+            raise ValueError(f"Alias {element['alias']} is used by several elements of the report format")
+        aliases.add(element["alias"])
+    for policy in ("unmatched_policy", "notfound_policy"):
+        if not isinstance(report_format["policies"].get(policy), dict):
+            raise ValueError(f"Report format policies must define {policy} for {', '.join(POLICY_TAGS)}")
+        missing = [tag for tag in POLICY_TAGS if tag not in report_format["policies"][policy]]
+        if missing:
+            raise ValueError(f"Report format policy {policy} is missing {', '.join(missing)}")
+    if not isinstance(report_format["order"], list):
+        raise ValueError("Report format order must be a list of aliases")
+    validate_selection(report_format.get("selection") or {})
+    validate_history(report_format.get("history") or {})
+
+
+def validate_selection(selection):
+    """Validate the selection section of a report format.
+
+    Args:
+        selection (dict): The selection rules by experiment name.
+
+    Raises:
+        ValueError: If the selection is not valid.
+    """
+    if not isinstance(selection, dict):
+        raise ValueError("Report format selection must be a mapping of experiment names to rules")
+    for experiment_name, rules in selection.items():
+        if not isinstance(rules, dict):
+            raise ValueError(f"Selection of {experiment_name} must be a mapping of rules")
+        unknown = [rule for rule in rules if rule not in SELECTION_RULES]
+        if unknown:
+            raise ValueError(f"Selection of {experiment_name} has unknown rules {unknown} (supported: {SELECTION_RULES})")
+        if "filter" in rules and not isinstance(rules["filter"], str):
+            raise ValueError(f"Selection filter of {experiment_name} must be a search filter string")
+        if "since" in rules:
+            parse_duration(rules["since"])
+        if "top_k" in rules and (not isinstance(rules["top_k"], int) or rules["top_k"] <= 0):
+            raise ValueError(f"Selection top_k of {experiment_name} must be a positive integer")
+        if "order_by" in rules and not isinstance(rules["order_by"], (str, list)):
+            raise ValueError(f"Selection order_by of {experiment_name} must be a string or a list of strings")
+
+
+def validate_history(history):
+    """Validate the history section of a report format.
+
+    Args:
+        history (dict): The settings of the metric histories.
+
+    Raises:
+        ValueError: If the history settings are not valid.
+    """
+    if not isinstance(history, dict):
+        raise ValueError("Report format history must be a mapping of settings")
+    unknown = [setting for setting in history if setting not in HISTORY_SETTINGS]
+    if unknown:
+        raise ValueError(f"Report format history has unknown settings {unknown} (supported: {HISTORY_SETTINGS})")
+    if not isinstance(history.get("enabled", False), bool):
+        raise ValueError("Report format history.enabled must be true or false")
+    if "max_points" in history and (not isinstance(history["max_points"], int) or history["max_points"] < 4):
+        raise ValueError("Report format history.max_points must be an integer of at least 4")
+    if history.get("method", "lttb") not in DOWNSAMPLING_METHODS:
+        raise ValueError(f"Report format history.method must be one of {DOWNSAMPLING_METHODS}")
+
+
+def parse_duration(duration):
+    """Parse a duration such as 30m, 12h or 14d into seconds.
+
+    Args:
+        duration (str): The duration, a number followed by s, m, h, d or w.
+
+    Raises:
+        ValueError: If the duration is not valid.
+    """
+    match = DURATION.match(str(duration))
+    if not match:
+        raise ValueError(f"Invalid duration {duration}, expected a number followed by s, m, h, d or w (e.g. 14d)")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def encode_cache(value):
+    """Encode a report format as JSON, with the types that JSON does not keep tagged (see CACHE_TAG).
+
+    Report formats are loaded from YAML: besides JSON values, they may hold non-string keys, dates, tuples, sets
+    and bytes, which read back as they were loaded (see decode_cache).
+
+    Raises:
+        TypeError: If the report format holds another type, it is then not cached.
+    """
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value) and CACHE_TAG not in value:
+            return {key: encode_cache(item) for key, item in value.items()}
+        return {CACHE_TAG: "dict", "items": [[encode_cache(key), encode_cache(item)] for key, item in value.items()]}
+    if isinstance(value, list):
+        return [encode_cache(item) for item in value]
+    if isinstance(value, (tuple, set, frozenset)):
+        return {CACHE_TAG: type(value).__name__, "items": [encode_cache(item) for item in value]}
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return {CACHE_TAG: type(value).__name__, "value": value.isoformat()}
+    if isinstance(value, bytes):
+        return {CACHE_TAG: "bytes", "value": base64.b64encode(value).decode()}
+    raise TypeError(f"Cannot cache a report format holding {type(value).__name__}")
+
+
+def decode_cache(obj):
+    """Rebuild the values tagged by encode_cache, as the object_hook of json.load."""
+    tag = obj.get(CACHE_TAG)
+    if tag is None:
+        return obj
+    if tag == "dict":
+        return {key: item for key, item in obj["items"]}
+    if tag in CACHE_CONTAINERS:
+        return CACHE_CONTAINERS[tag](obj["items"])
+    if tag == "datetime":
+        return datetime.datetime.fromisoformat(obj["value"])
+    if tag == "date":
+        return datetime.date.fromisoformat(obj["value"])
+    if tag == "bytes":
+        return base64.b64decode(obj["value"])
+    raise ValueError(f"Unknown tag {tag} in the report format cache")
+
+
+def read_cache(digest):
+    """Read the on-disk cache entry of a report format, None if missing or stale.
+
+    Entries are JSON, with the values that JSON does not keep tagged (see encode_cache), so that the report format
+    reads back as loaded from YAML. A hit marks the entry as recently used, see prune_cache.
+    """
+    path = os.path.join(format_cache_dir(), f"{digest}.json")
+    try:
+        with open(path, "r") as f:
+            entry = json.load(f, object_hook=decode_cache)
+        os.utime(path)
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+    return entry if isinstance(entry, dict) and entry.get("version") == FORMAT_CACHE_VERSION else None
+
+
+def write_cache(digest, entry):
+    """Write the on-disk cache entry of a report format. The cache is best effort: errors are ignored."""
+    cache_dir = format_cache_dir()
+    path = os.path.join(cache_dir, f"{digest}.json")
+    try:
+        data = json.dumps(encode_cache(entry))
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(f"{path}.{os.getpid()}.tmp", "w") as f:
+            f.write(data)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+    except (OSError, TypeError, ValueError):
+        return
+    prune_cache(cache_dir)
+
+
+def prune_cache(cache_dir):
+    """Remove the least recently used entries beyond FORMAT_CACHE_SIZE, and the pickled entries of earlier versions.
+
+    Args:
+        cache_dir (str): The directory of the cache.
+    """
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+    entries = []
+    stale = []
+    for name in names:
+        path = os.path.join(cache_dir, name)
+        if name.endswith(".json"):
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                continue
+        elif name.endswith(".pickle"):
+            stale.append(path)
+    entries.sort(reverse=True)
+    for path in stale + [path for _, path in entries[FORMAT_CACHE_SIZE:]]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def load_report_format(filepath):
+    """Load and validate a report format, cached by the hash of the file content.
+
+    The YAML is parsed with the C loader when available and validated once. The result is cached in memory and on
+    disk, so restarts and pipelines sharing a format skip parsing and validation. The returned report format
+    carries its content hash under "digest", used to cache its compiled forms (see compile_report_format).
+
+    Args:
+        filepath (str): The path to the report format YAML file.
+
+    Raises:
+        ValueError: If the report format is not valid.
+    """
+    with open(filepath, "rb") as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if digest in FORMATS:
+        return FORMATS[digest]
+
+    entry = read_cache(digest)
+    if entry is None:
+        report_format = yaml.load(content, Loader=yaml_fast_loader())
+        validate_report_format(report_format)
+        report_format["digest"] = digest
+        entry = {"version": FORMAT_CACHE_VERSION, "format": report_format, "compiled": {}}
+        write_cache(digest, entry)
+
+    FORMATS[digest] = entry["format"]
+    for name, compiled in entry["compiled"].items():
+        COMPILED[(digest, name)] = compiled
+    return entry["format"]
+
+
+def compile_report_format(report_format, name, compiler):
+    """Compile a report format (e.g. augmented by a producer), cached by the hash of the report format.
+
+    Compiled forms are shared: they must not be modified by their users.
+
+    Args:
+        report_format (dict): The report format, as returned by load_report_format
+        name (str): Name of the compiled form, e.g. mlflow
+        compiler (callable): Function compiling the report format.
+    """
+    digest = report_format.get("digest")
+    # Report formats built in code are not cached
+    if digest is None:
+        return compiler(report_format)
+    if (digest, name) not in COMPILED:
+        compiled = compiler(report_format)
+        COMPILED[(digest, name)] = compiled
+        entry = read_cache(digest) or {"version": FORMAT_CACHE_VERSION, "format": report_format, "compiled": {}}
+        entry["compiled"][name] = compiled
+        write_cache(digest, entry)
+    return COMPILED[(digest, name)]
+
+
+def diff_report_format(report_format_old, report_format_new):
+    """Find the columns (aliases) added, removed, renamed or changed between two report formats.
+
+    Elements are matched by their key in the producer: an element whose alias changed is renamed, an element
+    whose type or options changed is changed.
+
+    Args:
+        report_format_old (dict): The old report format.
+        report_format_new (dict): The new report format.
+
+    Returns:
+        dict: {"added": [alias], "removed": [alias], "renamed": {old alias: new alias}, "changed": [alias]}
+    """
+    elements_old, elements_new = report_format_old["elements"], report_format_new["elements"]
+    schema_diff = {"added": [], "removed": [], "renamed": {}, "changed": []}
+    for key, element in elements_new.items():
+        if key not in elements_old:
+            schema_diff["added"].append(element["alias"])
+            continue
+        if elements_old[key]["alias"] != element["alias"]:
+            schema_diff["renamed"][elements_old[key]["alias"]] = element["alias"]
+        if (elements_old[key]["type"], elements_old[key].get("options")) != (element["type"], element.get("options")):
+            schema_diff["changed"].append(element["alias"])
+    for key, element in elements_old.items():
+        if key not in elements_new:
+            schema_diff["removed"].append(element["alias"])
+    return schema_diff
@@ -1,5 +1,13 @@
 import yaml
 import time
+import threading
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)
+def format_epoch_second(second):
+    """Formats an epoch second, memoized: the runs of a sweep share few distinct seconds"""
+    return time.strftime("%a, %d %b %H:%M:%S", time.localtime(second))
 
 
 def timestamp_epoch_to_datetime(timestamp):
@@ -8,9 +16,17 @@ def timestamp_epoch_to_datetime(timestamp):
     Args:
         timestamp (int): The timestamp to convert.
     """
+    if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+        # The format has a resolution of a second
+        return format_epoch_second(int(timestamp))
     return time.strftime("%a, %d %b %H:%M:%S", time.localtime(timestamp))
 
 
+def yaml_fast_loader():
+    """YAML loader backed by LibYAML (C) when available, the pure Python loader otherwise"""
+    return getattr(yaml, "CFullLoader", yaml.FullLoader)
+
+
 def yaml_loader(filepath):
     """Loads a YAML file as Python Dict
 
@@ -18,7 +34,7 @@ def yaml_loader(filepath):
         filepath (str): The path to the YAML file.
     """
     with open(filepath, 'r') as f:
-        return yaml.load(f, Loader=yaml.FullLoader)
+        return yaml.load(f, Loader=yaml_fast_loader())
 
 
 def yaml_dumper(data, filepath):
@@ -58,6 +74,76 @@ def url_remove_trailing_slug(url):
     return url
 
 
+# Conversion of the values of each supported type, None keeps the value as is
+TYPE_CONVERTERS = {
+    "int": int,
+    "integer": int,
+    "float": float,
+    "bool": bool,
+    "str": str,
+    "string": str,
+    "select": None,
+    "timestamp": timestamp_epoch_to_datetime,
+}
+
+
+class ConversionFailures:
+    """Values that could not be typified, reported as a single warning per sync cycle.
+
+    Failures are counted by type and reason, with the first failed value as an example. Shared between threads.
+    """
+
+    def __init__(self):
+        """Initialize the failures"""
+        self.lock = threading.Lock()
+        # (val_type, reason) -> [count, example value]
+        self.failures = {}
+
+    def add(self, val_type, reason, value, count=1):
+        """Record failed conversions.
+
+        Args:
+            val_type (str): The type the values were converted to.
+            reason (str): Why the conversion failed, e.g. the name of the exception.
+            value: Example of a value that failed.
+            count (int): Number of values that failed.
+        """
+        with self.lock:
+            failure = self.failures.setdefault((val_type, reason), [0, value])
+            failure[0] += count
+
+    def pop(self):
+        """Return and clear the recorded failures: {(val_type, reason): [count, example value]}"""
+        with self.lock:
+            failures, self.failures = self.failures, {}
+        return failures
+
+    def merge(self, failures):
+        """Record the failures popped from another collector, e.g. of a worker process."""
+        for (val_type, reason), (count, value) in failures.items():
+            self.add(val_type, reason, value, count)
+
+    def warn(self):
+        """Print a single warning summarizing and clearing the recorded failures.
+
+        Returns:
+            int: Number of values that failed.
+        """
+        failures = self.pop()
+        total = sum(count for count, _ in failures.values())
+        if total:
+            summary = ", ".join(
+                f"{count} to {val_type} ({reason}, e.g. {value!r})"
+                for (val_type, reason), (count, value) in sorted(failures.items(), key=lambda item: -item[1][0])
+            )
+            print(f"WARNING: Failed to typify {total} value(s), kept as is: {summary}")
+        return total
+
+
+# Failures of the conversions of the current sync cycle
+CONVERSION_FAILURES = ConversionFailures()
+
+
 def typify(value, val_type):
     """Typifies a value.
         Supported types:
@@ -68,25 +154,133 @@ def typify(value, val_type):
         - select
         - timestamp
 
+    Failures are recorded in CONVERSION_FAILURES and the value is kept as is.
+
     Args:
         value (str): The value to typify.
         val_type (str): The type of the value.
     """
+    return typify_column([value], val_type)[0]
+
+
+def typify_column(values, val_type, failures=None):
+    """Typifies a column of values of the same type, e.g. the values of an alias in all the runs.
+
+    The converter is looked up once per column and applied to all the values at once; values are only converted
+    one at a time when one of them fails. See typify for the supported types.
+
+    Args:
+        values (list): The values to typify.
+        val_type (str): The type of the values.
+        failures (ConversionFailures): Where to record the failures (default: CONVERSION_FAILURES)
+
+    Returns:
+        list: The typified values, the values that failed are kept as is.
+    """
+    failures = CONVERSION_FAILURES if failures is None else failures
+    if val_type not in TYPE_CONVERTERS:
+        if values:
+            failures.add(val_type, "unsupported type", values[0], len(values))
+        return list(values)
+    convert = TYPE_CONVERTERS[val_type]
+    if convert is None:
+        return list(values)
     try:
-        if val_type == "int" or val_type == "integer":
-            value = int(value)
-        elif val_type == "float":
-            value = float(value)
-        elif val_type == "bool":
-            value = bool(value)
-        elif val_type == "str" or val_type == "string":
-            value = str(value)
-        elif val_type == "select":
-            pass
-        elif val_type == "timestamp":
-            value = timestamp_epoch_to_datetime(value)
+        return list(map(convert, values))
+    except Exception:
+        pass
+    typified = []
+    for value in values:
+        try:
+            typified.append(convert(value))
+        except Exception as e:
+            failures.add(val_type, type(e).__name__, value)
+            typified.append(value)
+    return typified
+
+
+class RateLimiter:
+    """Token bucket limiting the rate of calls, shared between threads.
+
+    Args:
+        rate (float): Maximum sustained number of calls per second.
+        burst (int): Number of calls that can be made at once before throttling kicks in.
+    """
+
+    def __init__(self, rate, burst=1):
+        """Initialize the rate limiter"""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take a call without waiting.
+
+        Returns:
+            float: 0 if the call is allowed, otherwise the number of seconds to wait before trying again.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Wait until a call is allowed."""
+        wait = self.try_acquire()
+        while wait:
+            time.sleep(wait)
+            wait = self.try_acquire()
+
+
+class Progress:
+    """Thread-safe progress tracker printing throughput and ETA.
+
+    Args:
+        total (int): Total number of steps.
+        description (str): Description printed with the progress.
+        interval (float): Minimum number of seconds between two progress lines.
+    """
+
+    def __init__(self, total, description, interval=5):
+        """Initialize the progress tracker"""
+        self.total = total
+        self.description = description
+        self.interval = interval
+        self.done = 0
+        self.start = time.monotonic()
+        self.last_print = self.start
+        self.lock = threading.Lock()
+
+    def update(self, steps=1):
+        """Record completed steps and print the progress if due.
+
+        Args:
+            steps (int): Number of completed steps.
+        """
+        with self.lock:
+            self.done += steps
+            now = time.monotonic()
+            if now - self.last_print >= self.interval or self.done == self.total:
+                self.last_print = now
+                print(self.status(now))
+
+    def status(self, now=None):
+        """Progress line with the measured throughput and the ETA.
+
+        Args:
+            now (float): Current monotonic time (Optional)
+        """
+        now = time.monotonic() if now is None else now
+        elapsed = max(now - self.start, 1e-9)
+        throughput = self.done / elapsed
+        if throughput > 0:
+            eta = time.strftime("%H:%M:%S", time.gmtime((self.total - self.done) / throughput))
         else:
-            print("WARNING: Unsupported value type: " + val_type)
-    except Exception as e:
-        print(f"WARNING: Failed to typify value {value} to {val_type} due to {e}")
-    return value
+            eta = "--:--:--"
+        return f"{self.description}: {self.done}/{self.total} ({throughput:.2f}/s, ETA {eta})"
@@ -21,7 +21,25 @@ setup(
         'PyYAML>=6.0',
         'requests>=2.22.0',
     ],
+    extras_require={
+        # Columnar reports (mlsync --columnar)
+        'columnar': ['numpy>=1.20'],
+        # Parquet consumer (mlsync --consumer parquet)
+        'parquet': ['pyarrow>=8'],
+    },
     entry_points = {
         'console_scripts': ['mlsync=mlsync.command_line:main'],
+        # Producers and consumers, resolved by name and imported only when selected.
+        # Other packages can register their own under these groups.
+        'mlsync.producers': [
+            'mlflow=mlsync.producers.mlflow.mlflow_sync:MLFlowSync',
+            'tensorboard=mlsync.producers.tensorboard.tensorboard_sync:TensorBoardSync',
+        ],
+        'mlsync.consumers': [
+            'notion=mlsync.consumers.notion.notion_sync:NotionSync',
+            'sqlite=mlsync.consumers.sqlite.sqlite_sync:SQLiteSync',
+            'parquet=mlsync.consumers.parquet.parquet_sync:ParquetSync',
+            'changelog=mlsync.consumers.changelog.changelog_sync:ChangelogSync',
+        ],
     }
 )
\ No newline at end of file
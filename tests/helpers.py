@@ -0,0 +1,28 @@
+import threading
+import time
+
+
+def start_sync(sync, refresh_rate=0.2):
+    """Run the sync loop in a daemon thread, its exception (if any) is kept in the returned list."""
+    errors = []
+
+    def run():
+        try:
+            sync.sync(refresh_rate)
+        except Exception as e:
+            errors.append(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return errors
+
+
+def wait_until(predicate, errors, timeout=10):
+    """Wait for a predicate on the consumer, failing early if the sync loop died."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        assert not errors, f"The sync loop failed: {errors[0]!r}"
+        if predicate():
+            return
+        time.sleep(0.1)
+    assert not errors, f"The sync loop failed: {errors[0]!r}"
+    raise AssertionError("Timed out waiting for the consumer")
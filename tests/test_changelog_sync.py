@@ -0,0 +1,28 @@
+import json
+
+from mlsync.consumers.changelog.changelog_sync import ChangelogSync
+
+
+def report(accuracy):
+    """A report of a single run."""
+    return {"MNIST": {"name": "MNIST", "runs": {"a": {"Accuracy": {"type": "float", "value": accuracy}}}}}
+
+
+def test_replay_rotated_files_in_order(tmp_path):
+    """Files rotated within the same second are replayed in the order they were written, other files are ignored."""
+    path = tmp_path / "feed.jsonl"
+    changelog = ChangelogSync(str(path), {}, max_bytes=1)
+    changelog.push(report(0), command="new")
+    update = {"new": {}, "deleted": {}, "updated": {"MNIST": {"new": [], "deleted": [], "updated": ["a"]}}}
+    for accuracy in range(1, 12):
+        changelog.push(report(accuracy), command="update", diff_report=update)
+    changelog.close()
+    # Feeds of other paths sharing the prefix
+    archive = {"time": 0, "event": "archive", "experiment": "MNIST", "run": "a", "fields": {}}
+    for name in ("feed-other.jsonl", "feed-20990101T000000-0001.jsonl.bak"):
+        (tmp_path / name).write_text(json.dumps(archive) + "\n")
+
+    files = changelog.files()
+    assert len(files) == 12
+    assert [json.loads((tmp_path / file).read_text())["fields"]["Accuracy"] for file in files] == list(range(12))
+    assert ChangelogSync(str(path), {}).pull()["MNIST"]["runs"]["a"]["Accuracy"]["value"] == 11
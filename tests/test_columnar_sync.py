@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from helpers import start_sync, wait_until
+from mlsync.engine.sync import Sync
+from mlsync.producers.mlflow.mlflow_server import MLFlowServer
+from mlsync.utils.report_format import load_report_format
+
+pytest.importorskip("numpy")
+
+FORMAT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../examples/mlflow-notion/format.yaml")
+
+
+def consumer_accuracy(sync, run_id):
+    """Accuracy of a run in the consumer, None if the run is not there."""
+    for experiment in sync.consumer_sync.pull().values():
+        if run_id in experiment["runs"]:
+            return experiment["runs"][run_id]["Accuracy"]["value"]
+    return None
+
+
+@pytest.mark.parametrize("hints", [False, True], ids=["lifecycle", "hints"])
+def test_columnar_partial_pulls(tmp_path, hints):
+    """Partial pulls (active runs, or hinted runs) merge into the report of a columnar sync over several ticks."""
+    report_format = load_report_format(FORMAT_PATH)
+    with MLFlowServer(seed=0) as mlflow_server:
+        mlflow_server.generate(experiments=2, runs=10, running_fraction=0.5)
+        kwargs = {"ingest_port": 0} if hints else {}
+        sync = Sync(
+            report_format,
+            "mlflow",
+            "sqlite",
+            mlflow_uri=mlflow_server.url + "/api",
+            sqlite_path=str(tmp_path / "mlsync.db"),
+            mlflow_format_workers=0,
+            columnar=True,
+            **kwargs,
+        )
+        try:
+            errors = start_sync(sync)
+            experiment_id = next(iter(mlflow_server.experiments))
+            for tick in range(3):
+                run_id = mlflow_server.add_run(experiment_id)
+                mlflow_server.log_metric(run_id, "accuracy", 0.5 + tick / 10)
+                if hints:
+                    sync.hints.add(experiment_id, run_id)
+                wait_until(lambda: consumer_accuracy(sync, run_id) == pytest.approx(0.5 + tick / 10), errors)
+                # Updates of a synced run
+                mlflow_server.log_metric(run_id, "accuracy", 0.9, step=1)
+                if hints:
+                    sync.hints.add(experiment_id, run_id)
+                wait_until(lambda: consumer_accuracy(sync, run_id) == pytest.approx(0.9), errors)
+        finally:
+            if sync.ingest_server is not None:
+                sync.ingest_server.stop()
+
+
+def test_columnar_is_imported_on_demand():
+    """The sync and the diff do not import the columnar report (and numpy) outside of the columnar mode."""
+    code = (
+        "import sys; import mlsync.engine.sync; "
+        "print('mlsync.engine.columnar' in sys.modules, 'numpy' in sys.modules)"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.split() == ["False", "False"]
@@ -0,0 +1,65 @@
+import os
+
+from helpers import start_sync, wait_until
+from mlsync.consumers.notion.notion_server import NotionServer
+from mlsync.engine.sync import CONSUMER_FULL_PULL_EVERY, Sync
+from mlsync.producers.mlflow.mlflow_server import MLFlowServer
+from mlsync.utils.report_format import load_report_format
+
+FORMAT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../examples/mlflow-notion/format.yaml")
+
+
+def notion_pages(notion_server, root_page_id):
+    """Pages of the databases under the root page that are not archived: {uid: page}"""
+    databases = {
+        database_id
+        for database_id, database in notion_server.databases.items()
+        if database["parent"].get("page_id") == root_page_id
+    }
+    return {
+        page["properties"]["uid"]["rich_text"][0]["text"]["content"]: page
+        for page in list(notion_server.pages.values())
+        if page["parent"].get("database_id") in databases and not page["archived"]
+    }
+
+
+def test_consumer_pull_reverts_manual_changes():
+    """Pages edited by hand are updated again, and pages archived by hand are created again."""
+    report_format = load_report_format(FORMAT_PATH)
+    consumer_pull_rate = 0.2
+    with MLFlowServer(seed=0) as mlflow_server, NotionServer(requests_per_second=None) as notion_server:
+        mlflow_server.generate(experiments=2, runs=5, running_fraction=0.0)
+        root_page_id = notion_server.add_page()
+        sync = Sync(
+            report_format,
+            "mlflow",
+            "notion",
+            mlflow_uri=mlflow_server.url + "/api",
+            mlflow_format_workers=0,
+            notion_token="secret",
+            notion_page_id=root_page_id,
+            notion_base_url=notion_server.url,
+            consumer_pull_rate=consumer_pull_rate,
+        )
+        errors = start_sync(sync, refresh_rate=0.1)
+        wait_until(lambda: len(notion_pages(notion_server, root_page_id)) == 10, errors)
+        pages = notion_pages(notion_server, root_page_id)
+        edited_uid, archived_uid = sorted(pages)[:2]
+        accuracy = pages[edited_uid]["properties"]["Accuracy"]["number"]
+
+        # Edits are caught up by the incremental pulls
+        notion_server.update_page(pages[edited_uid]["id"], {"properties": {"Accuracy": {"number": -1.0}}})
+        wait_until(
+            lambda: notion_pages(notion_server, root_page_id)[edited_uid]["properties"]["Accuracy"]["number"]
+            == accuracy,
+            errors,
+        )
+
+        # Archived pages are only caught up by the full pulls
+        notion_server.update_page(pages[archived_uid]["id"], {"archived": True})
+        wait_until(
+            lambda: archived_uid in notion_pages(notion_server, root_page_id),
+            errors,
+            timeout=10 + 2 * CONSUMER_FULL_PULL_EVERY * consumer_pull_rate,
+        )
+        assert len(notion_pages(notion_server, root_page_id)) == 10
@@ -0,0 +1,108 @@
+import os
+import re
+import time
+
+from helpers import start_sync, wait_until
+from mlsync.consumers.notion.notion_server import NotionServer
+from mlsync.engine.diff import rebase_report
+from mlsync.engine.sync import Sync
+from mlsync.producers.mlflow.mlflow_server import MLFlowServer
+from mlsync.utils.report_format import diff_report_format, load_report_format
+
+FORMAT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../examples/mlflow-notion/format.yaml")
+
+
+def element(alias, val_type):
+    """An element of a report format."""
+    return {"alias": alias, "type": val_type, "tag": "metrics"}
+
+
+def cell(alias, value, val_type="float"):
+    """A cell of the report."""
+    return {"alias": alias, "type": val_type, "tag": "metrics", "key": alias.lower(), "value": value}
+
+
+def page_updates(notion_server):
+    """Number of updates of pages by the sync."""
+    return notion_server.stats().get(("PATCH", "pages.update", 200), 0)
+
+
+def test_diff_report_format():
+    """Elements are matched by their key: a new alias is a rename, a new type is a change."""
+    report_format_old = {"elements": {"accuracy": element("Accuracy", "float"), "loss": element("Loss", "float")}}
+    report_format_new = {"elements": {"accuracy": element("Top-1", "string"), "epochs": element("Epochs", "int")}}
+    assert diff_report_format(report_format_old, report_format_new) == {
+        "added": ["Epochs"],
+        "removed": ["Loss"],
+        "renamed": {"Accuracy": "Top-1"},
+        "changed": ["Top-1"],
+    }
+
+
+def test_rebase_report():
+    """The synced report is moved to the new columns, values that changed meanwhile are still diffed."""
+    report_old = {"MNIST": {"name": "MNIST", "id": "1", "runs": {"a": {"Accuracy": cell("Accuracy", 0.5)}}}}
+    report_new = {
+        "MNIST": {
+            "name": "MNIST",
+            "id": "1",
+            "runs": {"a": {"Top-1": cell("Top-1", 0.6), "Epochs": cell("Epochs", 10, "int")}},
+        }
+    }
+    schema_diff = {"added": ["Epochs"], "removed": [], "renamed": {"Accuracy": "Top-1"}, "changed": []}
+    rebased = rebase_report(report_old, report_new, schema_diff)
+    # The renamed column keeps its synced value, the added column was backfilled
+    assert rebased["MNIST"]["runs"]["a"] == {"Top-1": cell("Accuracy", 0.5), "Epochs": cell("Epochs", 10, "int")}
+
+    report_new["MNIST"]["runs"]["a"]["Top-1"]["value"] = 0.5
+    rebased = rebase_report(report_old, report_new, schema_diff)
+    assert rebased["MNIST"]["runs"]["a"] == report_new["MNIST"]["runs"]["a"]
+
+
+def test_format_reload_updates_the_changed_columns(tmp_path):
+    """A change of the format file renames, removes and backfills the columns of Notion without a re-sync."""
+    format_path = tmp_path / "format.yaml"
+    with open(FORMAT_PATH) as f:
+        format_path.write_text(f.read())
+    with MLFlowServer(seed=0) as mlflow_server, NotionServer(requests_per_second=None) as notion_server:
+        mlflow_server.generate(experiments=1, runs=5, running_fraction=0.0)
+        root_page_id = notion_server.add_page()
+        sync = Sync(
+            load_report_format(str(format_path)),
+            "mlflow",
+            "notion",
+            mlflow_uri=mlflow_server.url + "/api",
+            mlflow_format_workers=0,
+            notion_token="secret",
+            notion_page_id=root_page_id,
+            notion_base_url=notion_server.url,
+            format_path=str(format_path),
+        )
+        errors = start_sync(sync, refresh_rate=0.1)
+        wait_until(lambda: len(notion_server.pages) == 6, errors)
+        (database,) = notion_server.databases.values()
+        accuracies = {
+            page_id: page["properties"]["Accuracy"]["number"]
+            for page_id, page in notion_server.pages.items()
+            if page_id != root_page_id
+        }
+        assert page_updates(notion_server) == 0
+
+        # Accuracy renamed, Test Loss removed, and Batch Size retyped
+        report_format = format_path.read_text()
+        report_format = report_format.replace("alias: Accuracy", "alias: Top-1")
+        report_format = re.sub(r"    test_loss:\n(        .*\n)+", "", report_format)
+        report_format = report_format.replace(
+            "alias: Batch Size\n        type: integer", "alias: Batch Size\n        type: string"
+        )
+        format_path.write_text(report_format)
+        wait_until(lambda: "Top-1" in database["properties"] and "Test Loss" not in database["properties"], errors)
+        # Only the retyped column is written to the pages (at the rate limit of Notion), once each
+        wait_until(lambda: page_updates(notion_server) == 5, errors)
+        time.sleep(1)
+        assert page_updates(notion_server) == 5
+        assert notion_server.stats()[("POST", "pages.create", 200)] == 5
+
+        assert database["properties"]["Batch Size"]["type"] == "rich_text"
+        for page_id, accuracy in accuracies.items():
+            assert notion_server.pages[page_id]["properties"]["Top-1"]["number"] == accuracy
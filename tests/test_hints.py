@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+
+import pytest
+
+from mlsync.engine.hints import RunHints
+from mlsync.producers.mlflow.mlflow_server import MLFlowServer
+from mlsync.producers.mlflow.mlflow_sync import MLFlowSync
+from mlsync.producers.mlflow.mlruns_watcher import MLRunsWatcher
+from mlsync.utils.report_format import load_report_format
+
+FORMAT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../examples/mlflow-notion/format.yaml")
+
+
+def searches(mlflow_server, endpoint="runs.search"):
+    """Number of requests of the MLFlow stand-in to an endpoint."""
+    return sum(count for (_, name, _), count in mlflow_server.stats().items() if name == endpoint)
+
+
+def test_hints_are_debounced():
+    """The hints that follow the first one within the debounce delay are collected at once."""
+    hints = RunHints()
+
+    def post():
+        time.sleep(0.05)
+        hints.add("1", "a")
+        time.sleep(0.05)
+        hints.add("1", "b")
+
+    threading.Thread(target=post, daemon=True).start()
+    assert hints.wait(timeout=2, debounce=0.3) == {("1", "a"), ("1", "b")}
+    assert hints.wait(timeout=0.1) == set()
+
+    # Changes of the experiments, or of anything, call for a full pull
+    assert not RunHints.needs_full_pull({("1", "a"), ("1", "b")})
+    assert RunHints.needs_full_pull({("1", "a"), ("1", None)})
+    assert RunHints.needs_full_pull({(None, None)})
+
+
+@pytest.mark.skipif(not MLRunsWatcher.available(), reason="inotify is not available")
+def test_mlruns_watcher(tmp_path):
+    """Writes to the files of a run hint the run, writes to the metadata of an experiment hint the experiment."""
+    os.makedirs(tmp_path / "1" / "abc" / "metrics")
+    os.makedirs(tmp_path / "1" / "abc" / "artifacts")
+    hints = RunHints()
+    watcher = MLRunsWatcher(str(tmp_path), hints)
+    assert watcher.start()
+    try:
+        (tmp_path / "1" / "abc" / "metrics" / "accuracy").write_text("1000 0.5 0\n")
+        assert hints.wait(timeout=2, debounce=0.1) == {("1", "abc")}
+        # Artifacts are not tracking data
+        (tmp_path / "1" / "abc" / "artifacts" / "model.pkl").write_bytes(b"model")
+        assert hints.wait(timeout=0.3) == set()
+        (tmp_path / "1" / "meta.yaml").write_text("name: MNIST\n")
+        assert hints.wait(timeout=2, debounce=0.1) == {("1", None)}
+    finally:
+        watcher.stop()
+
+
+def test_pull_runs_reads_the_hinted_runs():
+    """Hinted runs are read one by one and merged into a copy of the report, experiment hints pull everything."""
+    with MLFlowServer(seed=0) as mlflow_server:
+        mlflow_server.generate(experiments=1, runs=5, running_fraction=0.0)
+        mlflow_sync = MLFlowSync(mlflow_server.url + "/api", load_report_format(FORMAT_PATH), format_workers=0)
+        report = mlflow_sync.pull()
+        (experiment_name, experiment), = report.items()
+        hinted, *others = sorted(experiment["runs"])
+        accuracy = experiment["runs"][hinted]["Accuracy"]["value"]
+        mlflow_server.log_metric(hinted, "accuracy", accuracy + 1, step=1000)
+
+        pulled_searches = searches(mlflow_server)
+        new_report = mlflow_sync.pull_runs(report, {(experiment["id"], hinted)})
+        assert searches(mlflow_server) == pulled_searches
+        assert searches(mlflow_server, "runs.get") == 1
+        assert new_report[experiment_name]["runs"][hinted]["Accuracy"]["value"] == accuracy + 1
+        assert report[experiment_name]["runs"][hinted]["Accuracy"]["value"] == accuracy
+        assert all(new_report[experiment_name]["runs"][run_id] is experiment["runs"][run_id] for run_id in others)
+
+        mlflow_sync.pull_runs(new_report, {(experiment["id"], None)})
+        assert searches(mlflow_server) == pulled_searches + 1
@@ -0,0 +1,43 @@
+from array import array
+
+import pytest
+
+from mlsync.utils.history_store import HistoryStore
+
+resource = pytest.importorskip("resource")
+
+
+@pytest.fixture
+def low_fd_limit():
+    """Lower the soft limit of open files of the process for the duration of a test."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (256, hard))
+    yield 256
+    resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+
+def points(start, count):
+    """Arrays of values, timestamps and steps of count points from step start."""
+    steps = range(start, start + count)
+    return array("d", (step / 10 for step in steps)), array("q", (1000 * step for step in steps)), array("q", steps)
+
+
+def test_read_many_histories_under_low_fd_limit(tmp_path, low_fd_limit):
+    """Histories held by two reports (the synced and the new one) do not exhaust the open files."""
+    store = HistoryStore(str(tmp_path))
+    keys = [(f"run{run}", f"metric{metric}") for run in range(100) for metric in range(4)]
+    for run_id, key in keys:
+        store.append(run_id, key, *points(0, 10))
+
+    reports = []
+    for tick in range(2):
+        reports.append({(run_id, key): store.read(run_id, key) for run_id, key in keys})
+        for run_id, key in keys[:10]:
+            store.append(run_id, key, *points(10 + tick, 1))
+
+    # Histories read before an append keep their length, later reads see the new points
+    first, second = reports
+    assert list(first[keys[0]]["step"]) == list(range(10))
+    assert list(second[keys[0]]["step"]) == list(range(11))
+    assert list(second[keys[-1]]["value"]) == [step / 10 for step in range(10)]
+    assert list(store.read(*keys[0])["timestamp"]) == [1000 * step for step in range(12)]
@@ -0,0 +1,38 @@
+import time
+
+from helpers import start_sync
+from mlsync.engine.hints import RunHints
+from mlsync.engine.ingest import IngestServer, notify
+from mlsync.engine.sync import Sync
+
+
+def test_notify_posts_hints(tmp_path):
+    """Training scripts post hints over HTTP or a Unix socket, and are not failed when mlsync is not running."""
+    hints = RunHints()
+    unix_server = IngestServer(hints, socket_path=str(tmp_path / "mlsync.sock"))
+    with IngestServer(hints) as http_server, unix_server:
+        assert notify("run", "1", url=http_server.url)
+        assert notify("other", url=unix_server.url)
+        assert notify(url=http_server.url)
+        assert hints.wait(timeout=1) == {("1", "run"), (None, "other"), (None, None)}
+        url = http_server.url
+    assert not notify("run", url=url, timeout=0.2)
+    assert not notify("run", url=None)
+
+
+def test_hints_of_producers_without_partial_pulls(tmp_path):
+    """Producers that cannot re-read single runs do not listen for hints, hints do not break their sync."""
+    report_format = {"elements": {}, "policies": {}, "order": []}
+    sync = Sync(
+        report_format,
+        "tensorboard",
+        "sqlite",
+        tensorboard_logdir=str(tmp_path),
+        sqlite_path=str(tmp_path / "mlsync.db"),
+        ingest_port=0,
+    )
+    assert sync.ingest_server is None
+    errors = start_sync(sync, refresh_rate=0.05)
+    sync.hints.add("1", "run")
+    time.sleep(0.3)
+    assert not errors
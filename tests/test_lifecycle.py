@@ -0,0 +1,56 @@
+import os
+
+from mlsync.engine.lifecycle import RunLifecycle
+from mlsync.producers.mlflow.mlflow_server import MLFlowServer
+from mlsync.producers.mlflow.mlflow_sync import MLFlowSync
+from mlsync.utils.report_format import load_report_format
+
+FORMAT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../examples/mlflow-notion/format.yaml")
+
+
+def accuracies(report):
+    """Accuracy of the runs of a report: {run_id: accuracy}"""
+    return {
+        run_id: run["Accuracy"]["value"]
+        for experiment in report.values()
+        for run_id, run in experiment["runs"].items()
+    }
+
+
+def test_terminal_runs_are_frozen_until_reconciled():
+    """Active pulls skip the terminal runs, follow the active and new runs, and reconciliations catch up."""
+    with MLFlowServer(seed=0) as mlflow_server:
+        experiment_id = mlflow_server.add_experiment("sweep")
+        finished = mlflow_server.add_run(experiment_id, status="FINISHED", start_time=1000)
+        running = mlflow_server.add_run(experiment_id, status="RUNNING", start_time=2000)
+        for run_id in (finished, running):
+            mlflow_server.log_metric(run_id, "accuracy", 0.5)
+        mlflow_sync = MLFlowSync(mlflow_server.url + "/api", load_report_format(FORMAT_PATH), format_workers=0)
+        lifecycle = RunLifecycle(reconcile_rate=3600)
+
+        # The first pull is a full reconciliation
+        report = mlflow_sync.pull_active({}, lifecycle)
+        assert accuracies(report) == {finished: 0.5, running: 0.5}
+        assert lifecycle.active(experiment_id) == {running}
+
+        # Changes of frozen runs wait for the reconciliation, active runs are pulled until they are over
+        mlflow_server.log_metric(finished, "accuracy", 0.6, step=1)
+        mlflow_server.log_metric(running, "accuracy", 0.7, step=1)
+        new_report = mlflow_sync.pull_active(report, lifecycle)
+        assert accuracies(new_report) == {finished: 0.5, running: 0.7}
+        assert new_report["sweep"]["runs"][finished] is report["sweep"]["runs"][finished]
+
+        # A run that is over is read one last time, and new runs are found by their start time
+        mlflow_server.log_metric(running, "accuracy", 0.8, step=2)
+        mlflow_server.set_status(running, "FAILED")
+        new_run = mlflow_server.add_run(experiment_id, status="FINISHED", start_time=3000)
+        mlflow_server.log_metric(new_run, "accuracy", 0.9)
+        new_report = mlflow_sync.pull_active(new_report, lifecycle)
+        assert accuracies(new_report) == {finished: 0.5, running: 0.8, new_run: 0.9}
+        assert lifecycle.active(experiment_id) == set()
+
+        # The reconciliation pulls everything again
+        lifecycle.reconciled_at -= lifecycle.reconcile_rate
+        new_report = mlflow_sync.pull_active(new_report, lifecycle)
+        assert accuracies(new_report) == {finished: 0.6, running: 0.8, new_run: 0.9}
+        assert not lifecycle.reconcile_due()
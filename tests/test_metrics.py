@@ -0,0 +1,25 @@
+import time
+
+from mlsync.utils.metrics import MetricsRegistry
+
+
+def test_nested_stages_do_not_overlap():
+    """A stage timed within another one is not counted in the enclosing stage, a nested block of the same stage is
+    part of it."""
+    registry = MetricsRegistry()
+    registry.enable()
+    stages = registry.histogram("stage_duration_seconds", "Duration of each stage.", ["stage"])
+    start = time.perf_counter()
+    with stages.time(stage="pull"):
+        time.sleep(0.05)
+        with stages.time(stage="format_in"):
+            time.sleep(0.1)
+            with stages.time(stage="format_in"):
+                time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    summary = stages.summary()
+    assert summary["format_in"]["count"] == 1
+    assert summary["pull"]["sum"] < 0.1 <= summary["format_in"]["sum"]
+    # The summary rounds the sums to the microsecond
+    assert summary["pull"]["sum"] + summary["format_in"]["sum"] <= elapsed + 1e-5
@@ -0,0 +1,112 @@
+import os
+
+from mlsync.producers.mlflow.mlflow_server import MLFlowServer
+from mlsync.producers.mlflow import mlflow_sync as mlflow_sync_module
+from mlsync.producers.mlflow.mlflow_sync import MLFlowSync
+from mlsync.utils.report_format import load_report_format
+
+FORMAT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../examples/mlflow-notion/format.yaml")
+
+
+def report_format(**sections):
+    """The example report format, with extra sections (e.g. selection)."""
+    return {**load_report_format(FORMAT_PATH), **sections}
+
+
+def run_ids(report):
+    """The ids of the runs of a report."""
+    return {run_id for experiment in report.values() for run_id in experiment["runs"]}
+
+
+def test_hinted_runs_follow_the_selection():
+    """Hinted runs outside of the filter of their experiment are not synced, and are deleted when they leave it."""
+    selection = {"*": {"filter": "params.lr = '0.1'"}}
+    with MLFlowServer(seed=0) as mlflow_server:
+        experiment_id = mlflow_server.add_experiment("sweep")
+        selected = mlflow_server.add_run(experiment_id, params={"lr": 0.1})
+        mlflow_sync = MLFlowSync(mlflow_server.url + "/api", report_format(selection=selection), format_workers=0)
+        report = mlflow_sync.pull()
+        assert run_ids(report) == {selected}
+
+        other = mlflow_server.add_run(experiment_id, params={"lr": 0.01})
+        new = mlflow_server.add_run(experiment_id, params={"lr": 0.1})
+        report = mlflow_sync.pull_runs(report, {(experiment_id, other), (experiment_id, new)})
+        assert run_ids(report) == {selected, new}
+
+        # A run that leaves the selection is deleted
+        mlflow_server.runs[selected]["data"]["params"] = [{"key": "lr", "value": "0.5"}]
+        report = mlflow_sync.pull_runs(report, {(None, selected)})
+        assert run_ids(report) == {new}
+
+
+def history_format():
+    """The example report format, with the metric histories."""
+    return report_format(history={"enabled": True})
+
+
+def accuracy_history(report, run_id):
+    """Steps of the accuracy history of a run in a report."""
+    for experiment in report.values():
+        if run_id in experiment["runs"]:
+            return list(experiment["runs"][run_id]["Accuracy"]["data"]["step"])
+    return None
+
+
+def test_history_store_follows_deleted_runs(tmp_path):
+    """The stored histories of the runs that are gone from a full pull are deleted."""
+    with MLFlowServer(seed=0) as mlflow_server:
+        mlflow_server.generate(experiments=1, runs=3, history=5)
+        mlflow_sync = MLFlowSync(
+            mlflow_server.url + "/api", history_format(), history_store=str(tmp_path), format_workers=0
+        )
+        report = mlflow_sync.pull()
+        deleted = sorted(run_ids(report))[0]
+        assert (tmp_path / deleted).is_dir()
+
+        mlflow_server.delete_run(deleted)
+        report = mlflow_sync.pull()
+        assert deleted not in run_ids(report)
+        assert not (tmp_path / deleted).exists()
+        assert sorted(path.name for path in tmp_path.iterdir()) == sorted(run_ids(report))
+
+
+def test_history_store_keeps_earlier_steps(tmp_path):
+    """Points logged before the last stored point (e.g. a run resumed from an earlier step) are stored."""
+    with MLFlowServer(seed=0) as mlflow_server:
+        experiment_id = mlflow_server.add_experiment("sweep")
+        run_id = mlflow_server.add_run(experiment_id)
+        for step in range(5):
+            mlflow_server.log_metric(run_id, "accuracy", step / 10, step=step, timestamp=1000 + step)
+        mlflow_sync = MLFlowSync(
+            mlflow_server.url + "/api", history_format(), history_store=str(tmp_path), format_workers=0
+        )
+        report = mlflow_sync.pull()
+        assert accuracy_history(report, run_id) == [0, 1, 2, 3, 4]
+
+        # Resumed from the checkpoint of step 2
+        for step in (3, 4, 5):
+            mlflow_server.log_metric(run_id, "accuracy", step / 10, step=step, timestamp=2000 + step)
+        report = mlflow_sync.pull()
+        assert accuracy_history(report, run_id) == [0, 1, 2, 3, 3, 4, 4, 5]
+
+        # New points are appended
+        mlflow_server.log_metric(run_id, "accuracy", 0.6, step=6, timestamp=3000)
+        report = mlflow_sync.pull()
+        assert accuracy_history(report, run_id) == [0, 1, 2, 3, 3, 4, 4, 5, 6]
+
+
+def test_small_pulls_are_not_searched_in_pages(monkeypatch):
+    """The searches are only split in pages for the format pool when the last pull was large enough."""
+    monkeypatch.setattr(mlflow_sync_module, "FORMAT_POOL_CHUNK", 10)
+    with MLFlowServer(seed=0) as mlflow_server:
+        mlflow_server.generate(experiments=1, runs=30, history=1)
+
+        def searches():
+            return sum(count for (_, endpoint, _), count in mlflow_server.stats().items() if endpoint == "runs.search")
+
+        mlflow_sync = MLFlowSync(mlflow_server.url + "/api", report_format(), format_workers=2, format_threshold=100)
+        report = mlflow_sync.pull()
+        assert (len(run_ids(report)), searches()) == (30, 3)
+        report = mlflow_sync.pull()
+        assert (len(run_ids(report)), searches()) == (30, 4)
+        mlflow_sync.format_pool.close()
@@ -0,0 +1,37 @@
+import pytest
+from notion_client.errors import HTTPResponseError
+
+from mlsync.consumers.notion.notion_api import NotionAPI
+from mlsync.consumers.notion.notion_server import NotionServer, NotionServerError
+
+
+def failing(handle, failures):
+    """Wrap an endpoint of the stand-in so that its first calls succeed but answer a gateway error."""
+
+    def wrapper(*args):
+        response = handle(*args)
+        if failures:
+            failures.pop()
+            raise NotionServerError(502, "bad_gateway", "Bad gateway")
+        return response
+
+    return wrapper
+
+
+def test_creations_are_not_retried_on_server_errors(monkeypatch):
+    """A creation that failed after the fact is not sent again (it would be duplicated), other requests are."""
+    with NotionServer(requests_per_second=None) as notion_server:
+        notion_api = NotionAPI("token", max_retries=2, base_url=notion_server.url)
+        parent_id = notion_server.add_page()
+        database_id = notion_api.createDatabase("MNIST", {"Name": {"title": {}}}, parent_id)
+
+        monkeypatch.setattr(notion_server, "create_page", failing(notion_server.create_page, [True]))
+        with pytest.raises(HTTPResponseError):
+            notion_api.addPageToDatabase(database_id, {"Name": {"title": [{"text": {"content": "lenet"}}]}})
+        assert len(notion_server.pages) == 2
+
+        # Updates are idempotent
+        page_id = next(page_id for page_id in notion_server.pages if page_id != parent_id)
+        monkeypatch.setattr(notion_server, "update_page", failing(notion_server.update_page, [True]))
+        notion_api.updatePageInDatabase(database_id, page_id, {"Name": {"title": [{"text": {"content": "vgg"}}]}})
+        assert notion_server.stats()[("PATCH", "pages.update", 200)] == 1
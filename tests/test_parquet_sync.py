@@ -0,0 +1,96 @@
+import copy
+import os
+
+import pytest
+
+from mlsync.consumers.parquet.parquet_sync import ParquetSync
+
+pytest.importorskip("pyarrow")
+
+
+def cell(alias, val_type, value, tag="metrics", key=None, data=None):
+    """A cell of the report."""
+    return {
+        "alias": alias,
+        "type": val_type,
+        "tag": tag,
+        "key": alias.lower() if key is None else key,
+        "value": value,
+        "data": data,
+    }
+
+
+def run(name, accuracy, name_tag="tags", name_key="mlflow.runName", **extra):
+    """A run with a name, an accuracy (with a history) and extra bare values."""
+    return {
+        "Name": cell("Name", "text", name, tag=name_tag, key=name_key),
+        "Accuracy": cell("Accuracy", "float", accuracy, data={"value": [accuracy], "step": [0]}),
+        **extra,
+    }
+
+
+def without_histories(report):
+    """The report as read back from the dataset, which does not store the histories."""
+    report = copy.deepcopy(report)
+    for experiment in report.values():
+        for run_cells in experiment["runs"].values():
+            for run_cell in run_cells.values():
+                if isinstance(run_cell, dict) and "data" in run_cell:
+                    run_cell["data"] = None
+    return report
+
+
+def files(path):
+    """Names of the files of the dataset."""
+    return sorted(name for _, _, names in os.walk(path) for name in names if name.endswith(".parquet"))
+
+
+def test_pull_round_trip(tmp_path):
+    """Cells that differ from the first cell of their column (e.g. a fallback Name) are read back as they were."""
+    report = {
+        "MNIST": {
+            "name": "MNIST",
+            "id": "1",
+            "runs": {
+                "a": run("lenet", 0.5, Notes="first"),
+                # The name of a run without a run name tag falls back to its uid
+                "b": run("b", 0.25, name_tag="info", name_key="Name", Notes="second"),
+                "c": run("resnet", 0.75, Notes=cell("Notes", "text", "third", tag="tags", key="notes")),
+            },
+        }
+    }
+    ParquetSync(str(tmp_path), {}).push(report, command="new")
+
+    assert ParquetSync(str(tmp_path), {}).pull() == without_histories(report)
+
+
+def test_compaction_and_tombstones(tmp_path):
+    """Updates and deletions are written as deltas, then compacted into the latest version of each run."""
+    parquet_sync = ParquetSync(str(tmp_path), {}, compaction_deltas=2)
+    runs = {"a": run("lenet", 0.5), "b": run("b", 0.25, name_tag="info", name_key="Name"), "c": run("vgg", 0.1)}
+    report = {"MNIST": {"name": "MNIST", "id": "1", "runs": runs}}
+    parquet_sync.push(report, command="new")
+
+    # An update of a run, and a deletion: the deleted run is hidden by its tombstone
+    runs["a"] = run("lenet", 0.6)
+    deleted = runs.pop("c")
+    diff_report = {"updated": {"MNIST": {"new": [], "updated": ["a"], "deleted": ["c"]}}}
+    parquet_sync.push(report, command="update", diff_report=diff_report)
+    assert len(files(tmp_path)) == 2
+    assert parquet_sync.pull() == without_histories(report)
+
+    # The run comes back with the fallback name: the second delta triggers the compaction
+    runs["c"] = {**deleted, "Name": cell("Name", "text", "c", tag="info", key="Name")}
+    diff_report = {"updated": {"MNIST": {"new": ["c"], "updated": [], "deleted": []}}}
+    parquet_sync.push(report, command="update", diff_report=diff_report)
+    assert len(files(tmp_path)) == 1
+    assert parquet_sync.pull() == without_histories(report)
+    assert ParquetSync(str(tmp_path), {}).pull() == without_histories(report)
+
+    # A deletion compacted away
+    del runs["a"]
+    diff_report = {"updated": {"MNIST": {"new": [], "updated": [], "deleted": ["a"]}}}
+    parquet_sync.push(report, command="update", diff_report=diff_report)
+    parquet_sync.compact("MNIST")
+    assert parquet_sync.read_experiment("MNIST").column("_id").to_pylist() == ["b", "c"]
+    assert ParquetSync(str(tmp_path), {}).pull() == without_histories(report)
@@ -0,0 +1,51 @@
+import datetime
+import os
+
+import pytest
+
+from mlsync.utils import report_format as report_format_module
+from mlsync.utils.report_format import FORMAT_CACHE_SIZE, format_cache_dir, load_report_format
+
+FORMAT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../examples/mlflow-notion/format.yaml")
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """An empty on-disk cache, and empty in-memory caches."""
+    monkeypatch.setenv("MLSYNC_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(report_format_module, "FORMATS", {})
+    monkeypatch.setattr(report_format_module, "COMPILED", {})
+    return format_cache_dir()
+
+
+def test_cache_hit_is_the_loaded_format(tmp_path, cache_dir, monkeypatch):
+    """A report format read from the on-disk cache is the one loaded from YAML, e.g. with non-string keys."""
+    with open(FORMAT_PATH) as f:
+        content = f.read()
+    content = content.replace("            - SCHEDULED\n", "            - SCHEDULED\n        since: 2024-01-01\n", 1)
+    content += "\nmapping:\n    1: one\n    2.5: [two, 2]\n    ? !!python/tuple [3, 4]\n    : !!set {a: null}\n"
+    path = tmp_path / "format.yaml"
+    path.write_text(content)
+
+    loaded = load_report_format(str(path))
+    assert loaded["mapping"] == {1: "one", 2.5: ["two", 2], (3, 4): {"a"}}
+    assert loaded["elements"]["status"]["since"] == datetime.date(2024, 1, 1)
+
+    report_format_module.FORMATS.clear()
+    monkeypatch.setattr(report_format_module.yaml, "load", None)
+    cached = load_report_format(str(path))
+    assert cached is not loaded
+    assert cached == loaded
+    assert cached["elements"]["status"]["since"] == datetime.date(2024, 1, 1)
+    assert os.listdir(cache_dir) == [loaded["digest"] + ".json"]
+
+
+def test_cache_is_pruned(tmp_path, cache_dir):
+    """The on-disk cache keeps the most recently used report formats."""
+    with open(FORMAT_PATH) as f:
+        content = f.read()
+    for index in range(FORMAT_CACHE_SIZE + 5):
+        path = tmp_path / f"format-{index}.yaml"
+        path.write_text(f"{content}\n# {index}\n")
+        load_report_format(str(path))
+    assert len(os.listdir(cache_dir)) == FORMAT_CACHE_SIZE
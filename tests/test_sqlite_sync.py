@@ -0,0 +1,58 @@
+from array import array
+
+from mlsync.consumers.sqlite.sqlite_sync import SQLiteSync
+
+
+def cell(alias, val_type, value, data=None):
+    """A cell of the report of a metric."""
+    return {"alias": alias, "type": val_type, "tag": "metrics", "key": alias.lower(), "value": value, "data": data}
+
+
+def history(start):
+    """History of a metric in typed arrays."""
+    return {
+        "key": "accuracy",
+        "value": array("d", [start, start + 0.5]),
+        "timestamp": array("q", [1000, 2000]),
+        "step": array("q", [0, 1]),
+    }
+
+
+def test_pull_round_trip(tmp_path):
+    """The report pulled from the database is the report pushed to it, with the types of its values."""
+    report = {
+        "MNIST": {
+            "name": "MNIST",
+            "id": "1",
+            "runs": {
+                "a": {
+                    "Accuracy": cell("Accuracy", "float", 0.5, data=history(0.5)),
+                    "Converged": cell("Converged", "bool", True),
+                    "Epochs": cell("Epochs", "int", 10),
+                    "Flag": cell("Flag", str(type(1)), False),
+                },
+                "b": {
+                    "Accuracy": cell("Accuracy", "float", 0.25, data=history(0.25)),
+                    "Converged": cell("Converged", "bool", 1),
+                    "Epochs": cell("Epochs", "int", True),
+                    "Flag": cell("Flag", str(type(1)), 3),
+                },
+                "c": {
+                    "Accuracy": cell("Accuracy", "float", 0.75),
+                    "Converged": cell("Converged", "bool", False),
+                    "Epochs": cell("Epochs", "int", None),
+                },
+            },
+        }
+    }
+    SQLiteSync(str(tmp_path / "mlsync.db"), {}).push(report, command="new")
+
+    pulled = SQLiteSync(str(tmp_path / "mlsync.db"), {}).pull()
+    assert pulled == report
+    for run_id, run in report["MNIST"]["runs"].items():
+        for alias, run_cell in run.items():
+            pulled_cell = pulled["MNIST"]["runs"][run_id][alias]
+            assert type(pulled_cell["value"]) is type(run_cell["value"]), (run_id, alias)
+            if run_cell["data"] is not None:
+                for key in ("value", "timestamp", "step"):
+                    assert pulled_cell["data"][key].typecode == run_cell["data"][key].typecode
@@ -0,0 +1,80 @@
+import os
+
+from mlsync.engine.stream import diff_deleted, diff_experiment, experiment_fingerprints
+from mlsync.engine.sync import Sync
+from mlsync.producers.mlflow.mlflow_server import MLFlowServer
+from mlsync.utils.report_format import load_report_format
+
+FORMAT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../examples/mlflow-notion/format.yaml")
+
+
+def accuracies(report):
+    """Accuracy of the runs of a report: {experiment_name: {run_id: accuracy}}"""
+    return {
+        experiment_name: {run_id: run["Accuracy"]["value"] for run_id, run in experiment["runs"].items()}
+        for experiment_name, experiment in report.items()
+    }
+
+
+def test_diff_experiment():
+    """An experiment is diffed against the fingerprints of its synced runs only."""
+    runs = {"a": {"Accuracy": {"key": "accuracy", "type": "float", "value": 0.5}}, "b": {"Epochs": 10}}
+    experiment = {"name": "MNIST", "id": "1", "runs": runs}
+    diff_report, fingerprints = diff_experiment("MNIST", experiment, None)
+    assert diff_report == {"new": {"MNIST": "MNIST"}, "deleted": {}, "updated": {}}
+
+    assert diff_experiment("MNIST", experiment, fingerprints)[0] == {"new": {}, "deleted": {}, "updated": {}}
+
+    runs = {"a": {"Accuracy": {"key": "accuracy", "type": "float", "value": 0.6}}, "c": {"Epochs": 5}}
+    diff_report, new_fingerprints = diff_experiment("MNIST", {**experiment, "runs": runs}, fingerprints)
+    assert diff_report["updated"] == {"MNIST": {"new": ["c"], "deleted": ["b"], "updated": ["a"]}}
+    assert new_fingerprints == experiment_fingerprints({"runs": runs})
+
+    diff_report = diff_deleted({"MNIST": fingerprints, "CIFAR": {}}, {"CIFAR"})
+    assert diff_report == {"new": {}, "deleted": {"MNIST": {"deleted": ["a", "b"]}}, "updated": {}}
+
+
+def test_stream(tmp_path):
+    """Each experiment is pushed on its own, and only when it changed; experiments that are gone are deleted."""
+    with MLFlowServer(seed=0) as mlflow_server:
+        mlflow_server.generate(experiments=2, runs=3, running_fraction=0.0)
+        sync = Sync(
+            load_report_format(FORMAT_PATH),
+            "mlflow",
+            "sqlite",
+            mlflow_uri=mlflow_server.url + "/api",
+            mlflow_format_workers=0,
+            sqlite_path=str(tmp_path / "mlsync.db"),
+            streaming=True,
+        )
+        pushes = []
+        push = sync.consumer_sync.push
+
+        def record_push(report, command="new", diff_report=None):
+            pushes.append((command, sorted(report)))
+            return push(report, command=command, diff_report=diff_report)
+
+        sync.consumer_sync.push = record_push
+
+        sync.stream()
+        producer_report = sync.producer_sync.pull()
+        kept, dropped = sorted(producer_report)
+        assert pushes == [("create", [kept]), ("create", [dropped])]
+        assert accuracies(sync.consumer_sync.pull()) == accuracies(producer_report)
+
+        # Nothing changed
+        pushes.clear()
+        sync.stream()
+        assert pushes == []
+
+        # A run updated and a run deleted in an experiment, all the runs of the other one deleted
+        updated, deleted = sorted(producer_report[kept]["runs"])[:2]
+        mlflow_server.log_metric(updated, "accuracy", 2.0, step=1000)
+        mlflow_server.delete_run(deleted)
+        for run_id in producer_report[dropped]["runs"]:
+            mlflow_server.delete_run(run_id)
+        sync.stream()
+        assert pushes == [("update", [kept]), ("delete", [])]
+        assert set(sync.fingerprints) == {kept}
+        assert accuracies(sync.consumer_sync.pull()) == accuracies(sync.producer_sync.pull())
+        assert sync.fingerprints[kept].keys() == set(producer_report[kept]["runs"]) - {deleted}
@@ -0,0 +1,172 @@
+import struct
+
+from mlsync.producers.tensorboard.tensorboard_sync import TensorBoardSync
+from mlsync.producers.tensorboard.tfevents import masked_crc32c
+
+REPORT_FORMAT = {
+    "elements": {
+        "status": {"alias": "Status", "type": "string", "tag": "info"},
+        "accuracy": {"alias": "Accuracy", "type": "float", "tag": "metrics"},
+        "loss": {"alias": "Loss", "type": "float", "tag": "metrics"},
+        "lr": {"alias": "Learning Rate", "type": "float", "tag": "params"},
+        "mlflow.runName": {"alias": "Name", "type": "string", "tag": "tags"},
+    },
+    "policies": {
+        "unmatched_policy": {"info": "ignore", "metrics": "ignore", "params": "ignore", "tags": "ignore"},
+        "notfound_policy": {"info": "ignore", "metrics": "ignore", "params": "ignore", "tags": "ignore"},
+    },
+    "order": ["Name"],
+}
+
+
+# -- Event files, encoded by hand (protobuf and TFRecord framing) -- #
+
+
+def varint(value):
+    """Encode a varint."""
+    data = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return bytes(data)
+
+
+def field(number, value, fmt=None):
+    """Encode a field of a protobuf message: a varint (int), a fixed-size number (fmt) or bytes."""
+    if fmt is not None:
+        wire_type = 1 if struct.calcsize(fmt) == 8 else 5
+        return varint(number << 3 | wire_type) + struct.pack("<" + fmt, value)
+    if isinstance(value, int):
+        return varint(number << 3) + varint(value)
+    if isinstance(value, str):
+        value = value.encode()
+    return varint(number << 3 | 2) + varint(len(value)) + value
+
+
+def event(wall_time, step, *values):
+    """An Event with a Summary of values (see simple_value, tensor_value and hparams)."""
+    summary = b"".join(field(1, value) for value in values)
+    return field(1, wall_time, "d") + field(2, step) + field(5, summary)
+
+
+def plugin_metadata(plugin, content=b""):
+    """The SummaryMetadata of a plugin."""
+    return field(9, field(1, field(1, plugin) + field(2, content)))
+
+
+def simple_value(tag, value):
+    """A scalar of TensorFlow 1."""
+    return field(1, tag) + field(2, value, "f")
+
+
+def tensor_value(tag, value, first=True):
+    """A scalar of TensorFlow 2: a float tensor, with the plugin only in the first summary of the tag."""
+    tensor = field(1, 1) + field(4, struct.pack("<f", value))
+    return field(1, tag) + field(8, tensor) + (plugin_metadata("scalars") if first else b"")
+
+
+def hparams_start(start_time, **hparams):
+    """The start of a session of the hparams plugin, with numeric hparams."""
+    session = b"".join(field(1, field(1, name) + field(2, field(2, value, "d"))) for name, value in hparams.items())
+    session += field(5, start_time, "d")
+    return field(1, "_hparams_/session_start_info") + plugin_metadata("hparams", field(3, session))
+
+
+def hparams_end(end_time, status=1):
+    """The end of a session of the hparams plugin (status 1 is FINISHED)."""
+    session = field(1, status) + field(2, end_time, "d")
+    return field(1, "_hparams_/session_end_info") + plugin_metadata("hparams", field(4, session))
+
+
+def record(data):
+    """Frame an Event as a TFRecord."""
+    header = struct.pack("<Q", len(data))
+    return header + struct.pack("<I", masked_crc32c(header)) + data + struct.pack("<I", masked_crc32c(data))
+
+
+def write_events(path, *events, mode="ab"):
+    """Append (or write) events to an event file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, mode) as f:
+        f.write(b"".join(record(data) for data in events))
+
+
+def values(report, run_id):
+    """The values of a run of the report by alias, but its uid."""
+    experiment_name = run_id.split("/")[0]
+    return {alias: cell["value"] for alias, cell in report[experiment_name]["runs"][run_id].items() if alias != "uid"}
+
+
+# -- Tests -- #
+
+
+def test_event_files(tmp_path):
+    """Scalars (simple values and tensors) and hparams of the event files are read as metrics, params and info."""
+    write_events(
+        tmp_path / "mnist" / "lenet" / "events.out.tfevents.1",
+        field(1, 100.0, "d") + field(3, "brain.Event:2"),
+        event(100.0, 0, hparams_start(100.0, lr=0.1)),
+        event(101.0, 0, simple_value("accuracy", 0.25), tensor_value("loss", 2.0)),
+        event(102.0, 1, simple_value("accuracy", 0.5), tensor_value("loss", 1.0, first=False)),
+        event(103.0, 1, hparams_end(103.0)),
+    )
+    write_events(tmp_path / "mnist" / "resnet" / "events.out.tfevents.1", event(100.0, 0, simple_value("loss", 3.0)))
+
+    report = TensorBoardSync(str(tmp_path), REPORT_FORMAT).pull()
+    assert set(report["mnist"]["runs"]) == {"mnist/lenet", "mnist/resnet"}
+    assert values(report, "mnist/lenet") == {
+        "Name": "lenet",
+        "Status": "FINISHED",
+        "Accuracy": 0.5,
+        "Loss": 1.0,
+        "Learning Rate": 0.1,
+    }
+    # Without an end of session, a run is running until its event files are idle
+    assert values(report, "mnist/resnet") == {"Name": "resnet", "Status": "RUNNING", "Loss": 3.0}
+
+
+def test_incremental_pulls(tmp_path):
+    """Records appended to the event files are read at the next pull, a record still being written once complete."""
+    path = tmp_path / "mnist" / "lenet" / "events.out.tfevents.1"
+    write_events(path, event(100.0, 0, simple_value("accuracy", 0.25)))
+    write_events(tmp_path / "mnist" / "resnet" / "events.out.tfevents.1", event(100.0, 0, simple_value("loss", 3.0)))
+    tensorboard_sync = TensorBoardSync(str(tmp_path), {**REPORT_FORMAT, "history": {"enabled": True}})
+    report = tensorboard_sync.pull()
+    resnet = report["mnist"]["runs"]["mnist/resnet"]
+
+    # A complete record, and the first half of the next one
+    tail = record(event(102.0, 2, simple_value("accuracy", 0.75)))
+    write_events(path, event(101.0, 1, simple_value("accuracy", 0.5)))
+    with open(path, "ab") as f:
+        f.write(tail[: len(tail) // 2])
+    report = tensorboard_sync.pull()
+    assert values(report, "mnist/lenet")["Accuracy"] == 0.5
+    # Runs without new records are not formatted again
+    assert report["mnist"]["runs"]["mnist/resnet"] is resnet
+
+    with open(path, "ab") as f:
+        f.write(tail[len(tail) // 2 :])
+    report = tensorboard_sync.pull()
+    assert values(report, "mnist/lenet")["Accuracy"] == 0.75
+    history = report["mnist"]["runs"]["mnist/lenet"]["Accuracy"]["data"]
+    assert list(history["step"]) == [0, 1, 2]
+    assert list(history["value"]) == [0.25, 0.5, 0.75]
+
+
+def test_rewritten_event_files(tmp_path):
+    """A file that shrank was rewritten: its run is read again from scratch, and runs whose files are gone leave."""
+    path = tmp_path / "mnist" / "lenet" / "events.out.tfevents.1"
+    write_events(path, event(100.0, 0, simple_value("accuracy", 0.25)), event(101.0, 1, simple_value("loss", 1.0)))
+    write_events(tmp_path / "mnist" / "resnet" / "events.out.tfevents.1", event(100.0, 0, simple_value("loss", 3.0)))
+    tensorboard_sync = TensorBoardSync(str(tmp_path), REPORT_FORMAT)
+    assert values(tensorboard_sync.pull(), "mnist/lenet")["Loss"] == 1.0
+
+    write_events(path, event(200.0, 0, simple_value("accuracy", 0.5)), mode="wb")
+    (tmp_path / "mnist" / "resnet" / "events.out.tfevents.1").unlink()
+    report = tensorboard_sync.pull()
+    assert set(report["mnist"]["runs"]) == {"mnist/lenet"}
+    assert values(report, "mnist/lenet") == {"Name": "lenet", "Status": "RUNNING", "Accuracy": 0.5}